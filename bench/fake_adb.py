@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+# Scriptable stand-in for the adb executable, driven by a scenario JSON file.
+#
+#   FAKE_ADB_SCENARIO  path to the scenario (written by bench/run_bench.py)
+#   FAKE_ADB_STATE     directory for mutable state shared between invocations
+#
+# Each adb server address (-H/-P or ADB_SERVER_SOCKET) gets its own device list
+# and forward table, so several fake servers can run side by side.
+
+import fcntl
+import json
+import os
+import random
+import select
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+
+DEFAULT_SERVER = 'localhost:5037'
+
+
+def load_scenario():
+    with open(os.environ['FAKE_ADB_SCENARIO'], encoding='utf-8') as f:
+        return json.load(f)
+
+
+@contextmanager
+def state(server):
+    path = os.path.join(os.environ['FAKE_ADB_STATE'], server.replace(':', '_') + '.json')
+    with open(path, 'a+', encoding='utf-8') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        f.seek(0)
+        data = json.loads(f.read() or '{}')
+        data.setdefault('forwards', [])
+        data.setdefault('reverses', {})
+        data.setdefault('connected', [])
+        data.setdefault('pushed', {})
+        data.setdefault('transfers', {})
+        yield data
+        f.seek(0)
+        f.truncate()
+        f.write(json.dumps(data))
+
+
+def fail(message, code=1):
+    print(message, file=sys.stderr)
+    sys.exit(code)
+
+
+def simulate_latency(scenario, device):
+    latency = device.get('latency_ms', scenario.get('latency_ms', 0)) / 1000
+    if latency:
+        time.sleep(latency)
+
+
+def visible_devices(scenario, server, connected):
+    # Devices of this server that are plugged in right now, plus connected Wi-Fi transports
+    elapsed = time.time() - scenario['started']
+    result = []
+    for device in scenario['devices']:
+        if device.get('server', DEFAULT_SERVER) != server:
+            continue
+        if elapsed < device.get('appear_at', 0) or elapsed >= device.get('disappear_at', float('inf')):
+            continue
+        result.append((device['serial'], device))
+        wifi_serial = f"{device['wifi_ip']}:5555" if device.get('wifi_ip') else None
+        if wifi_serial in connected:
+            result.append((wifi_serial, device))
+    return result
+
+
+def find_device(scenario, server, serial, connected):
+    devices = visible_devices(scenario, server, connected)
+    if serial is None:
+        if len(devices) != 1:
+            fail('error: more than one device/emulator' if devices else 'error: no devices/emulators found')
+        return devices[0]
+    for device_serial, device in devices:
+        if device_serial == serial:
+            return device_serial, device
+    fail(f"error: device '{serial}' not found")
+
+
+def check_transport(device_serial, device):
+    if device.get('state', 'device') == 'unauthorized':
+        fail('error: device unauthorized.\nThis adb server\'s $ADB_VENDOR_KEYS is not set')
+    if ':' in device_serial and random.random() < device.get('wifi_drop_rate', 0):
+        fail("error: device offline")
+
+
+def shell_functions(device):
+    # Simulated Android commands, defined as functions of a real POSIX shell
+    width, height = device.get('display', [1832, 1920])
+    packages = {'alvr.client.stable': 1, 'com.android.settings': 32, **device.get('packages', {})}
+    package_list = ''.join(f'    echo "package:{name} versionCode:{code}";\n' for name, code in packages.items())
+    return f'''
+getprop() {{
+  case "$1" in
+    ro.product.model) echo "{device['model']}";;
+    ro.product.manufacturer) echo "{device.get('manufacturer', 'Oculus')}";;
+    ro.build.version.release) echo "{device.get('android', '12')}";;
+    ro.build.display.id) echo "{device.get('build', 'SQ3A.220605.009.A1')}";;
+    ro.serialno) echo "{device['serial']}";;
+    *) echo "";;
+  esac
+}}
+dumpsys() {{
+  case "$1" in
+    battery) printf 'Current Battery Service state:\\n  AC powered: false\\n  status: 3\\n  level: {device.get('battery', 80)}\\n  temperature: 310\\n';;
+    package) echo "    versionCode=1 minSdk=29 targetSdk=32"; echo "    versionName={device.get('alvr_version', '20.11.1')}";;
+    wifi) echo 'mWifiInfo SSID: "venue", BSSID: 00:11:22:33:44:55, RSSI: {device.get('rssi', -55)}, Link speed: {device.get('link_speed', 866)}Mbps, Frequency: 5180MHz, Net ID: 0';;
+    *) echo "";;
+  esac
+}}
+wm() {{
+  case "$1" in
+    size) echo "Physical size: {width}x{height}";;
+    density) echo "Physical density: 480";;
+  esac
+}}
+pidof() {{ echo 4242; }}
+rm() {{ :; }}
+pm() {{
+  if [ "$1" = list ]; then
+{package_list}  elif [ "$1" = install ]; then
+    echo "Success";
+  fi
+}}
+ip() {{ printf '3: wlan0: <BROADCAST,UP>\\n    inet {device.get('wifi_ip', '192.168.1.50')}/24 brd 192.168.1.255 scope global wlan0\\n'; }}
+'''
+
+
+def run_shell(scenario, device_serial, device, command):
+    functions = shell_functions(device)
+    if command:
+        simulate_latency(scenario, device)
+        result = subprocess.run(['sh', '-c', functions + '\n' + ' '.join(command)])
+        sys.exit(result.returncode)
+
+    # Interactive session: one latency per request written by the client
+    shell = subprocess.Popen(['sh'], stdin=subprocess.PIPE)
+    shell.stdin.write(functions.encode())
+    shell.stdin.flush()
+    stdin = sys.stdin.fileno()
+    while True:
+        ready, _, _ = select.select([stdin], [], [], 0.5)
+        if not ready:
+            if shell.poll() is not None:
+                break
+            continue
+        chunk = os.read(stdin, 65536)
+        if not chunk:
+            break
+        simulate_latency(scenario, device)
+        shell.stdin.write(chunk)
+        shell.stdin.flush()
+    shell.stdin.close()
+    sys.exit(shell.wait())
+
+
+def transfer_seconds(scenario, device, size):
+    bandwidth = device.get('bandwidth_mbps', scenario.get('bandwidth_mbps', 300))
+    return size * 8 / (bandwidth * 1_000_000)
+
+
+def transfer(scenario, server, device_serial, device, size):
+    # With hub_bandwidth_mbps set, USB transfers behind one hub split its upstream link between them, and
+    # every extra concurrent transfer wastes hub_contention of it (retries, split transactions)
+    hub_bandwidth = scenario.get('hub_bandwidth_mbps')
+    if not hub_bandwidth or not device.get('usb') or ':' in device_serial:
+        time.sleep(transfer_seconds(scenario, device, size))
+        return
+    hub = device['usb'].rsplit('.', 1)[0]
+    bandwidth = device.get('bandwidth_mbps', scenario.get('bandwidth_mbps', 300))
+    with state(server) as data:
+        data['transfers'][hub] = data['transfers'].get(hub, 0) + 1
+    remaining = size * 8
+    try:
+        while remaining > 0:
+            with state(server) as data:
+                active = data['transfers'][hub]
+            usable = hub_bandwidth * max(0.2, 1 - scenario.get('hub_contention', 0) * (active - 1))
+            rate = min(bandwidth, usable / active) * 1_000_000
+            step = min(0.05, remaining / rate)
+            time.sleep(step)
+            remaining -= rate * step
+    finally:
+        with state(server) as data:
+            data['transfers'][hub] -= 1
+
+
+def main():
+    args = sys.argv[1:]
+    serial = None
+    host, port = None, None
+    server = os.environ.get('ADB_SERVER_SOCKET', 'tcp:' + DEFAULT_SERVER).split(':', 1)[1]
+    while args and args[0] in ('-s', '-H', '-P'):
+        option, value = args[0], args[1]
+        args = args[2:]
+        if option == '-s':
+            serial = value
+        elif option == '-H':
+            host = value
+        else:
+            port = value
+    if host or port:
+        server = f"{host or 'localhost'}:{port or 5037}"
+    if not args:
+        fail('adb: no command')
+
+    scenario = load_scenario()
+    if server not in scenario.get('servers', [DEFAULT_SERVER]):
+        fail(f'* cannot connect to daemon at tcp:{server}')
+    command, rest = args[0], args[1:]
+    time.sleep(scenario.get('server_latency_ms', 0) / 1000)
+
+    if command == 'devices':
+        with state(server) as data:
+            connected = data['connected']
+        print('List of devices attached')
+        for device_serial, device in visible_devices(scenario, server, connected):
+            status = device.get('state', 'device')
+            if '-l' in rest:
+                usb = f" usb:{device['usb']}" if device.get('usb') and ':' not in device_serial else ''
+                print(f"{device_serial}\t{status}{usb} product:{device['model'].replace(' ', '_')} "
+                      f"model:{device['model'].replace(' ', '_')} device:{device['model'].replace(' ', '_')}")
+            else:
+                print(f'{device_serial}\t{status}')
+        print()
+        return
+
+    if command == 'connect':
+        target = rest[0]
+        ip_address = target.split(':')[0]
+        with state(server) as data:
+            for device in scenario['devices']:
+                if device.get('wifi_ip') == ip_address and device.get('server', DEFAULT_SERVER) == server:
+                    if target not in data['connected']:
+                        data['connected'].append(target)
+                    print(f'connected to {target}')
+                    return
+        print(f'failed to connect to {target}')
+        sys.exit(1)
+
+    if command == 'disconnect':
+        with state(server) as data:
+            targets = rest or ([serial] if serial else list(data['connected']))
+            data['connected'] = [target for target in data['connected'] if target not in targets]
+        print('disconnected everything' if not rest else f'disconnected {rest[0]}')
+        return
+
+    if command == 'tcpip':
+        print(f'restarting in TCP mode port: {rest[0]}')
+        return
+
+    if command == 'mdns':
+        print('List of discovered mdns services')
+        return
+
+    if command == 'forward' and rest[:1] == ['--list']:
+        with state(server) as data:
+            for device_serial, local, remote in data['forwards']:
+                print(f'{device_serial} {local} {remote}')
+        return
+
+    with state(server) as data:
+        connected = data['connected']
+    device_serial, device = find_device(scenario, server, serial, connected)
+    check_transport(device_serial, device)
+
+    if command == 'shell':
+        run_shell(scenario, device_serial, device, rest)
+
+    elif command == 'forward':
+        with state(server) as data:
+            if rest[0] == '--remove':
+                data['forwards'] = [entry for entry in data['forwards'] if entry[1] != rest[1]]
+            else:
+                data['forwards'] = [entry for entry in data['forwards'] if entry[1] != rest[0]]
+                data['forwards'].append([device_serial, rest[0], rest[1]])
+
+    elif command == 'reverse':
+        with state(server) as data:
+            reverses = data['reverses'].setdefault(device_serial, {})
+            if rest[0] == '--list':
+                for remote, local in reverses.items():
+                    print(f'UsbFfs {remote} {local}')
+            elif rest[0] == '--remove':
+                reverses.pop(rest[1], None)
+            else:
+                reverses[rest[0]] = rest[1]
+
+    elif command in ('install', 'install-multi-package'):
+        if command == 'install-multi-package' and int(device.get('android', '12').split('.')[0]) < 10:
+            fail('adb: failed to create session\nFailure [INSTALL_FAILED_INTERNAL_ERROR: multi-package not supported]')
+        apks = [arg for arg in rest if not arg.startswith('-')]
+        size = sum(os.path.getsize(apk) for apk in apks if os.path.exists(apk))
+        simulate_latency(scenario, device)
+        transfer(scenario, server, device_serial, device, size)
+        time.sleep(device.get('install_seconds', scenario.get('install_seconds', 0)))
+        print('Performing Streamed Install')
+        print('Success')
+
+    elif command == 'push':
+        local, remote = rest[0], rest[1]
+        size = os.path.getsize(local)
+        transfer(scenario, server, device_serial, device, size)
+        with state(server) as data:
+            data['pushed'][f'{device_serial}:{remote}'] = size
+        print(f'{local}: 1 file pushed, 0 skipped.')
+
+    elif command == 'pull':
+        remote, local = rest[0], rest[1]
+        with state(server) as data:
+            size = data['pushed'].get(f'{device_serial}:{remote}', 0)
+        time.sleep(transfer_seconds(scenario, device, size))
+        with open(local, 'wb') as f:
+            f.write(b'\0' * size)
+        print(f'{remote}: 1 file pulled, 0 skipped.')
+
+    elif command == 'logcat':
+        for index in range(3):
+            print(f'10-19 12:00:0{index}.000  4242  4250 I ALVR    : frame {index}')
+        sys.stdout.flush()
+        time.sleep(1)
+
+    else:
+        fail(f'adb: unknown command {command}')
+
+
+if __name__ == '__main__':
+    main()
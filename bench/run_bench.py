@@ -0,0 +1,384 @@
+#!/usr/bin/env python3
+# End-to-end benchmarks of the adb hot paths against bench/fake_adb.py.
+#
+#   python bench/run_bench.py --devices 8 --latency-ms 20 --output bench_results.json
+#
+# Results are written as JSON so runs can be compared over time.
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from importlib.util import find_spec
+
+import yaml
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+
+from utils.adb import get_device_info, list_devices  # noqa: E402
+from utils.adb_command import INTERACTIVE_RESERVE, rate_limiter, run_adb  # noqa: E402
+from utils.adb_shell import close_all_shells, close_shell  # noqa: E402
+from utils.device_monitor import DeviceMonitor  # noqa: E402
+from utils.jobs import JobScheduler  # noqa: E402
+from utils.metrics import metrics  # noqa: E402
+from utils.usb_topology import TransferThrottle, UsbTopology  # noqa: E402
+
+# Headsets the fake simulates, cycled through in this order
+SIMULATED_MODELS = ['Quest 2', 'Quest 3', 'Pico 4', 'yvr2', 'Quest Pro', 'Pico 4 Ultra', 'Quest 3s', 'yvr1']
+MANUFACTURERS = {'Quest': 'Oculus', 'Pico': 'Pico', 'yvr': 'YVR'}
+# Physical panel size of both eyes together
+DISPLAYS = {
+    'Quest 2': [3664, 1920],
+    'Quest 3': [4128, 2208],
+    'Quest 3s': [3664, 1920],
+    'Quest Pro': [3600, 1920],
+    'Pico 4': [4320, 2160],
+    'Pico 4 Ultra': [4320, 2160],
+    'yvr1': [3200, 1600],
+    'yvr2': [3200, 1600],
+}
+FIRST_SERVER_PORT = 5037
+# Effectively no cap on adb commands per second
+UNCAPPED_RATE = 1e9
+
+
+def server_addresses(args):
+    return [f'localhost:{FIRST_SERVER_PORT + index}' for index in range(args.servers)]
+
+
+def build_scenario(args):
+    with open(os.path.join(REPO_DIR, 'devices.yaml'), 'r') as f:
+        known_models = {device['model'] for device in yaml.safe_load(f)['devices']}
+    models = [model for model in SIMULATED_MODELS if model in known_models]
+    servers = server_addresses(args)
+
+    devices = []
+    for index in range(args.devices):
+        model = models[index % len(models)]
+        manufacturer = next(name for prefix, name in MANUFACTURERS.items() if model.startswith(prefix))
+        device = {
+            'serial': f'{manufacturer[:3].upper()}{index:05d}',
+            'model': model,
+            'manufacturer': manufacturer,
+            'display': DISPLAYS[model],
+            'battery': 90 - index % 60,
+            'usb': f'1-{1 + index // args.devices_per_hub}.{1 + index % args.devices_per_hub}',
+            'state': 'unauthorized' if index < args.unauthorized else 'device',
+            'server': servers[index % len(servers)],
+        }
+        if index < args.wifi:
+            device['wifi_ip'] = f'192.168.50.{10 + index}'
+            device['wifi_drop_rate'] = args.wifi_drop_rate
+        if args.hotplug:
+            # Headsets are plugged in one after another and the first one is unplugged again
+            device['appear_at'] = index * args.hotplug
+            if index == 0:
+                device['disappear_at'] = args.devices * args.hotplug
+        devices.append(device)
+
+    return {
+        'started': time.time(),
+        'latency_ms': args.latency_ms,
+        'server_latency_ms': args.server_latency_ms,
+        'install_seconds': args.install_seconds,
+        'bandwidth_mbps': args.bandwidth_mbps,
+        'hub_bandwidth_mbps': args.hub_bandwidth_mbps,
+        'hub_contention': args.hub_contention,
+        'servers': servers,
+        'devices': devices,
+    }
+
+
+def install_fake_adb(work_dir, scenario):
+    bin_dir = os.path.join(work_dir, 'bin')
+    state_dir = os.path.join(work_dir, 'state')
+    os.makedirs(bin_dir)
+    os.makedirs(state_dir)
+    scenario_file = os.path.join(work_dir, 'scenario.json')
+    with open(scenario_file, 'w') as f:
+        json.dump(scenario, f, indent=2)
+
+    adb = os.path.join(bin_dir, 'adb')
+    with open(adb, 'w') as f:
+        f.write(f'#!/bin/sh\nexec "{sys.executable}" "{os.path.join(BENCH_DIR, "fake_adb.py")}" "$@"\n')
+    os.chmod(adb, 0o755)
+
+    os.environ['PATH'] = bin_dir + os.pathsep + os.environ['PATH']
+    os.environ['FAKE_ADB_SCENARIO'] = scenario_file
+    os.environ['FAKE_ADB_STATE'] = state_dir
+
+
+def summarize(durations):
+    if not durations:
+        return None
+    ordered = sorted(durations)
+    return {
+        'count': len(ordered),
+        'mean_ms': round(statistics.fmean(ordered) * 1000, 2),
+        'p50_ms': round(ordered[len(ordered) // 2] * 1000, 2),
+        'p95_ms': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 2),
+        'max_ms': round(ordered[-1] * 1000, 2),
+    }
+
+
+def connect_wifi_devices(scenario):
+    for device in scenario['devices']:
+        if device.get('wifi_ip') and device['state'] == 'device':
+            run_adb(['connect', f"{device['wifi_ip']}:5555"], server=device['server'], capture_output=True)
+
+
+def bench_tick(args):
+    # The adb work of MainWindow.check_adb_devices: list the devices and query every new authorized one
+    known = set()
+    cold, steady = [], []
+    failures = 0
+    for _ in range(args.ticks):
+        start = time.perf_counter()
+        devices = list_devices()
+        serials = {serial for serial, _state in devices}
+        new_devices = [(serial, state) for serial, state in devices if serial not in known]
+        for serial, state in new_devices:
+            if state != 'unauthorized' and get_device_info(serial) is None:
+                failures += 1
+        for serial in known - serials:
+            close_shell(serial)
+        known = serials
+        (cold if new_devices else steady).append(time.perf_counter() - start)
+        if args.hotplug:
+            time.sleep(args.hotplug / 2)
+    return {'ticks_with_new_devices': summarize(cold), 'steady_ticks': summarize(steady),
+            'device_info_failures': failures, 'devices_seen_last': len(known)}
+
+
+def bench_device_info(args):
+    serials = [serial for serial, state in list_devices() if state == 'device']
+    if not serials:
+        return {'skipped': 'no authorized devices'}
+    for serial in serials:
+        get_device_info(serial)  # Warm the persistent shells
+
+    def query(serial):
+        durations = []
+        for _ in range(args.rounds):
+            start = time.perf_counter()
+            get_device_info(serial)
+            durations.append(time.perf_counter() - start)
+        return durations
+
+    start = time.perf_counter()
+    sequential = [duration for serial in serials for duration in query(serial)]
+    sequential_wall = time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(serials)) as pool:
+        parallel = [duration for durations in pool.map(query, serials) for duration in durations]
+    parallel_wall = time.perf_counter() - start
+
+    return {
+        'devices': len(serials),
+        'sequential': {'queries_per_second': round(len(sequential) / sequential_wall, 2), **summarize(sequential)},
+        'parallel': {'queries_per_second': round(len(parallel) / parallel_wall, 2), **summarize(parallel)},
+    }
+
+
+def bench_startup(args, work_dir):
+    if find_spec('gi') is None:
+        return {'skipped': 'PyGObject is not installed'}
+    env = dict(os.environ, ALVR_COMPANION_BENCH_STARTUP='1', HOME=os.path.join(work_dir, 'home'))
+    os.makedirs(env['HOME'], exist_ok=True)
+    durations = []
+    for _ in range(args.startup_runs):
+        started = time.monotonic()
+        try:
+            result = subprocess.run([sys.executable, os.path.join(REPO_DIR, 'main.py')], env=env, cwd=REPO_DIR,
+                                    capture_output=True, text=True, timeout=60)
+        except subprocess.TimeoutExpired:
+            return {'error': 'no frame within 60 s'}
+        frame = [line.split()[1] for line in result.stdout.splitlines() if line.startswith('first-frame ')]
+        if not frame:
+            return {'error': (result.stderr.strip().splitlines() or ['no frame painted'])[-1]}
+        durations.append(float(frame[0]) - started)
+    return summarize(durations)
+
+
+def install_targets(args, work_dir):
+    serials = [serial for serial, state in list_devices() if state == 'device' and ':' not in serial]
+    apk_file = os.path.join(work_dir, 'alvr_client_android.apk')
+    with open(apk_file, 'wb') as f:
+        f.truncate(args.apk_mb * 1024 * 1024)
+    return serials, apk_file
+
+
+def install_results(args, serials, wall, per_device):
+    return {
+        'devices': len(serials),
+        'apk_mb': args.apk_mb,
+        'wall_seconds': round(wall, 3),
+        'failures': sum(1 for _duration, ok in per_device.values() if not ok),
+        'per_device': summarize([duration for duration, _ok in per_device.values()]),
+    }
+
+
+def bench_install(args, work_dir):
+    # Every headset at once, as the GUI did before installs were scheduled
+    serials, apk_file = install_targets(args, work_dir)
+    if not serials:
+        return {'skipped': 'no authorized USB devices'}
+    per_device = {}
+    lock = threading.Lock()
+
+    def install(serial):
+        start = time.perf_counter()
+        result = run_adb(['install', '-r', apk_file], serial, capture_output=True, text=True)
+        with lock:
+            per_device[serial] = (time.perf_counter() - start, result.returncode == 0)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=install, args=(serial,)) for serial in serials]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return install_results(args, serials, time.perf_counter() - start, per_device)
+
+
+def bench_install_scheduled(args, work_dir):
+    # The same installs grouped by USB hub and throttled per hub, as CompanionCore runs them
+    serials, apk_file = install_targets(args, work_dir)
+    if not serials:
+        return {'skipped': 'no authorized USB devices'}
+    topology = UsbTopology()
+    topology.refresh()
+    throttle = TransferThrottle()
+    jobs = JobScheduler(max_workers=len(serials), group_limit=throttle.limit)
+    per_device = {}
+    size = os.path.getsize(apk_file)
+
+    def install(serial):
+        start = time.perf_counter()
+        with throttle.measure(topology.group(serial), size):
+            result = run_adb(['install', '-r', apk_file], serial, capture_output=True, text=True)
+        per_device[serial] = (time.perf_counter() - start, result.returncode == 0)
+
+    start = time.perf_counter()
+    submitted = [jobs.submit(('install', serial), install, serial, device=serial, group=topology.group(serial))
+                 for serial in serials]
+    for job in submitted:
+        job.wait()
+    results = install_results(args, serials, time.perf_counter() - start, per_device)
+    results['hub_limits'] = throttle.snapshot()
+    return results
+
+
+def bench_fleet(args):
+    # One device poll across every simulated adb server, asked one after another and all at once
+    monitor = DeviceMonitor(servers=server_addresses(args))
+    pool, monitor.pool = monitor.pool, None
+    sequential = []
+    for _ in range(args.ticks):
+        start = time.perf_counter()
+        monitor.list_all()
+        sequential.append(time.perf_counter() - start)
+    monitor.pool = pool
+    concurrent = []
+    for _ in range(args.ticks):
+        start = time.perf_counter()
+        monitor.list_all()
+        concurrent.append(time.perf_counter() - start)
+    # Device queries have to reach the server each headset was listed on
+    monitor.poll_devices()
+    if pool:
+        pool.shutdown()
+    return {
+        'servers': args.servers,
+        'sequential': summarize(sequential),
+        'concurrent': summarize(concurrent),
+        'devices_seen': len(monitor.devices_info),
+        'devices_per_server': {server: sum(1 for info in monitor.devices_info.values()
+                                           if info.get('ADB Server') == server) for server in monitor.servers},
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the companion against a simulated set of headsets.')
+    parser.add_argument('--devices', type=int, default=4, help='number of simulated headsets')
+    parser.add_argument('--unauthorized', type=int, default=0, help='how many of them have not accepted the host key')
+    parser.add_argument('--wifi', type=int, default=0, help='how many of them are also connected over Wi-Fi')
+    parser.add_argument('--wifi-drop-rate', type=float, default=0.0, help='share of Wi-Fi commands that fail')
+    parser.add_argument('--hotplug', type=float, default=0.0, help='seconds between headsets being plugged in')
+    parser.add_argument('--latency-ms', type=float, default=15, help='device round trip per command')
+    parser.add_argument('--server-latency-ms', type=float, default=2, help='adb server overhead per invocation')
+    parser.add_argument('--install-seconds', type=float, default=2, help='on-device install time')
+    parser.add_argument('--bandwidth-mbps', type=float, default=300, help='USB throughput per device')
+    parser.add_argument('--hub-bandwidth-mbps', type=float, default=0,
+                        help='upstream throughput shared by the headsets on one hub (0: unlimited)')
+    parser.add_argument('--hub-contention', type=float, default=0.1,
+                        help='share of the hub bandwidth lost per extra concurrent transfer')
+    parser.add_argument('--devices-per-hub', type=int, default=4, help='headsets plugged into each simulated hub')
+    parser.add_argument('--servers', type=int, default=1,
+                        help='simulated adb servers (PCs) the headsets are spread over, on ports 5037, 5038, ...')
+    parser.add_argument('--apk-mb', type=int, default=60, help='size of the installed APK')
+    parser.add_argument('--ticks', type=int, default=20, help='device list polls to time')
+    parser.add_argument('--rounds', type=int, default=10, help='device info queries per headset')
+    parser.add_argument('--startup-runs', type=int, default=3, help='app launches to time')
+    parser.add_argument('--only', action='append',
+                        choices=['tick', 'device_info', 'startup', 'install', 'install_scheduled', 'fleet'],
+                        help='run only these benchmarks')
+    parser.add_argument('--adb-rate', type=float, default=0,
+                        help="app-wide adb commands per second, as the companion caps them (0: uncapped, to time the code paths)")
+    parser.add_argument('--output', default=os.path.join(REPO_DIR, 'bench_results.json'))
+    args = parser.parse_args()
+    rate_limiter.set_rate(args.adb_rate or UNCAPPED_RATE, reserve=INTERACTIVE_RESERVE if args.adb_rate else 0)
+
+    selected = args.only or ['tick', 'device_info', 'startup', 'install', 'install_scheduled', 'fleet']
+    results = {
+        'revision': git_revision(),
+        'timestamp': time.time(),
+        'python': platform.python_version(),
+        'options': vars(args),
+        'benchmarks': {},
+    }
+    with tempfile.TemporaryDirectory(prefix='alvr-companion-bench-') as work_dir:
+        scenario = build_scenario(args)
+        install_fake_adb(work_dir, scenario)
+        connect_wifi_devices(scenario)
+        runners = {
+            'tick': lambda: bench_tick(args),
+            'device_info': lambda: bench_device_info(args),
+            'startup': lambda: bench_startup(args, work_dir),
+            'install': lambda: bench_install(args, work_dir),
+            'install_scheduled': lambda: bench_install_scheduled(args, work_dir),
+            'fleet': lambda: bench_fleet(args),
+        }
+        try:
+            for name in selected:
+                print(f'Running {name}...', flush=True)
+                results['benchmarks'][name] = runners[name]()
+        finally:
+            close_all_shells()
+        results['adb_commands'] = metrics.snapshot()
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(json.dumps(results['benchmarks'], indent=2))
+    print(f'Results written to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# Headless companion for always-on machines: auto-update, auto USB forwarding and Wi-Fi reconnect.
+# Started with `main.py --daemon` or directly; it must never import gi or any other UI toolkit.
+
+import argparse
+import json
+import signal
+import sys
+import threading
+import time
+
+from utils.adb_command import run_adb
+from utils.auto_hooks import wants_auto_sideload, wants_auto_update, wants_auto_usb_forward
+from utils.companion_core import DEVICE_EVENTS, CompanionCore
+from utils.jobs import FAILED, PRIORITY_LOW
+from utils.rpc_server import SOCKET_PATH, RpcError
+
+DEVICE_INTERVAL = 2
+INFO_INTERVAL = 30
+WIFI_RECONNECT_INTERVAL = 30
+
+
+def log_event(event, **fields):
+    # One JSON object per line so journald, Loki and friends can index the fields
+    record = {'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'), 'event': event}
+    record.update({key: value for key, value in fields.items() if value is not None})
+    print(json.dumps(record), flush=True)
+
+
+class CompanionDaemon:
+    def __init__(self, device_interval=DEVICE_INTERVAL, info_interval=INFO_INTERVAL, socket_path=SOCKET_PATH,
+                 servers=None, peer_cache=None):
+        self.core = CompanionCore(device_interval=device_interval, info_interval=info_interval, servers=servers,
+                                  peer_cache=peer_cache)
+        self.core.add_listener(self.on_core_event)
+        self.config = self.core.config
+        self.socket_path = socket_path
+        self.stop_event = threading.Event()
+
+    def run(self):
+        log_event('daemon_started', alvr_version=self.core.version, adb_servers=[server for server in self.core.servers if server] or None)
+
+        # Same as the GUI: put the attached headset into TCP mode so Wi-Fi connections work
+        run_adb(['tcpip', '5555'], capture_output=True)
+        self.core.start()
+        if self.socket_path:
+            try:
+                self.core.serve_api(self.socket_path)
+                log_event('api_listening', socket=self.socket_path)
+            except (OSError, RpcError) as e:
+                log_event('api_failed', socket=self.socket_path, error=str(e))
+        self.reconnect_wifi()
+        while not self.stop_event.wait(WIFI_RECONNECT_INTERVAL):
+            self.reconnect_wifi()
+
+        self.core.stop()
+        log_event('daemon_stopped')
+
+    def on_core_event(self, event, serial, data):
+        if event in DEVICE_EVENTS:
+            self.on_device_event(event, serial, data)
+        elif event == 'download_started':
+            log_event(event, url=data['url'])
+        elif event == 'downloaded':
+            log_event('download_finished', file=self.core.apk_file, source=data['source'])
+        elif event == 'download_failed':
+            log_event(event, error=data['error'])
+        elif event == 'install_started':
+            log_event(event, serial=serial, version=self.core.version)
+        elif event == 'install_finished':
+            if data['success']:
+                log_event('install_finished', serial=serial)
+            else:
+                log_event('install_cancelled' if data['cancelled'] else 'install_failed', serial=serial,
+                          error=data['error'] or None)
+        elif event == 'sideload_finished':
+            if data['success']:
+                log_event(event, serial=serial, installed=data['installed'], skipped=data['skipped'])
+            else:
+                log_event('sideload_cancelled' if data['cancelled'] else 'sideload_failed', serial=serial,
+                          error=data['error'] or None)
+        elif event == 'forwarding' and serial:
+            log_event('usb_forward_enabled' if data['enabled'] else 'usb_forward_disabled', serial=serial,
+                      ports=data['ports'], adb_server=data.get('server'))
+        elif event == 'wifi_connected':
+            log_event(event, serial=serial, ip=data['ip'])
+
+    def on_device_event(self, event, serial, device_info):
+        log_event(f'device_{event}', serial=serial, model=device_info.get('Model'),
+                  alvr_version=device_info.get('ALVR Version'), battery=device_info.get('Battery Level'),
+                  adb_server=device_info.get('ADB Server'))
+        if event in ('added', 'authorized') and device_info['Authorized']:
+            self.auto_update_device(serial, device_info)
+            self.auto_usb_forward_device(serial)
+            if self.config.get(serial, 'wifi_enabled'):
+                self.reconnect_wifi()
+
+    def auto_update_device(self, serial, device_info):
+        if wants_auto_update(self.config, serial, device_info, self.core.version):
+            self.core.install_job(serial, PRIORITY_LOW)
+        if wants_auto_sideload(self.config, serial, self.core.extra_apks(serial)):
+            self.core.sideload_job(serial, PRIORITY_LOW)
+
+    def auto_usb_forward_device(self, serial):
+        if wants_auto_usb_forward(self.config, serial):
+            self.core.forward_job(serial, True).add_done_callback(self.on_auto_usb_forward_done)
+
+    def on_auto_usb_forward_done(self, job):
+        if job.state == FAILED:
+            log_event('usb_forward_failed', serial=job.args[0], error=str(job.error))
+
+    def reconnect_wifi(self):
+        self.core.reconnect_wifi(lambda serial, ip_address, e: log_event(
+            'wifi_connect_failed', serial=serial, ip=ip_address, error=str(e)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run ALVR Companion without a window.')
+    parser.add_argument('--daemon', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--device-interval', type=float, default=DEVICE_INTERVAL,
+                        help='seconds between adb device list polls')
+    parser.add_argument('--info-interval', type=float, default=INFO_INTERVAL,
+                        help='seconds between device info refreshes')
+    parser.add_argument('--socket', default=SOCKET_PATH, help='Unix socket for the JSON-RPC API')
+    parser.add_argument('--no-api', action='store_true', help='do not serve the JSON-RPC API')
+    parser.add_argument('--adb-server', action='append', dest='servers', metavar='HOST:PORT',
+                        help='adb server to manage, repeat for several PCs (default: adb_servers from config.yaml)')
+    parser.add_argument('--peer-cache', action='store_true', default=None,
+                        help='share downloaded APKs with other companions on the LAN and fetch from them first')
+    args = parser.parse_args(argv)
+    daemon = CompanionDaemon(args.device_interval, args.info_interval, None if args.no_api else args.socket,
+                             args.servers, args.peer_cache)
+    signal.signal(signal.SIGTERM, lambda signum, frame: daemon.stop_event.set())
+    signal.signal(signal.SIGINT, lambda signum, frame: daemon.stop_event.set())
+    daemon.run()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
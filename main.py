@@ -3,15 +3,37 @@
 import os
 import subprocess
 import sys
-import threading
+import time
+
+if __name__ == '__main__' and '--daemon' in sys.argv[1:]:
+    # Headless mode must not load any UI toolkit
+    from daemon import main as daemon_main
+    sys.exit(daemon_main(sys.argv[1:]))
 
 import gi
-import requests
 import yaml
 
-from utils.adb import get_device_info
-from utils.get_alvr_version import get_alvr_version
-from views.list_device import create_list_device, is_ip_value
+from utils.adb import get_wifi_ip, is_ip_value
+from utils.alvr_stats import AlvrStatsClient
+from utils.apk import is_downloaded
+from utils.auto_hooks import wants_auto_sideload, wants_auto_update, wants_auto_usb_forward
+from utils.adb_command import run_adb, server_for
+from utils.companion_core import CompanionCore
+from utils.jobs import CANCELLED, DONE, FAILED, PRIORITY_HIGH, PRIORITY_LOW
+from utils.metrics import metrics
+from utils.encoder_tuning import apply_encoder_settings, has_backup, recommend_encoder_settings, revert_encoder_settings
+from utils.logcat import LogcatMonitor
+from utils.link_benchmark import add_to_history, benchmark_device, recommend_transport
+from utils.display import derive_crop, derive_max_size
+from utils.telemetry import TelemetryHistory
+from utils.watchdog import watch_glib, watchdog_from_env
+from utils.wifi_monitor import WifiMonitor
+from utils.poll_budget import PollState
+from utils.user_config import CONFIG_DIR, UserConfig
+from views.image_cache import PAGE_ICON_SIZE, create_device_image
+from views.debug_panel import create_debug_window
+from views.sparkline import Sparkline
+from views.list_device import DeviceItem, create_list_device
 import gettext
 
 gi.require_version('Gtk', '4.0')
@@ -23,11 +45,7 @@ from typing import TypedDict
 
 APK_PACKAGE_NAME = 'alvr.client.stable'
 APP_VERSION = "0.1.1"
-ALVR_LATEST = "20.11.1"
 
-CONFIG_DIR = os.path.join(os.path.expanduser("~"), ".config", "ALVR-Companion")
-CONFIG_FILE = os.path.join(CONFIG_DIR, "config.yaml")
-DEVICES_FILE = os.path.join("devices.yaml")
 
 locale_dir = os.path.join(os.path.dirname(__file__), 'locale')
 if os.path.exists(locale_dir):
@@ -51,27 +69,37 @@ class DeviceInfo(TypedDict):
 DeviceConfig = Dict[str, DeviceInfo]
 
 class ALVRInstaller(Adw.Application):
-    def __init__(self):
+    def __init__(self, watchdog=None):
         super().__init__(application_id='ru.toxblh.AlvrCompanion')
+        self.watchdog = watchdog
         self.connect('activate', self.on_activate)
         self.connect('shutdown', self.on_shutdown)
 
     def on_activate(self, app):
         self.win = MainWindow(application=app)
         self.win.present()
+        if os.environ.get('ALVR_COMPANION_BENCH_STARTUP'):
+            # bench/run_bench.py measures the time until the window has painted once
+            self.win.get_frame_clock().connect('after-paint', self.on_first_frame)
+
+    def on_first_frame(self, frame_clock):
+        print(f'first-frame {time.monotonic():.6f}', flush=True)
+        self.quit()
         
     def on_shutdown(self, app):
         # Perform any cleanup tasks here
         print("Shutting down ALVR Companion...")
 
+        self.win.alvr_stats.stop()
+        for monitor in list(self.win.wifi_monitors.values()) + list(self.win.logcat_monitors.values()):
+            monitor.stop()
+
         # Disconnect all Wi-Fi devices
-        for serial in self.win.devices_info.keys():
+        for serial in list(self.win.devices_info.keys()):
             self.win.disconnect_device_wifi(serial)
 
-        # Stop the ADB monitor
-        if hasattr(self.win, 'adb_monitor_id') and self.win.adb_monitor_id:
-            GLib.source_remove(self.win.adb_monitor_id)
-            self.win.adb_monitor_id = None
+        # Stop the ADB monitor, scrcpy and the persistent shells
+        self.win.stop_adb_monitor()
 
 
 class MainWindow(Adw.ApplicationWindow):
@@ -81,64 +109,46 @@ class MainWindow(Adw.ApplicationWindow):
         self.set_title(_('ALVR Companion'))
         self.set_default_size(800, 600)
 
-        self.VERSION = get_alvr_version() or ALVR_LATEST
-        self.APK_URL = f"https://github.com/alvr-org/ALVR/releases/download/v{self.VERSION}/alvr_client_android.apk"
-        self.APK_FILE = f"/tmp/alvr_client_{self.VERSION}.apk"
-        self.INFO_FILE = f"/tmp/alvr_client_{self.VERSION}.info"
-
-        # Загрузка конфигурации устройств
-        self.load_devices_config()
-
         # Загрузка настроек пользователя
         self.load_user_config()
-        
+
+        # adb polling, install, forwarding and scrcpy run off the main loop in the shared core
+        self.devices_info = {}
+        self.poll_state = PollState()
+        self.core = CompanionCore(self.poll_state, config=self.user_config)
+        self.VERSION = self.core.version
+        self.APK_FILE = self.core.apk_file
+        self.INFO_FILE = self.core.info_file
+
         self.current_serial = None
+        self.scrcpy_manager = self.core.scrcpy_manager
+        self.forward_manager = self.core.forward_manager
+        self.wifi_monitors = {}
+        self.wifi_samples = {}
+        self.wifi_failovers = set()
+        self.logcat_monitors = {}
+        self.telemetry = {}
+        self.alvr_stats = AlvrStatsClient(on_update=self.on_alvr_stats)
         self.init_ui()
         self.start_adb_monitor()
+        self.alvr_stats.start()
         self.connect_wifi_devices()
 
 # Devices files
-    def load_devices_config(self):
-        with open(DEVICES_FILE, 'r', encoding='utf-8') as f:
-            self.devices_config = yaml.safe_load(f)
-            
     def get_device_config(self, model):
-        for device in self.devices_config['devices']:
-            if device['model'] == model:
-                return device
-        return {}
+        return self.core.get_device_config(model)
 # End Devices files
 
 
 # User config files
     def get_device_unique_id(self, serial):
-        if not is_ip_value(serial):
-            return serial
-        
-        try:
-            for device_serial, device_config in self.user_config.get('devices', {}).items():
-                if device_config.get('wifi_serial') == serial:
-                    return device_serial
-        except:
-            return None
+        return self.user_config.get_device_unique_id(serial)
 
-        
     def load_user_config(self):
-        if not os.path.exists(CONFIG_DIR):
-            os.makedirs(CONFIG_DIR)
-        if os.path.exists(CONFIG_FILE):
-            with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
-                self.user_config = yaml.safe_load(f) or {}
-        else:
-            self.user_config = {}
-
-    def save_user_config(self):
-        with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
-            yaml.dump(self.user_config, f)
+        self.user_config = UserConfig()
 
     def get_user_config(self, device_serial, key, fallback=False):
-        uniniq_id = self.get_device_unique_id(device_serial)
-        return self.user_config.get('devices', {}).get(uniniq_id, {}).get(key, fallback)
+        return self.user_config.get(device_serial, key, fallback)
     
     def set_user_config(self, device_serial, key, value):
         unique_id = self.get_device_unique_id(device_serial)
@@ -146,9 +156,7 @@ class MainWindow(Adw.ApplicationWindow):
             print(_('Error setting user config. Serial not found: {device_serial}').format(device_serial=device_serial))
             return
         print(_('Setting user config. Unique ID: {unique_id}: Serial: {device_serial}').format(unique_id=unique_id, device_serial=device_serial))
-        device_config = self.user_config.setdefault('devices', {}).setdefault(unique_id, {})
-        device_config[key] = value
-        self.save_user_config()
+        self.user_config.set(device_serial, key, value)
 # End User config files
 
 
@@ -161,7 +169,11 @@ class MainWindow(Adw.ApplicationWindow):
         about_item = Gio.MenuItem.new(_('About'), "app.about")
 
         menu = Gio.Menu()
+        menu.append_item(Gio.MenuItem.new(_('Find Headsets on Network'), "app.scan_network"))
         menu.append_item(about_item)
+        # Hidden unless asked for; Ctrl+Shift+D opens it either way
+        if os.environ.get('ALVR_COMPANION_DEBUG'):
+            menu.append_item(Gio.MenuItem.new(_('Debug'), "app.debug"))
 
         menu_button = Gtk.MenuButton(icon_name="open-menu-symbolic")
         menu_button.set_menu_model(menu)
@@ -174,6 +186,15 @@ class MainWindow(Adw.ApplicationWindow):
         action.connect("activate", self.show_about_dialog)
         self.get_application().add_action(action)
 
+        scan_action = Gio.SimpleAction.new("scan_network", None)
+        scan_action.connect("activate", self.on_scan_network)
+        self.get_application().add_action(scan_action)
+
+        debug_action = Gio.SimpleAction.new("debug", None)
+        debug_action.connect("activate", self.show_debug_window)
+        self.get_application().add_action(debug_action)
+        self.get_application().set_accels_for_action("app.debug", ["<Control><Shift>d"])
+
         self.left_content = Gtk.ScrolledWindow()
 
         self.list = Gtk.ListBox()
@@ -181,11 +202,31 @@ class MainWindow(Adw.ApplicationWindow):
         self.list.set_vexpand(True)
         self.list.set_css_classes(["navigation-sidebar"])
         self.list.connect('row-selected', self.on_device_selected)
+        self.device_store = Gio.ListStore.new(DeviceItem)
+        self.sidebar_items = {}
+        self.list.bind_model(self.device_store, create_list_device)
         placeholder = Adw.StatusPage(
             title=_("Connect a device"), icon_name="drive-harddisk-usb-symbolic")
         placeholder.set_css_classes(["compact"])
         self.list.set_placeholder(placeholder)
-        self.left_content.set_child(self.list)
+
+        # Headsets answering adb over TCP that are not connected yet
+        self.found_rows = {}
+        self.found_label = Gtk.Label(label=_("On the network"), xalign=0)
+        self.found_label.set_css_classes(["heading"])
+        self.found_label.set_margin_start(12)
+        self.found_label.set_margin_top(12)
+        self.found_label.set_visible(False)
+        self.found_list = Gtk.ListBox()
+        self.found_list.set_selection_mode(Gtk.SelectionMode.NONE)
+        self.found_list.set_css_classes(["navigation-sidebar"])
+        self.found_list.set_visible(False)
+
+        sidebar_box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL)
+        sidebar_box.append(self.list)
+        sidebar_box.append(self.found_label)
+        sidebar_box.append(self.found_list)
+        self.left_content.set_child(sidebar_box)
 
         self.left_side = Adw.ToolbarView()
         self.left_side.add_top_bar(header_bar)
@@ -254,6 +295,7 @@ class MainWindow(Adw.ApplicationWindow):
             device_serial = row.get_name()
             self.show_device_page(device_serial)
             self.current_serial = device_serial
+            self.poll_state.page_open = True
 
     def show_device_page(self, device_serial, force_update=False):
         unique_id = self.get_device_unique_id(device_serial)
@@ -279,8 +321,7 @@ class MainWindow(Adw.ApplicationWindow):
 
         device_info_box = Gtk.Box(
             orientation=Gtk.Orientation.HORIZONTAL, spacing=10)
-        device_image = Gtk.Image.new_from_file(image_path)
-        device_image.set_pixel_size(128)
+        device_image = create_device_image(image_path, PAGE_ICON_SIZE)
         device_image.set_css_classes(["icon", "icon-dropshadow"])
         device_info_box.append(device_image)
 
@@ -327,16 +368,42 @@ class MainWindow(Adw.ApplicationWindow):
         charging_label = Gtk.Label(label=_("Charging Status: {status}").format(status=device_info.get('Charging Status', 'Unknown')))
         charging_label.set_halign(Gtk.Align.START)
 
+        self.battery_sparkline = Sparkline()
+        self.battery_sparkline.set_halign(Gtk.Align.START)
+        self.battery_estimate_label = Gtk.Label()
+        self.battery_estimate_label.set_halign(Gtk.Align.START)
+
         self.usb_forward_status_label = Gtk.Label()
         self.usb_forward_status_label.set_halign(Gtk.Align.START)
 
+        self.streaming_status_label = Gtk.Label()
+        self.streaming_status_label.set_halign(Gtk.Align.START)
+
+        self.stop_streaming_button = Gtk.Button(label=_("Stop Streaming"))
+        self.stop_streaming_button.add_css_class("destructive-action")
+        self.stop_streaming_button.connect(
+            'clicked', self.on_stop_streaming_button_clicked)
+
         # Add the grid to the device text box
         version_label.set_halign(Gtk.Align.START)
         device_text_box.append(device_name_label)
         device_text_box.append(device_version_grid)
         device_text_box.append(battery_label)
         device_text_box.append(charging_label)
+        device_text_box.append(self.battery_sparkline)
+        device_text_box.append(self.battery_estimate_label)
         device_text_box.append(self.usb_forward_status_label)
+        device_text_box.append(self.streaming_status_label)
+
+        self.alvr_stats_label = Gtk.Label()
+        self.alvr_stats_label.set_halign(Gtk.Align.START)
+        self.alvr_stats_label.set_visible(False)
+        device_text_box.append(self.alvr_stats_label)
+
+        self.wifi_quality_label = Gtk.Label()
+        self.wifi_quality_label.set_halign(Gtk.Align.START)
+        self.wifi_quality_label.set_visible(False)
+        device_text_box.append(self.wifi_quality_label)
         device_info_box.append(device_text_box)
 
         button_box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=10)
@@ -368,6 +435,7 @@ class MainWindow(Adw.ApplicationWindow):
         button_box.append(self.install_button)
         button_box.append(self.progress_bar)
         button_box.append(self.streaming_button)
+        button_box.append(self.stop_streaming_button)
         button_box.append(self.usb_button)
 
         device_info_box.append(
@@ -406,11 +474,20 @@ class MainWindow(Adw.ApplicationWindow):
         wifi_switch.set_sensitive(authorized)
         settings_group.add(wifi_switch)
         
+        usb_failover_row = Adw.SwitchRow(
+            title=_("Switch to USB when Wi-Fi is weak"),
+            subtitle=_("Enable USB forwarding if the Wi-Fi link drops below streaming quality"))
+        usb_failover_row.set_active(self.get_user_config(device_serial, 'auto_usb_failover'))
+        usb_failover_row.connect('notify::active', self.on_auto_usb_failover_toggled)
+        usb_failover_row.set_sensitive(authorized)
+        settings_group.add(usb_failover_row)
+
         # Create a row for the use_crop setting
         use_crop_row = Adw.SwitchRow(
             title=_("Use Crop"),
             subtitle=_("Enable cropping for scrcpy"))
-        use_crop_row.set_active(self.get_user_config(device_serial, 'use_crop'))
+        default_crop = self.get_default_crop(device_serial) if authorized else ''
+        use_crop_row.set_active(self.get_user_config(device_serial, 'use_crop', bool(default_crop)))
         use_crop_row.connect('notify::active', self.on_use_crop_toggled)
         use_crop_row.set_sensitive(authorized)
         settings_group.add(use_crop_row)
@@ -418,15 +495,54 @@ class MainWindow(Adw.ApplicationWindow):
         # Create a row for the crop_params setting
         crop_params_row = Adw.EntryRow(
             title=_("Crop Parameters"))
-        crop_params_row.set_text(self.get_user_config(device_serial, 'crop_params', 
-                                    self.get_device_config(device_model).get('default_crop', '')))
+        crop_params_row.set_text(self.get_user_config(device_serial, 'crop_params', default_crop))
         crop_params_row.connect('changed', self.on_crop_params_changed)
         crop_params_row.set_sensitive(authorized)
         settings_group.add(crop_params_row)
 
+        # Link benchmark: compares USB and Wi-Fi for this headset
+        self.benchmark_row = Adw.ActionRow(title=_("Link benchmark"))
+        self.benchmark_button = Gtk.Button(label=_("Run"))
+        self.benchmark_button.set_valign(Gtk.Align.CENTER)
+        self.benchmark_button.connect('clicked', self.on_benchmark_button_clicked)
+        self.benchmark_button.set_sensitive(authorized)
+        self.benchmark_row.add_suffix(self.benchmark_button)
+        self.update_benchmark_row(device_serial)
+        settings_group.add(self.benchmark_row)
+
+        self.encoder_row = Adw.ActionRow(title=_("ALVR encoder settings"))
+        encoder_apply_button = Gtk.Button(label=_("Apply"))
+        encoder_apply_button.set_valign(Gtk.Align.CENTER)
+        encoder_apply_button.connect('clicked', self.on_encoder_apply_clicked)
+        encoder_apply_button.set_sensitive(authorized)
+        self.encoder_revert_button = Gtk.Button(label=_("Revert"))
+        self.encoder_revert_button.set_valign(Gtk.Align.CENTER)
+        self.encoder_revert_button.connect('clicked', self.on_encoder_revert_clicked)
+        self.encoder_row.add_suffix(self.encoder_revert_button)
+        self.encoder_row.add_suffix(encoder_apply_button)
+        self.update_encoder_row(device_serial)
+        settings_group.add(self.encoder_row)
+
+        auto_transport_row = Adw.SwitchRow(
+            title=_("Choose the faster connection"),
+            subtitle=_("Use the transport recommended by the link benchmark when connected"))
+        auto_transport_row.set_active(self.get_user_config(device_serial, 'auto_select_transport'))
+        auto_transport_row.connect('notify::active', self.on_auto_select_transport_toggled)
+        auto_transport_row.set_sensitive(authorized)
+        settings_group.add(auto_transport_row)
+
         # Add the settings group to the main device box
         device_box.append(settings_group)
 
+        client_events_group = Adw.PreferencesGroup(title=_("ALVR client events"))
+        self.client_events_label = Gtk.Label()
+        self.client_events_label.set_halign(Gtk.Align.START)
+        self.client_events_label.set_wrap(True)
+        self.client_events_label.set_selectable(True)
+        client_events_group.add(self.client_events_label)
+        device_box.append(client_events_group)
+        self.update_client_events(device_serial)
+
         # Wrap the device box in an AdwClamp
         clamped_device_box = Adw.Clamp(child=device_box)
         
@@ -443,6 +559,10 @@ class MainWindow(Adw.ApplicationWindow):
             self.usb_button.set_sensitive(True)
         
         self.check_usb_forwarding_status()
+        self.update_streaming_status(device_serial)
+        self.update_wifi_quality(device_serial)
+        self.update_alvr_stats()
+        self.update_battery_history(device_serial)
 
         return clamped_device_box
     
@@ -458,6 +578,12 @@ class MainWindow(Adw.ApplicationWindow):
     def on_auto_usb_forward_toggled(self, switch, state):
         self.set_user_config(self.current_serial, 'auto_usb_forward', switch.get_active())
 
+    def on_auto_usb_failover_toggled(self, switch, state):
+        self.set_user_config(self.current_serial, 'auto_usb_failover', switch.get_active())
+
+    def on_auto_select_transport_toggled(self, switch, state):
+        self.set_user_config(self.current_serial, 'auto_select_transport', switch.get_active())
+
     def get_device_image_path(self, model):
         return self.get_device_config(model).get('image', './assets/unknown.png')
        
@@ -488,43 +614,45 @@ class MainWindow(Adw.ApplicationWindow):
             self.show_toast(_("Instruction not available"))
 
 # USB Forwading
-    def is_usb_forwarding_enabled(self):
-        try:
-            result = subprocess.check_output(['adb', 'forward', '--list'], text=True)
-            return 'tcp:9943' in result and 'tcp:9944' in result
-        except Exception as e:
-            print(_('USB Forwarding Error: {error}').format(error=e))
-            return False
-        
+    def is_usb_forwarding_enabled(self, device_serial):
+        return self.forward_manager.is_enabled(device_serial)
+
     def setup_usb_forwarding(self, button):
-        try:
-            if self.is_usb_forwarding_enabled():
-                # USB forwarding is currently enabled, so disable it
-                subprocess.run(['adb', 'forward', '--remove', 'tcp:9943'])
-                subprocess.run(['adb', 'forward', '--remove', 'tcp:9944'])
-                self.show_toast(_('USB Forwarding Disabled'))
-            else:
-                # USB forwarding is currently disabled, so enable it
-                subprocess.run(['adb', 'forward', 'tcp:9943', 'tcp:9943'])
-                subprocess.run(['adb', 'forward', 'tcp:9944', 'tcp:9944'])
-                self.show_toast(_('USB Forwarding Enabled'))
+        enabled = not self.is_usb_forwarding_enabled(self.current_serial)
+        self.set_usb_forwarding(self.current_serial, enabled)
+
+    def set_usb_forwarding(self, device_serial, enabled):
+        job = self.core.forward_job(device_serial, enabled)
+        job.add_done_callback(lambda job: GLib.idle_add(self.on_usb_forwarding_done, job, enabled))
+
+    def on_usb_forwarding_done(self, job, enabled):
+        if job.state == FAILED:
+            self.show_toast(_('USB Forwarding Error: {error}').format(error=job.error))
             self.check_usb_forwarding_status()
-        except Exception as e:
-            self.show_toast(_('USB Forwarding Error: {error}').format(error=e))
+        elif job.state != CANCELLED:
+            if enabled:
+                self.show_toast(_('USB Forwarding Enabled'))
+            else:
+                self.show_toast(_('USB Forwarding Disabled'))
+        return False
 
     def check_usb_forwarding_status(self):
-        try:
-            if self.is_usb_forwarding_enabled():
-                self.usb_button.add_css_class("success")
-                self.usb_forward_status_label.set_label(_('USB Forwarding: Enabled'))
-            else:
-                self.usb_button.remove_css_class("success")
-                self.usb_forward_status_label.set_label(_('USB Forwarding: Not enabled'))
-        except Exception as e:
+        # Reads the cached forward table; the core reports every change with a 'forwarding' event
+        if self.usb_button is None or self.current_serial is None:
+            return
+        self.usb_button.remove_css_class("error")
+        local_ports = self.forward_manager.get_local_ports(self.current_serial)
+        if local_ports is None:
             self.usb_button.remove_css_class("success")
-            self.usb_button.add_css_class("error")
-            self.usb_forward_status_label.set_label(_('USB Forwarding: Error checking status'))
-            print(_('USB Forwarding Error: {error}').format(error=e))
+            self.usb_forward_status_label.set_label(_('USB Forwarding: Not enabled'))
+        elif local_ports == list(self.forward_manager.ports):
+            self.usb_button.add_css_class("success")
+            self.usb_forward_status_label.set_label(_('USB Forwarding: Enabled'))
+        else:
+            # Forwarded, but another headset holds 9943/9944, the only ports the ALVR streamer connects to
+            self.usb_button.add_css_class("success")
+            self.usb_forward_status_label.set_label(_('USB Forwarding: Enabled on ports {ports}').format(
+                ports=', '.join(str(port) for port in local_ports)))
 # End USB Forwarding
 
 
@@ -533,27 +661,268 @@ class MainWindow(Adw.ApplicationWindow):
         # Запуск scrcpy с возможностью изменения параметра --crop
         self.start_scrcpy(self.current_serial)
 
+    def on_stop_streaming_button_clicked(self, button):
+        self.core.stop_streaming(self.current_serial)
+
+    def get_display_geometry(self, device_serial):
+        # Only the cache: the core queries the headset on a job thread when it is added
+        device_info = self.devices_info[device_serial]
+        if not device_info.get('Authorized'):
+            return None
+        return self.core.display_cache.lookup(device_info['Model'], device_info['Build Version'])
+
+    def get_default_crop(self, device_serial):
+        # Crop derived from the real panel, falling back to the hand-written one in devices.yaml
+        device_model = self.devices_info[device_serial]['Model']
+        derived_crop = derive_crop(self.get_display_geometry(device_serial))
+        return derived_crop or self.get_device_config(device_model).get('default_crop', '')
+
     def start_scrcpy(self, device_serial):
         # Получение настроек scrcpy из конфигурации
-        use_crop = self.get_user_config(device_serial, 'use_crop') 
+        default_crop = self.get_default_crop(device_serial)
+        use_crop = self.get_user_config(device_serial, 'use_crop', bool(default_crop))
         device_model = self.devices_info[device_serial]['Model']
-        default_crop = self.get_device_config(device_model).get('default_crop', '')
         crop_params = self.get_user_config(device_serial, 'crop_params', default_crop)
+        if not use_crop:
+            crop_params = None
 
-        # Формирование команды для запуска scrcpy с передачей серийного номера устройства
-        # Добавляем опцию -s для выбора устройства
-        scrcpy_command = ['scrcpy', '-s', device_serial]
-        if use_crop and crop_params:
-            scrcpy_command.extend(['--crop', crop_params])
+        profile = dict(self.get_device_config(device_model).get('scrcpy') or {})
+        max_size = derive_max_size(self.get_display_geometry(device_serial), crop_params, profile.get('max_size'))
+        if max_size:
+            profile['max_size'] = max_size
 
-        # Запуск scrcpy с указанным серийным номером устройства
+        # Повторный запуск переиспользует уже открытое окно scrcpy
         try:
-            subprocess.Popen(scrcpy_command)
+            self.core.start_streaming(device_serial, crop_params, profile)
         except Exception as e:
             print(_('Error starting scrcpy: {error}').format(error=e))
+            self.show_toast(_('Error starting scrcpy: {error}').format(error=e))
+
+    def update_streaming_status(self, device_serial):
+        if device_serial != self.current_serial or self.streaming_button is None:
+            return False
+        session = self.scrcpy_manager.get(device_serial)
+        self.stop_streaming_button.set_visible(session is not None)
+        if session is None:
+            self.streaming_button.set_label(_("Streaming"))
+            self.streaming_status_label.set_label('')
+            self.streaming_status_label.set_visible(False)
+            return False
+        self.streaming_button.set_label(_("Show Streaming"))
+        status = _('Streaming: {fps} fps').format(fps=int(session.fps)) if session.fps else _('Streaming: starting...')
+        if session.errors:
+            status += '\n' + _('scrcpy error: {error}').format(error=session.errors[-1])
+        self.streaming_status_label.set_label(status)
+        self.streaming_status_label.set_visible(True)
+        return False
 # End Streaming
 
 
+# ALVR client log
+    def start_logcat_monitor(self, serial):
+        # One log stream per headset, even when it is attached over both USB and Wi-Fi
+        unique_id = self.get_device_unique_id(serial) or serial
+        if unique_id not in self.logcat_monitors:
+            monitor = LogcatMonitor(serial, self.on_logcat_event)
+            self.logcat_monitors[unique_id] = monitor
+            monitor.start()
+
+    def stop_logcat_monitor(self, serial):
+        for unique_id, monitor in list(self.logcat_monitors.items()):
+            if monitor.device_serial != serial:
+                continue
+            monitor.stop()
+            del self.logcat_monitors[unique_id]
+            # The headset may still be attached over its other transport: keep following it there
+            surviving = next((other for other, device_info in self.devices_info.items()
+                              if other != serial and device_info.get('Authorized')
+                              and (self.get_device_unique_id(other) or other) == unique_id), None)
+            if surviving is not None:
+                moved = LogcatMonitor(surviving, self.on_logcat_event)
+                moved.entries.extend(monitor.entries)
+                moved.events.extend(monitor.events)
+                self.logcat_monitors[unique_id] = moved
+                moved.start()
+
+    def on_logcat_event(self, serial, event):
+        # Called from the logcat reader thread
+        GLib.idle_add(self.update_client_events, serial)
+
+    def update_client_events(self, serial):
+        if self.current_serial is None or self.get_device_unique_id(serial) != self.get_device_unique_id(self.current_serial):
+            return False
+        monitor = self.logcat_monitors.get(self.get_device_unique_id(serial) or serial)
+        if monitor is None or not monitor.events:
+            self.client_events_label.set_label(_("No client errors, decoder stalls or reconnects"))
+            return False
+        kinds = {
+            'error': _('Error'),
+            'decoder_stall': _('Decoder stall'),
+            'reconnect': _('Connection'),
+        }
+        lines = [f"{event.entry.time}  {kinds[event.kind]}: {event.entry.message}"
+                 for event in list(monitor.events)[-5:]]
+        self.client_events_label.set_label('\n'.join(lines))
+        return False
+# End ALVR client log
+
+# Battery history
+    def record_telemetry(self, serial, device_info):
+        unique_id = self.get_device_unique_id(serial) or serial
+        history = self.telemetry.get(unique_id)
+        if history is None:
+            history = self.telemetry[unique_id] = TelemetryHistory()
+        history.add_device_info(device_info)
+
+    def update_battery_history(self, device_serial):
+        history = self.telemetry.get(self.get_device_unique_id(device_serial) or device_serial)
+        if history is None:
+            self.battery_sparkline.set_visible(False)
+            self.battery_estimate_label.set_visible(False)
+            return
+        # Switch to the per-minute series once it reaches further back than the raw one
+        long_term = history.long_term.span() > history.raw.span()
+        self.battery_sparkline.set_values(history.battery_values(long_term))
+        self.battery_sparkline.set_visible(True)
+
+        remaining = history.time_remaining()
+        if remaining is None:
+            self.battery_estimate_label.set_visible(False)
+            return
+        hours, minutes = divmod(int(remaining // 60), 60)
+        text = _('Time remaining: {hours} h {minutes} min ({rate:.0f}%/h)').format(
+            hours=hours, minutes=minutes, rate=history.drain_rate())
+        temperature = history.raw.temperature.last()
+        if temperature is not None and temperature == temperature:
+            text += ' · ' + _('{temperature:.1f} °C').format(temperature=temperature)
+        self.battery_estimate_label.set_label(text)
+        self.battery_estimate_label.set_visible(True)
+# End Battery history
+
+# ALVR streamer statistics
+    def on_alvr_stats(self, session):
+        # Called from the stats client thread for every summary (about twice a second)
+        GLib.idle_add(self.update_alvr_stats)
+
+    def update_alvr_stats(self):
+        if self.streaming_button is None:
+            return False
+        stats = self.alvr_stats.latest()
+        if stats is None:
+            self.alvr_stats_label.set_visible(False)
+            return False
+        def fmt(value):
+            return '?' if value is None or value != value else f'{value:.0f}'
+        self.alvr_stats_label.set_label(
+            _('ALVR: {latency} ms latency (network {network}, encode {encode}, decode {decode}), '
+              '{bitrate} Mbit/s, {fps} fps').format(
+                latency=fmt(stats['latency_ms']), network=fmt(stats['network_ms']),
+                encode=fmt(stats['encode_ms']), decode=fmt(stats['decode_ms']),
+                bitrate=fmt(stats['bitrate_mbps']), fps=fmt(stats['client_fps'])))
+        self.alvr_stats_label.set_visible(True)
+        return False
+# End ALVR streamer statistics
+
+# Encoder tuning
+    def get_encoder_recommendation(self, device_serial):
+        device_model = self.devices_info[device_serial]['Model']
+        capabilities = self.get_device_config(device_model).get('alvr')
+        usb_serial = self.get_device_unique_id(device_serial)
+        transport = 'usb' if usb_serial and self.is_usb_forwarding_enabled(usb_serial) else 'wifi'
+        link_mbps = None
+        for result in self.get_user_config(device_serial, 'link_benchmarks', []):
+            if result['transport'] == transport and 'error' not in result:
+                link_mbps = min(result['push_mbps'], result['pull_mbps'])
+        return recommend_encoder_settings(capabilities, link_mbps, transport), transport, link_mbps
+
+    def update_encoder_row(self, device_serial):
+        settings, transport, link_mbps = self.get_encoder_recommendation(device_serial)
+        subtitle = _('Recommended for {transport}: {codec}, {bitrate} Mbit/s, {scale:.0%} resolution').format(
+            transport=transport.upper(), codec=settings['codec'].upper(),
+            bitrate=settings['bitrate_mbps'], scale=settings['resolution_scale'])
+        if link_mbps is None:
+            subtitle += '\n' + _('Run the link benchmark to fit the bitrate to your connection')
+        self.encoder_row.set_subtitle(subtitle)
+        self.encoder_revert_button.set_sensitive(has_backup())
+
+    def on_encoder_apply_clicked(self, button):
+        settings, _transport, _link = self.get_encoder_recommendation(self.current_serial)
+        try:
+            apply_encoder_settings(settings)
+            self.show_toast(_('ALVR encoder settings applied. Restart the ALVR streamer to use them'))
+        except Exception as e:
+            self.show_toast(_('Error writing ALVR settings: {error}').format(error=e))
+        self.update_encoder_row(self.current_serial)
+
+    def on_encoder_revert_clicked(self, button):
+        try:
+            revert_encoder_settings()
+            self.show_toast(_('ALVR encoder settings reverted'))
+        except Exception as e:
+            self.show_toast(_('Error writing ALVR settings: {error}').format(error=e))
+        self.update_encoder_row(self.current_serial)
+# End Encoder tuning
+
+# Link benchmark
+    def on_benchmark_button_clicked(self, button):
+        device_serial = self.current_serial
+        unique_id = self.get_device_unique_id(device_serial)
+        wifi_serial = self.get_user_config(device_serial, 'wifi_serial', None)
+        transports = {
+            'usb': unique_id if unique_id in self.devices_info else None,
+            'wifi': wifi_serial if wifi_serial in self.devices_info else None,
+        }
+        self.benchmark_button.set_sensitive(False)
+        self.benchmark_row.set_subtitle(_("Measuring..."))
+        # Pushes and pulls test files, so it waits for installs on the same headset
+        self.core.jobs.submit(('benchmark', device_serial), self.run_benchmark, device_serial, transports,
+                              device=self.core.device_key(device_serial), priority=PRIORITY_HIGH)
+
+    def run_benchmark(self, device_serial, transports):
+        results = benchmark_device(transports)
+        GLib.idle_add(self.on_benchmark_finished, device_serial, results)
+
+    def on_benchmark_finished(self, device_serial, results):
+        history = self.get_user_config(device_serial, 'link_benchmarks', [])
+        self.set_user_config(device_serial, 'link_benchmarks', add_to_history(history, results))
+        for result in results:
+            if 'error' in result:
+                print(_('Link benchmark error ({transport}): {error}').format(**result))
+        if device_serial == self.current_serial:
+            self.benchmark_button.set_sensitive(True)
+            self.update_benchmark_row(device_serial)
+            self.update_encoder_row(device_serial)
+        return False
+
+    def update_benchmark_row(self, device_serial):
+        history = self.get_user_config(device_serial, 'link_benchmarks', [])
+        latest = {result['transport']: result for result in history if 'error' not in result}
+        if not latest:
+            self.benchmark_row.set_subtitle(_("Measure latency and throughput over USB and Wi-Fi"))
+            return
+        lines = [_('{transport}: {rtt_ms} ms RTT, ±{jitter_ms} ms jitter, {push_mbps}/{pull_mbps} Mbit/s').format(
+            transport=result['transport'].upper(), **{k: result[k] for k in ('rtt_ms', 'jitter_ms', 'push_mbps', 'pull_mbps')})
+            for result in latest.values()]
+        recommendation = recommend_transport(history)
+        lines.append(_('Recommended: {transport}').format(transport=recommendation['transport'].upper()))
+        if not recommendation['sufficient']:
+            lines.append(_('Warning: link may be too slow for ALVR streaming'))
+        self.benchmark_row.set_subtitle('\n'.join(lines))
+
+    def auto_select_transport(self, serial):
+        if not self.get_user_config(serial, 'auto_select_transport'):
+            return
+        recommendation = recommend_transport(self.get_user_config(serial, 'link_benchmarks', []))
+        if recommendation is None:
+            return
+        if recommendation['transport'] == 'wifi' and not is_ip_value(serial):
+            if self.get_user_config(serial, 'wifi_serial', None) not in self.devices_info:
+                self.connect_device_wifi(serial)
+        elif recommendation['transport'] == 'usb' and not is_ip_value(serial):
+            self.set_usb_forwarding(serial, True)
+# End Link benchmark
+
+
 # Wi-Fi
     def on_wifi_switch_toggled(self, switch, state):
         # Переключение соединения на Wi-Fi
@@ -563,39 +932,43 @@ class MainWindow(Adw.ApplicationWindow):
             self.disconnect_device_wifi(self.current_serial, save=True)
 
     def connect_device_wifi(self, device_serial, save=False):
+        # adb connect can take seconds to time out, so it runs as a job
+        self.core.jobs.submit(('wifi_connect', device_serial), self.run_connect_device_wifi, device_serial, save,
+                              priority=PRIORITY_HIGH)
+
+    def run_connect_device_wifi(self, device_serial, save):
         try:
             ip_address = self.get_user_config(device_serial, 'ip_address')
 
             if ip_address:
                 try:
-                    subprocess.run(['adb', 'connect', f'{ip_address}:5555'], check=True)
+                    run_adb(['connect', f'{ip_address}:5555'], server=server_for(device_serial), check=True)
                     if save:
-                        self._update_wifi_config(device_serial, ip_address)
+                        GLib.idle_add(self._update_wifi_config, device_serial, ip_address)
                     return
                 except subprocess.CalledProcessError:
                     pass
 
-            result = subprocess.run(['adb', '-s', device_serial, 'shell', 'ip', 'addr', 'show', 'wlan0'], 
-                                    capture_output=True, text=True)
-            ip_address = next((line.split()[1].split('/')[0] for line in result.stdout.split('\n') if 'inet ' in line), None)
+            ip_address = get_wifi_ip(device_serial)
             if not ip_address:
                 raise Exception(_("Failed to obtain device IP address"))
 
-            subprocess.run(['adb', 'connect', f'{ip_address}:5555'], check=True)
-            self._update_wifi_config(device_serial, ip_address)
+            run_adb(['connect', f'{ip_address}:5555'], server=server_for(device_serial), check=True)
+            GLib.idle_add(self._update_wifi_config, device_serial, ip_address)
         except Exception as e:
-            self.show_toast(_('Wi-Fi connection error: {error}').format(error=e))
+            GLib.idle_add(self.show_toast, _('Wi-Fi connection error: {error}').format(error=e))
 
     def _update_wifi_config(self, device_serial, ip_address):
         self.set_user_config(device_serial, 'wifi_enabled', True)
         self.set_user_config(device_serial, 'ip_address', ip_address)
         self.set_user_config(device_serial, 'wifi_serial', f"{ip_address}:5555")
         self.show_toast(_("Device connected via Wi-Fi"))
+        return False
 
     def disconnect_device_wifi(self, device_serial, save=False):
         # Отключение устройства от Wi-Fi
         try:
-            subprocess.run(['adb', '-s', device_serial, 'disconnect'], check=True)
+            run_adb(['disconnect'], device_serial, check=True)
             self.show_toast(_("Device disconnected from Wi-Fi"))
             
             # Сохранение настройки
@@ -605,208 +978,334 @@ class MainWindow(Adw.ApplicationWindow):
         except Exception as e:
             self.show_toast(_('Error disconnecting from Wi-Fi: {error}').format(error=e))
 
+    def start_wifi_monitor(self, wifi_serial):
+        if wifi_serial not in self.wifi_monitors:
+            monitor = WifiMonitor(wifi_serial, self.on_wifi_sample)
+            self.wifi_monitors[wifi_serial] = monitor
+            monitor.start()
+
+    def stop_wifi_monitor(self, wifi_serial):
+        monitor = self.wifi_monitors.pop(wifi_serial, None)
+        if monitor:
+            monitor.stop()
+        self.wifi_samples.pop(wifi_serial, None)
+        self.wifi_failovers.discard(wifi_serial)
+
+    def on_wifi_sample(self, wifi_serial, sample):
+        # Called from the monitor thread
+        GLib.idle_add(self.apply_wifi_sample, wifi_serial, sample)
+
+    def apply_wifi_sample(self, wifi_serial, sample):
+        if wifi_serial not in self.wifi_monitors:
+            return False
+        self.wifi_samples[wifi_serial] = sample
+        degraded = 'weak_signal' in sample['warnings'] or 'slow_link' in sample['warnings']
+        if not degraded:
+            self.wifi_failovers.discard(wifi_serial)
+        elif wifi_serial not in self.wifi_failovers and self.get_user_config(wifi_serial, 'auto_usb_failover'):
+            usb_serial = self.get_device_unique_id(wifi_serial)
+            if usb_serial in self.devices_info and self.devices_info[usb_serial].get('Authorized'):
+                self.wifi_failovers.add(wifi_serial)
+                if not self.is_usb_forwarding_enabled(usb_serial):
+                    self.set_usb_forwarding(usb_serial, True)
+                    self.show_toast(_("Wi-Fi link is weak, switched ALVR to USB"))
+        if self.current_serial is not None:
+            self.update_wifi_quality(self.current_serial)
+        return False
+
+    def update_wifi_quality(self, device_serial):
+        wifi_serial = device_serial if is_ip_value(device_serial) else self.get_user_config(device_serial, 'wifi_serial', None)
+        sample = self.wifi_samples.get(wifi_serial)
+        if sample is None:
+            self.wifi_quality_label.set_visible(False)
+            return
+        text = _('Wi-Fi: {rssi} dBm, {speed} Mbit/s, {band}').format(
+            rssi=sample['rssi'] if sample['rssi'] is not None else '?',
+            speed=sample['link_speed'] if sample['link_speed'] is not None else '?',
+            band=sample['band'] or '?')
+        warnings = {
+            'weak_signal': _('weak signal'),
+            'slow_link': _('slow link'),
+            'band_2_4ghz': _('2.4 GHz band'),
+        }
+        if sample['warnings']:
+            text += '\n' + _('Not suitable for streaming: {reasons}').format(
+                reasons=', '.join(warnings[warning] for warning in sample['warnings']))
+            self.wifi_quality_label.add_css_class("warning")
+        else:
+            self.wifi_quality_label.remove_css_class("warning")
+        self.wifi_quality_label.set_label(text)
+        self.wifi_quality_label.set_visible(True)
+
     def connect_wifi_devices(self):
-        for serial, device_config in self.user_config.get('devices', {}).items():
+        for serial, device_config in self.user_config.devices().items():
             if device_config.get('wifi_enabled', False):
                 self.connect_device_wifi(serial)
 # End Wi-Fi
 
 # Download APK
-    def download_apk(self):
-        try:
-            response = requests.get(self.APK_URL, stream=True)
-            total_length = response.headers.get('content-length')
-
-            with open(self.APK_FILE, 'wb') as f:
-                if total_length is None:
-                    f.write(response.content)
-                    GLib.idle_add(self.update_progress_bar,
-                                  1.0, _('Download complete'))
-                else:
-                    dl = 0
-                    total_length = int(total_length)
-                    for data in response.iter_content(chunk_size=4096):
-                        dl += len(data)
-                        f.write(data)
-                        fraction = dl / total_length
-                        GLib.idle_add(self.update_progress_bar, fraction, _('Downloading... {percentage}%').format(percentage=int(fraction*100)))
-            with open(self.INFO_FILE, 'w') as f:
-                f.write('Downloaded')
-            GLib.idle_add(self.on_download_complete)
-        except Exception as e:
-            GLib.idle_add(self.on_download_error, str(e))
-
     def update_progress_bar(self, fraction, text):
         self.progress_bar.set_fraction(fraction)
         self.progress_bar.set_text(text)
         return False
 
     def on_download_complete(self):
-        self.progress_bar.set_visible(False)
         self.show_toast(_("APK Downloaded"))
-        self.install_button.set_label(_("Install"))
         return False
 
     def on_download_error(self, message):
         self.progress_bar.set_visible(False)
         self.show_toast(_(f"Download APK Error: {message}"))
+        self.install_button.set_sensitive(True)
+        self.install_button.set_label(_('Install'))
         return False
 # End Download APK
 
 # Monitor ADB devices
     def start_adb_monitor(self):
-        self.devices_info = {}
-        self.adb_monitor_id = GLib.timeout_add(1000, self.check_adb_devices)
-        self.device_monitor_id = GLib.timeout_add(5000, self.device_info_update)
+        self.connect('notify::is-active', self.on_window_state_changed)
+        self.connect('notify::suspended', self.on_window_state_changed)
+        self.connect('notify::visible', self.on_window_state_changed)
+
+        self.core.add_listener(self.on_core_listener)
+        self.core.start()
+        self.core.try_serve_api()
+
+    def stop_adb_monitor(self):
+        self.core.stop()
+
+    def on_window_state_changed(self, window, pspec):
+        state = self.poll_state
+        was_idle = not state.visible or not state.focused
+        state.visible = self.get_visible() and not self.is_suspended()
+        state.focused = self.is_active()
+        # Coming back to the window should refresh right away instead of waiting out a long idle interval
+        if was_idle and state.visible and state.focused:
+            self.core.monitor.wake()
+
+    def on_core_listener(self, event, serial, data):
+        # Called from core worker threads
+        GLib.idle_add(self.on_core_event, event, serial, data)
+
+    def on_core_event(self, event, serial, data):
+        if event == 'added':
+            self.on_device_added(serial, data)
+        elif event == 'removed':
+            self.on_device_removed(serial)
+        elif event in ('authorized', 'unauthorized'):
+            self.devices_info[serial] = data
+            self.update_device_in_sidebar(serial)
+            if event == 'authorized':
+                self.on_device_ready(serial)
+        elif event == 'changed':
+            self.on_device_changed(serial, data)
+        elif event == 'polled':
+            self.on_device_polled(serial, data)
+        elif event == 'forwarding':
+            self.check_usb_forwarding_status()
+        elif event == 'lan_found':
+            self.update_found_devices(data)
+        elif event == 'streaming':
+            self.update_streaming_status(serial)
+        elif event == 'display_geometry':
+            self.on_display_geometry(serial, data)
+        elif event == 'download_progress':
+            self.update_progress_bar(data, _('Downloading... {percentage}%').format(percentage=int(data*100)))
+        elif event == 'downloaded':
+            self.on_download_complete()
+        elif event == 'download_failed':
+            self.on_download_error(data['error'])
+        elif event == 'install_started':
+            self.on_install_started(serial)
+        elif event == 'install_finished':
+            if data['success']:
+                self.on_install_finished()
+            else:
+                self.on_install_error(data['error'], data['cancelled'])
+        elif event == 'sideload_finished':
+            self.on_sideload_finished(data)
+        return False
 
-    def device_info_update(self):
-        try:
-            result = subprocess.check_output(['adb', 'devices'], text=True)
-            lines = result.strip().split('\n')[1:]  # Пропускаем первую строку
-            devices = [line.split('\t') for line in lines if line.strip()]
-            
-            for device in devices:
-                serial = device[0]
-                if device[1] != 'unauthorized':
-                    device_info = get_device_info(serial)
-                    device_info['Authorized'] = True
-                    self.devices_info[serial] = device_info
-        
-        except Exception as e:
-            print(_('ADB Error: {error}').format(error=e))
-        return True
+    def on_device_added(self, serial, device_info):
+        self.devices_info[serial] = device_info
+        self.add_device_to_sidebar(serial)
+        self.remove_found_device(serial)
+        if device_info['Authorized']:
+            self.on_device_ready(serial)
+
+        if self.current_serial is None:
+            self.current_serial = serial
+            self.show_device_page(self.current_serial)
+            self.poll_state.page_open = True
+
+    def on_device_ready(self, serial):
+        if is_ip_value(serial):
+            self.start_wifi_monitor(serial)
+        self.start_logcat_monitor(serial)
+        self.auto_update_device(serial)
+        self.auto_usb_forward_device(serial)
+        self.auto_select_transport(serial)
+
+    def on_device_changed(self, serial, device_info):
+        self.devices_info[serial] = device_info
+        if serial in self.sidebar_items:
+            self.sidebar_items[serial].update(*self.get_sidebar_fields(serial))
+
+    def on_device_polled(self, serial, device_info):
+        # Every info poll is a telemetry sample, also when the battery level did not move
+        if serial not in self.devices_info:
+            return
+        self.record_telemetry(serial, device_info)
+        if serial == self.current_serial:
+            self.update_battery_history(serial)
 
-    def check_adb_devices(self):
-        try:
-            result = subprocess.check_output(['adb', 'devices'], text=True)
-            lines = result.strip().split('\n')[1:]  # Пропускаем первую строку
-            devices = [line.split('\t') for line in lines if line.strip()]
-            connected_serials = [device[0] for device in devices]
-            unauthorized_serials = [device[0] for device in devices if device[1] == 'unauthorized']
-
-            # Обновление списка устройств
-            current_serials = set(self.devices_info.keys())
-            new_serials = set(connected_serials) - current_serials
-            removed_serials = current_serials - set(connected_serials)
-
-            # Check for devices that have changed authorization status
-            for serial in current_serials & set(connected_serials):
-                if serial in unauthorized_serials and self.devices_info[serial]['Authorized']:
-                    # Device became unauthorized
-                    self.devices_info[serial]['Authorized'] = False
-                    self.update_device_in_sidebar(serial)
-                elif serial not in unauthorized_serials and not self.devices_info[serial]['Authorized']:
-                    # Device became authorized
-                    device_info = get_device_info(serial)
-                    self.devices_info[serial] = device_info
-                    self.devices_info[serial]['Authorized'] = True
-                    self.update_device_in_sidebar(serial)
-
-            for serial in new_serials:
-                if serial in unauthorized_serials:
-                    unauth_device = {
-                        'Authorized': False,
-                        'Serial Number': serial, 
-                        'Model': 'Unauthorized Device',
-                        'ALVR Version': None,
-                        'Android Version': None,
-                        'Build Version': None,
-                        'Manufacturer': None
-                        }
-                    self.devices_info[serial] = unauth_device
-                    self.add_device_to_sidebar(serial)
-                else:  
-                    device_info = get_device_info(serial)
-                    self.devices_info[serial] = device_info
-                    self.devices_info[serial]['Authorized'] = True
-                    self.add_device_to_sidebar(serial)
-
-                self.auto_update_device(serial)
-                self.auto_usb_forward_device(serial)
-
-            if connected_serials and self.current_serial is None:
-                self.current_serial = connected_serials[0]
-                self.show_device_page(self.current_serial)
-
-            for serial in removed_serials:
-                self.remove_device_from_sidebar(serial)
-                del self.devices_info[serial]
+    def on_display_geometry(self, serial, geometry):
+        # The crop defaults on the page were built without the panel size
+        if geometry is None or serial not in self.devices_info:
+            return
+        self.device_pages.pop(self.get_device_unique_id(serial), None)
+        if serial == self.current_serial:
+            self.show_device_page(serial, force_update=True)
 
-        except Exception as e:
-            print(_('ADB Error: {error}').format(error=e))
-        return True  # Продолжаем вызывать эту функцию
-    
+    def on_device_removed(self, serial):
+        self.stop_wifi_monitor(serial)
+        self.stop_logcat_monitor(serial)
+        self.remove_device_from_sidebar(serial)
+        self.devices_info.pop(serial, None)
 # End Monitor ADB devices
 
 # Auto hooks
     def auto_update_device(self, serial):
         unique_id = self.get_device_unique_id(serial)
-        if self.get_user_config(serial, 'auto_update'):
-            device_info = self.devices_info[serial]
-            device_alvr_version = device_info['ALVR Version']
-            if device_alvr_version != self.VERSION:
-                # Start installation
-                print(_("Auto-updating device {unique_id}").format(unique_id=unique_id))
-                self.install_apk(serial)
-                self.show_toast(_("Auto-updating device {unique_id}").format(unique_id=unique_id))
+        if not self.core.is_installing(serial) and wants_auto_update(self.user_config, serial, self.devices_info[serial], self.VERSION):
+            # Start installation
+            print(_("Auto-updating device {unique_id}").format(unique_id=unique_id))
+            self.core.install_job(serial, PRIORITY_LOW)
+            self.show_toast(_("Auto-updating device {unique_id}").format(unique_id=unique_id))
+        if wants_auto_sideload(self.user_config, serial, self.core.extra_apks(serial)):
+            self.core.sideload_job(serial, PRIORITY_LOW)
                 
     def auto_usb_forward_device(self, serial):
-        if self.get_user_config(serial, 'auto_usb_forward'):
-            self.setup_usb_forwarding(serial)        
+        if wants_auto_usb_forward(self.user_config, serial):
+            self.set_usb_forwarding(serial, True)
 # End Auto hooks
 
 # Sidebar
     def add_device_to_sidebar(self, serial_connect):
         # Добавление устройства в боковую панель
-        
+        item = DeviceItem(serial_connect, *self.get_sidebar_fields(serial_connect))
+        self.sidebar_items[serial_connect] = item
+        self.device_store.append(item)
+
+    def get_sidebar_fields(self, serial_connect):
         is_wifi = bool(is_ip_value(serial_connect))
         device_info = self.devices_info[serial_connect]
-        serial = device_info['Serial Number']
         model = device_info['Model']
-        image_path = self.get_device_image_path(model)
-        row = create_list_device(model, serial, image_path, is_wifi)
-        row.set_name(serial_connect)
-        self.list.append(row)
-        
+        return model, device_info['Serial Number'], self.get_device_image_path(model), is_wifi
+
     def update_device_in_sidebar(self, serial):
-        self.remove_device_from_sidebar(serial)
-        self.add_device_to_sidebar(serial)
+        # Update the bound item in place: the row and its selection survive
+        item = self.sidebar_items.get(serial)
+        if item is None:
+            self.add_device_to_sidebar(serial)
+        else:
+            item.update(*self.get_sidebar_fields(serial))
         if self.current_serial == serial:
             self.show_device_page(self.current_serial, force_update=True)
 
     def remove_device_from_sidebar(self, serial):
         # Удаление устройства из боковой панели
-        for row in self.list:
-            if row.get_name() == serial:
-                self.list.remove(row)
+        item = self.sidebar_items.pop(serial, None)
+        if item is not None:
+            found, position = self.device_store.find(item)
+            if found:
+                self.device_store.remove(position)
         self.show_toast(_("Device disconnected"))
 # End Sidebar
 
+# LAN discovery
+    def on_scan_network(self, action, param):
+        self.show_toast(_("Searching the network for headsets..."))
+        job = self.core.scan_network_job()
+        job.add_done_callback(lambda job: GLib.idle_add(self.on_scan_network_done, job))
+
+    def on_scan_network_done(self, job):
+        if job.state == FAILED:
+            self.show_toast(_('Network scan error: {error}').format(error=job.error))
+        elif job.state != CANCELLED and not job.result:
+            self.show_toast(_("No headsets found on the network"))
+        return False
+
+    def update_found_devices(self, addresses):
+        for address in list(self.found_rows):
+            if address not in addresses:
+                self.remove_found_device(address)
+        for address in addresses:
+            if address not in self.found_rows and address not in self.devices_info:
+                row = Adw.ActionRow(title=address, subtitle=_("Found on the network"))
+                connect_button = Gtk.Button(label=_("Connect"), valign=Gtk.Align.CENTER)
+                connect_button.connect('clicked', lambda button, address=address: self.connect_found_device(address))
+                row.add_suffix(connect_button)
+                self.found_rows[address] = row
+                self.found_list.append(row)
+        self.found_label.set_visible(bool(self.found_rows))
+        self.found_list.set_visible(bool(self.found_rows))
+
+    def remove_found_device(self, address):
+        row = self.found_rows.pop(address, None)
+        if row is not None:
+            self.found_list.remove(row)
+        self.found_label.set_visible(bool(self.found_rows))
+        self.found_list.set_visible(bool(self.found_rows))
+
+    def connect_found_device(self, address):
+        job = self.core.jobs.submit(('connect_address', address), self.core.connect_address, address,
+                                    priority=PRIORITY_HIGH)
+        job.add_done_callback(lambda job: GLib.idle_add(self.on_connect_found_done, job))
+
+    def on_connect_found_done(self, job):
+        # On success the monitor reports the new transport and on_device_added drops the row
+        if job.state == FAILED:
+            self.show_toast(_('Wi-Fi connection error: {error}').format(error=job.error))
+        return False
+# End LAN discovery
+
 
 # Install APK
     def on_install_button_clicked(self, _1, _2):
-        self.install_button.set_sensitive(False)
+        if self.core.is_installing(self.current_serial):
+            # Still waiting for the download or for the headset: the button cancels
+            self.core.cancel_install(self.current_serial)
+            return
+        self.progress_bar.set_fraction(0)
+        self.progress_bar.set_text('')
         self.progress_bar.set_visible(True)
-        if not os.path.exists(self.APK_FILE):
-            self.install_button.set_sensitive(False)
-            self.install_button.set_label(_('Downloading...'))
-            self.download_apk()
+        if not is_downloaded(self.APK_FILE, self.INFO_FILE):
+            self.progress_bar.set_text(_('Downloading...'))
+        self.install_button.set_label(_('Cancel'))
+
+        # The install job waits for the download job; both run off the main loop
+        self.core.install_job(self.current_serial, PRIORITY_HIGH).add_done_callback(self.on_install_job_done)
+
+    def on_install_job_done(self, job):
+        # Called from the job thread; the extra APKs configured for the headset follow a successful install
+        serial = job.args[0]
+        if job.state == DONE and self.core.extra_apks(serial):
+            self.core.sideload_job(serial, PRIORITY_HIGH)
 
-        device_id = self.current_serial
- 
+    def on_install_started(self, device_id):
+        if device_id != self.current_serial:
+            return
         self.install_button.set_sensitive(False)
         self.install_button.set_label(_('Installing...'))
+        self.progress_bar.set_visible(True)
         self.progress_bar.set_fraction(0)
         self.progress_bar.set_text('')
 
-        # Start installation in a separate thread
-        self.install_thread = threading.Thread(
-            target=self.install_apk, args=(device_id,))
-        self.install_thread.start()
-
         # Start progress bar animation
-        self.progress_timeout_id = GLib.timeout_add(
-            250, self.increment_progress)
+        if not getattr(self, 'progress_timeout_id', None):
+            self.progress_timeout_id = GLib.timeout_add(
+                250, self.increment_progress)
 
     def increment_progress(self):
         fraction = self.progress_bar.get_fraction()
@@ -817,18 +1316,6 @@ class MainWindow(Adw.ApplicationWindow):
         self.progress_bar.set_text(_('Installing...'))
         return True  # Continue calling this function
 
-    def install_apk(self, device_id):
-        try:
-            process = subprocess.Popen(['adb', '-s', device_id, 'install', '-r', self.APK_FILE],
-                                       stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-            stdout, stderr = process.communicate()
-            if process.returncode == 0:
-                GLib.idle_add(self.on_install_finished)
-            else:
-                GLib.idle_add(self.on_install_error, stderr)
-        except Exception as e:
-            GLib.idle_add(self.on_install_error, str(e))
-
     def on_install_finished(self):
         self.progress_bar.set_visible(False)
         if hasattr(self, 'progress_timeout_id') and self.progress_timeout_id:
@@ -844,14 +1331,24 @@ class MainWindow(Adw.ApplicationWindow):
             self.install_button.set_label(_('Install'))
         return False
 
-    def on_install_error(self, message):
+    def on_sideload_finished(self, result):
+        if result['success'] and result['installed']:
+            self.show_toast(_('Extra APKs installed: {packages}').format(packages=', '.join(result['installed'])))
+        elif not result['success'] and not result['cancelled']:
+            self.show_toast(_('Error installing extra APKs: {error}').format(error=result['error']))
+
+    def on_install_error(self, message, cancelled=False):
         if hasattr(self, 'progress_timeout_id') and self.progress_timeout_id:
             GLib.source_remove(self.progress_timeout_id)
             self.progress_timeout_id = None
         self.progress_bar.set_fraction(0.0)
         self.progress_bar.set_text('')
-        self.show_toast(_('Installation Error.'))
-        print(message)
+        self.progress_bar.set_visible(False)
+        if cancelled:
+            self.show_toast(_('Installation cancelled'))
+        else:
+            self.show_toast(_('Installation Error.'))
+            print(message)
         self.install_button.set_sensitive(True)
         self.install_button.set_label(_('Install'))
         return False
@@ -871,6 +1368,10 @@ class MainWindow(Adw.ApplicationWindow):
 
         dialog.present(self.get_application().get_active_window())
 
+    def show_debug_window(self, action, param):
+        create_debug_window(self, metrics, CONFIG_DIR, self.show_toast,
+                            self.get_application().watchdog).present()
+
     def show_details_window(self, button):
         try:
             device_info =  self.devices_info[self.current_serial]
@@ -902,8 +1403,12 @@ class MainWindow(Adw.ApplicationWindow):
 
 def main():
     # Переключение adb в режим tcpip
-    subprocess.run(['adb', 'tcpip', '5555'])
-    app = ALVRInstaller()
+    run_adb(['tcpip', '5555'])
+    # Opt-in main loop stall watchdog for every timeout and idle callback
+    watchdog = watchdog_from_env()
+    if watchdog:
+        watch_glib(GLib, watchdog)
+    app = ALVRInstaller(watchdog)
     app.run(sys.argv)
 
 if __name__ == '__main__':
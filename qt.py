@@ -1,127 +1,52 @@
 #!/usr/bin/env python3
 
 import sys
-import os
-import threading
-import subprocess
-import requests
 
 from PyQt5.QtWidgets import (QApplication, QWidget, QLabel, QPushButton, QProgressBar,
-                             QVBoxLayout, QHBoxLayout, QMessageBox, QComboBox)
-from PyQt5.QtCore import QTimer, pyqtSignal, QObject
-from utils.adb import get_device_info
-
-ALVR_LATEST = "20.11.1"
-
-def check_command(command):
-    """Check if a command can be executed."""
-    try:
-        # Run the command with --version to see if it exists
-        subprocess.check_output([command, '--version'], text=True)
-        return True
-    except (subprocess.CalledProcessError, FileNotFoundError):
-        return False
-
-
-def get_alvr_version():
-    # Check for Arch Linux (pacman)
-    if check_command('pacman'):
-        try:
-            result = subprocess.check_output(
-                ['pacman', '-Qi', 'alvr'], text=True)
-            for line in result.splitlines():
-                if 'Version' in line:
-                    return line.split(':')[1].strip()
-        except subprocess.CalledProcessError:
-            print("Failed to retrieve ALVR version from pacman.")
-
-    # Check for rpm-based systems (rpm)
-    if check_command('rpm'):
-        try:
-            result = subprocess.check_output(['rpm', '-qi', 'alvr'], text=True)
-            for line in result.splitlines():
-                if 'Version' in line:
-                    return line.split(':')[1].strip()
-        except subprocess.CalledProcessError:
-            print("Failed to retrieve ALVR version from rpm.")
-
-    return None
-
-
-class WorkerSignals(QObject):
-    progress = pyqtSignal(int)
-    finished = pyqtSignal()
-    error = pyqtSignal(str)
-
-
-class DownloadThread(threading.Thread):
-    def __init__(self, url, filepath, signals):
-        super().__init__()
-        self.url = url
-        self.filepath = filepath
-        self.signals = signals
-
-    def run(self):
-        try:
-            response = requests.get(self.url, stream=True)
-            total_length = response.headers.get('content-length')
-
-            with open(self.filepath, 'wb') as f:
-                if total_length is None:
-                    f.write(response.content)
-                    self.signals.progress.emit(100)
-                else:
-                    dl = 0
-                    total_length = int(total_length)
-                    for data in response.iter_content(chunk_size=4096):
-                        dl += len(data)
-                        f.write(data)
-                        done = int(100 * dl / total_length)
-                        self.signals.progress.emit(done)
-            self.signals.finished.emit()
-        except Exception as e:
-            self.signals.error.emit(str(e))
-
-
-class InstallThread(threading.Thread):
-    def __init__(self, device_id, apk_path, signals):
-        super().__init__()
-        self.device_id = device_id
-        self.apk_path = apk_path
-        self.signals = signals
-
-    def run(self):
-        try:
-            process = subprocess.Popen(['adb', '-s', self.device_id, 'install', '-r', self.apk_path],
-                                       stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-            while True:
-                output = process.stdout.readline()
-                if output == '' and process.poll() is not None:
-                    break
-                if output:
-                    print(output.strip())
-            self.signals.finished.emit()
-        except Exception as e:
-            self.signals.error.emit(str(e))
+                             QVBoxLayout, QHBoxLayout, QMessageBox, QComboBox, QShortcut)
+from PyQt5.QtCore import QEvent, pyqtSignal
+from PyQt5.QtGui import QKeySequence
+from utils.apk import is_downloaded
+from utils.companion_core import CompanionCore
+from utils.jobs import CANCELLED, FAILED, PRIORITY_HIGH
+from utils.metrics import format_metrics, metrics
+from utils.watchdog import watchdog_from_env
+from utils.poll_budget import PollState
+
+DEVICE_INTERVAL = 2
+INFO_INTERVAL = 5
+# Events that change which devices the combo box lists
+DEVICE_LIST_EVENTS = ('added', 'removed', 'authorized', 'unauthorized')
 
 
 class ALVRInstaller(QWidget):
+    # Core events arrive on worker threads; the queued signal hands them to the Qt main thread
+    core_event = pyqtSignal(str, object, object)
+
     def __init__(self):
         super().__init__()
-        self.VERSION = get_alvr_version() or ALVR_LATEST
-        self.APK_URL = f"https://github.com/alvr-org/ALVR/releases/download/v{self.VERSION}/alvr_client_android.apk"
-        self.APK_FILE = f"/tmp/alvr_client_{self.VERSION}.apk"
-        self.INFO_FILE = f"/tmp/alvr_client_{self.VERSION}.info"
+        self.poll_state = PollState()
+        self.poll_state.page_open = True
+        self.core = CompanionCore(self.poll_state, DEVICE_INTERVAL, INFO_INTERVAL)
+        self.VERSION = self.core.version
+        self.APK_FILE = self.core.apk_file
+        self.INFO_FILE = self.core.info_file
+
+        self.devices = []
+        self.watchdog = watchdog_from_env()
 
         self.initUI()
         self.check_apk_status()
-        self.start_adb_monitor()
-        self.check_usb_forwarding_status()
+        self.update_device_list()
+        self.core_event.connect(self.watch(self.on_core_event))
+        self.core.add_listener(self.core_event.emit)
+        self.core.start()
+        self.core.try_serve_api()
 
     def initUI(self):
         self.setWindowTitle('ALVR Installer')
 
-        self.apk_version_label = QLabel(f'APK Version: {get_alvr_version()}')
+        self.apk_version_label = QLabel(f'APK Version: {self.VERSION}')
         self.apk_status_label = QLabel('APK Status: Checking...')
         self.apk_installed_label = QLabel('APK Installed: Checking...')
         self.device_info = QLabel('Device Info: Checking...')
@@ -137,6 +62,7 @@ class ALVRInstaller(QWidget):
 
         self.device_combo = QComboBox()
         self.device_combo.setEnabled(False)
+        self.device_combo.currentIndexChanged.connect(self.update_selected_device)
 
         self.usb_forward_button = QPushButton('Подключение по USB')
         self.usb_forward_button.clicked.connect(self.setup_usb_forwarding)
@@ -163,143 +89,179 @@ class ALVRInstaller(QWidget):
         vbox.addWidget(self.progress_bar)
         vbox.addWidget(self.install_status_label)
 
+        self.debug_shortcut = QShortcut(QKeySequence('Ctrl+Shift+D'), self)
+        self.debug_shortcut.activated.connect(self.show_debug_report)
+
         self.setLayout(vbox)
         self.resize(400, 250)
         self.show()
 
+    def on_core_event(self, event, serial, data):
+        if event in DEVICE_LIST_EVENTS:
+            self.update_device_list()
+        elif event == 'changed':
+            if serial == self.get_selected_device():
+                self.update_selected_device()
+        elif event == 'forwarding':
+            self.check_usb_forwarding_status()
+        elif event == 'download_progress':
+            self.update_progress(int(data * 100))
+        elif event == 'download_done':
+            # data is the finished download job
+            if data.state == FAILED:
+                self.download_error(str(data.error))
+            elif data.state == CANCELLED:
+                self.download_error(None)
+            else:
+                self.download_finished()
+        elif event == 'install_finished':
+            if data['success']:
+                self.install_finished()
+            elif data['cancelled']:
+                self.install_status_label.setText('Install Cancelled.')
+                self.install_button.setEnabled(True)
+            else:
+                self.install_error(data['error'])
+        elif event == 'forward_done':
+            # data is the finished forwarding job
+            if data.state == FAILED:
+                QMessageBox.critical(self, 'USB Forwarding Error',
+                                     f'An error occurred while setting up USB forwarding:\n{data.error}')
+
     def check_apk_status(self):
-        if os.path.exists(self.APK_FILE) and os.path.exists(self.INFO_FILE):
+        if is_downloaded(self.APK_FILE, self.INFO_FILE):
             self.apk_status_label.setText('APK Status: Downloaded')
             self.download_button.setText('Re-download APK')
-            self.install_button.setEnabled(True)
         else:
             self.apk_status_label.setText('APK Status: Not Downloaded')
             self.download_button.setText('Download APK')
-            self.install_button.setEnabled(False)
+        self.install_button.setEnabled(self.get_selected_device() is not None
+                                       and is_downloaded(self.APK_FILE, self.INFO_FILE))
 
     def download_apk(self):
-        self.download_button.setEnabled(False)
+        job = self.core.jobs.find(('download', self.VERSION))
+        if job is not None:
+            self.core.jobs.cancel(job)
+            return
+        self.download_button.setText('Cancel Download')
         self.install_button.setEnabled(False)
         self.progress_bar.setValue(0)
         self.install_status_label.setText('Downloading APK...')
-        self.signals = WorkerSignals()
-        self.signals.progress.connect(self.update_progress)
-        self.signals.finished.connect(self.download_finished)
-        self.signals.error.connect(self.download_error)
+        # The button reads 'Re-download APK' once a copy is cached, and then replaces it
+        self.core.download_job(PRIORITY_HIGH, force=True).add_done_callback(self.on_download_done)
 
-        self.download_thread = DownloadThread(
-            self.APK_URL, self.APK_FILE, self.signals)
-        self.download_thread.start()
+    def on_download_done(self, job):
+        self.core_event.emit('download_done', None, job)
 
     def update_progress(self, value):
         self.progress_bar.setValue(value)
 
     def download_finished(self):
-        with open(self.INFO_FILE, 'w', encoding='utf-8') as f:
-            f.write('Downloaded')
         self.check_apk_status()
         self.install_status_label.setText('APK Downloaded.')
-        self.download_button.setEnabled(True)
-        self.install_button.setEnabled(True)
 
     def download_error(self, message):
+        self.check_apk_status()
+        if message is None:
+            self.install_status_label.setText('Download Cancelled.')
+            return
         QMessageBox.critical(
             self, 'Download Error', f'An error occurred while downloading the APK:\n{message}')
         self.install_status_label.setText('Download Error.')
-        self.download_button.setEnabled(True)
-        self.install_button.setEnabled(False)
 
-    def start_adb_monitor(self):
-        self.adb_timer = QTimer()
-        self.adb_timer.timeout.connect(self.check_adb_devices)
-        self.adb_timer.timeout.connect(self.check_usb_forwarding_status)
-        self.adb_timer.timeout.connect(self.check_installed_alvr_version)
-        self.adb_timer.timeout.connect(self.check_device_info)
-        self.adb_timer.start(2000)  # Check every 2 seconds
-
-    def check_adb_devices(self):
-        try:
-            result = subprocess.check_output(['adb', 'devices'], text=True)
-            lines = result.strip().split('\n')[1:]  # Skip the first line
-            devices = [line.split('\t') for line in lines if line.strip()]
-            self.devices = devices
-            if not devices:
-                self.device_status_label.setText(
-                    'Device Status: No devices connected')
-                self.device_combo.clear()
-                self.device_combo.setEnabled(False)
-                self.install_button.setEnabled(False)
-            else:
-                self.device_combo.clear()
-                for device in devices:
-                    self.device_combo.addItem(f"{device[0]} ({device[1]})")
-                self.device_status_label.setText(
-                    f'Device Status: {len(devices)} device(s) connected')
-                self.device_combo.setEnabled(True)
-                if os.path.exists(self.APK_FILE):
-                    self.install_button.setEnabled(True)
-                else:
-                    self.install_button.setEnabled(False)
-        except Exception as e:
-            print(f"ADB Error: {e}")
+    def watch(self, slot):
+        # Time main-thread slots when the stall watchdog is enabled
+        return self.watchdog.wrap(slot) if self.watchdog else slot
+
+    def show_debug_report(self):
+        text = format_metrics(metrics)
+        if self.watchdog:
+            text += '\n\n' + self.watchdog.format_report()
+        print(text)
+        QMessageBox.information(self, 'Debug', text)
+
+    def changeEvent(self, event):
+        if hasattr(self, 'core') and event.type() in (QEvent.ActivationChange, QEvent.WindowStateChange):
+            state = self.poll_state
+            was_idle = not state.visible or not state.focused
+            state.visible = self.isVisible() and not self.isMinimized()
+            state.focused = self.isActiveWindow()
+            if was_idle and state.visible and state.focused:
+                self.core.monitor.wake()
+        super().changeEvent(event)
+
+    def closeEvent(self, event):
+        self.core.stop()
+        super().closeEvent(event)
+
+    def update_device_list(self):
+        # Only called when a device came, went or changed authorization; keeps the current selection
+        devices_info = self.core.monitor.snapshot()
+        selected = self.get_selected_device()
+        self.devices = [(serial, 'device' if info['Authorized'] else 'unauthorized')
+                        for serial, info in sorted(devices_info.items())]
+        self.device_combo.blockSignals(True)
+        self.device_combo.clear()
+        for device in self.devices:
+            self.device_combo.addItem(f"{device[0]} ({device[1]})")
+        serials = [serial for serial, _status in self.devices]
+        if selected in serials:
+            self.device_combo.setCurrentIndex(serials.index(selected))
+        self.device_combo.blockSignals(False)
+        self.device_combo.setEnabled(bool(self.devices))
+        if self.devices:
+            self.device_status_label.setText(
+                f'Device Status: {len(self.devices)} device(s) connected')
+        else:
             self.device_status_label.setText(
-                'Device Status: Error checking devices')
-            self.device_combo.clear()
-            self.device_combo.setEnabled(False)
-            self.install_button.setEnabled(False)
+                'Device Status: No devices connected')
+        self.update_selected_device()
+
+    def get_selected_device(self):
+        index = self.device_combo.currentIndex()
+        if index == -1 or index >= len(self.devices):
+            return None
+        return self.devices[index][0]
+
+    def update_selected_device(self):
+        self.check_apk_status()
+        self.check_usb_forwarding_status()
+        self.check_device_info()
 
     def setup_usb_forwarding(self):
-        try:
-            subprocess.run(['adb', 'forward', 'tcp:9943', 'tcp:9943'])
-            subprocess.run(['adb', 'forward', 'tcp:9944', 'tcp:9944'])
-            self.check_usb_forwarding_status()
-        except Exception as e:
-            QMessageBox.critical(self, 'USB Forwarding Error',
-                                 f'An error occurred while setting up USB forwarding:\n{e}')
+        device_id = self.get_selected_device()
+        if device_id is None:
+            QMessageBox.information(
+                self, 'No Device Selected', 'Please select a device.')
+            return
+        job = self.core.forward_job(device_id, True, reverse=False)
+        job.add_done_callback(lambda job: self.core_event.emit('forward_done', device_id, job))
 
     def check_usb_forwarding_status(self):
-        try:
-            result = subprocess.check_output(
-                ['adb', 'forward', '--list'], text=True)
-            if 'tcp:9943' in result and 'tcp:9944' in result:
-                self.usb_forward_status_label.setText(
-                    'USB Forwarding: Enabled')
-            else:
-                self.usb_forward_status_label.setText(
-                    'USB Forwarding: Not enabled')
-        except Exception as e:
+        device_id = self.get_selected_device()
+        local_ports = self.core.get_local_ports(device_id) if device_id else None
+        if local_ports:
+            self.usb_forward_status_label.setText(
+                f'USB Forwarding: Enabled on ports {", ".join(str(port) for port in local_ports)}')
+        else:
             self.usb_forward_status_label.setText(
-                'USB Forwarding: Error checking status')
-            print(f"USB Forwarding Error: {e}")
-
-    def check_installed_alvr_version(self):
-        package_name = "alvr.client.stable"
-        try:
-            result = subprocess.check_output(
-                ['adb', 'shell', 'dumpsys', 'package', package_name],
-                text=True
-            )
-            for line in result.splitlines():
-                if 'versionName' in line:
-                    self.apk_installed_label.setText(f'APK Installed: {line.split("=")[1].strip()}')
-                    return
-            self.apk_installed_label.setText('APK Installed: ALVR not installed')
-        except Exception as e:
-            self.apk_installed_label.setText('APK Installed: Error fetching ALVR version')
-            print(f"Error fetching ALVR version: {e}")
+                'USB Forwarding: Not enabled')
 
     def check_device_info(self):
-        try:
-            device_info = get_device_info()
-
-            self.device_info.setText('Device Info:\n' + '\n'.join(
-                [f"{key}: {value}" for key, value in device_info.items()]))
-        except Exception as e:
-            self.device_info.setText('Device Info: Error fetching info')
-            print(f"Device Info: Error fetching info: {e}")
-        
+        # Served from the core's cache; nothing here talks to adb
+        device_id = self.get_selected_device()
+        device_info = self.core.monitor.get(device_id) if device_id else None
+        if device_info is None:
+            self.apk_installed_label.setText('APK Installed: No device selected')
+            self.device_info.setText('Device Info: No device selected')
+            return
+        self.apk_installed_label.setText(
+            f"APK Installed: {device_info['ALVR Version'] or 'ALVR not installed'}")
+        self.device_info.setText('Device Info:\n' + '\n'.join(
+            [f"{key}: {value}" for key, value in device_info.items() if key != 'Authorized']))
+
     def install_apk(self):
-        if not os.path.exists(self.APK_FILE):
+        if not is_downloaded(self.APK_FILE, self.INFO_FILE):
             QMessageBox.information(
                 self, 'APK Not Downloaded', 'Please download the APK first.')
             return
@@ -313,19 +275,9 @@ class ALVRInstaller(QWidget):
             QMessageBox.information(self, 'Device Unauthorized',
                                     'Device is unauthorized. Please authorize on your device.')
             return
-        elif status != 'device':
-            QMessageBox.information(self, 'Device Not Ready',
-                                    f'Device {device_id} is not ready for installation.')
-            return
         self.install_status_label.setText('Installing APK...')
         self.install_button.setEnabled(False)
-        self.signals = WorkerSignals()
-        self.signals.finished.connect(self.install_finished)
-        self.signals.error.connect(self.install_error)
-
-        self.install_thread = InstallThread(
-            device_id, self.APK_FILE, self.signals)
-        self.install_thread.start()
+        self.core.install_job(device_id, PRIORITY_HIGH)
 
     def install_finished(self):
         self.install_status_label.setText('APK Installed.')
@@ -0,0 +1,83 @@
+import os
+import sys
+import time
+from argparse import Namespace
+
+import pytest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(TESTS_DIR)
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, os.path.join(REPO_DIR, 'bench'))
+
+from run_bench import UNCAPPED_RATE, build_scenario, install_fake_adb  # noqa: E402
+from utils.adb_command import ADB_COMMANDS_PER_SECOND, INTERACTIVE_RESERVE, MONITOR_RESERVE, rate_limiter  # noqa: E402
+from utils.adb_shell import close_all_shells  # noqa: E402
+
+# bench/run_bench.py options, with a fast and reliable link
+FAKE_ADB_DEFAULTS = {
+    'devices': 1,
+    'unauthorized': 0,
+    'wifi': 0,
+    'wifi_drop_rate': 0.0,
+    'hotplug': 0.0,
+    'latency_ms': 0,
+    'server_latency_ms': 0,
+    'install_seconds': 0,
+    'bandwidth_mbps': 300,
+    'hub_bandwidth_mbps': 0,
+    'hub_contention': 0.1,
+    'devices_per_hub': 4,
+    'servers': 1,
+}
+
+
+@pytest.fixture
+def wait_until():
+    # Polls for state that worker threads update, instead of sleeping a fixed time
+    def wait(predicate, timeout=5):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if predicate():
+                return True
+            time.sleep(0.02)
+        return predicate()
+    return wait
+
+
+@pytest.fixture
+def fake_bin(tmp_path, monkeypatch):
+    # Puts executable stand-ins for external tools first on PATH: fake_bin('scrcpy', script)
+    bin_dir = tmp_path / 'bin'
+    bin_dir.mkdir()
+    monkeypatch.setenv('PATH', f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+
+    def install(name, script):
+        path = bin_dir / name
+        path.write_text(f'#!{sys.executable}\n{script}')
+        path.chmod(0o755)
+        return path
+    return install
+
+
+@pytest.fixture
+def fake_adb(tmp_path, monkeypatch):
+    # Puts bench/fake_adb.py on PATH as adb: fake_adb(devices=2, wifi=1, overrides=[{'packages': {...}}])
+    # takes run_bench.py options, plus per-device scenario keys merged into the devices in order.
+    # Returns the scenario; the app-wide adb rate limit is lifted for the test.
+    monkeypatch.setenv('PATH', os.environ['PATH'])
+    monkeypatch.delenv('FAKE_ADB_SCENARIO', raising=False)
+    monkeypatch.delenv('FAKE_ADB_STATE', raising=False)
+    monkeypatch.delenv('ADB_SERVER_SOCKET', raising=False)
+    rate_limiter.set_rate(UNCAPPED_RATE)
+
+    def install(overrides=(), **options):
+        scenario = build_scenario(Namespace(**dict(FAKE_ADB_DEFAULTS, **options)))
+        for device, override in zip(scenario['devices'], overrides):
+            device.update(override)
+        install_fake_adb(str(tmp_path / 'adb'), scenario)
+        return scenario
+    yield install
+
+    close_all_shells()
+    rate_limiter.set_rate(ADB_COMMANDS_PER_SECOND, reserve=INTERACTIVE_RESERVE, monitor_reserve=MONITOR_RESERVE)
@@ -0,0 +1,169 @@
+import base64
+import hashlib
+import json
+import math
+import socket
+import struct
+import threading
+
+import pytest
+
+from utils import alvr_stats
+from utils.alvr_stats import EVENTS_PATH, AlvrStatsClient, SessionStats, WebSocket, WebSocketClosed
+
+WEBSOCKET_GUID = b'258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+
+def frame(opcode, payload=b'', fin=True):
+    # Server frames are not masked
+    header = bytes([(0x80 if fin else 0) | opcode])
+    if len(payload) < 126:
+        header += bytes([len(payload)])
+    elif len(payload) < 65536:
+        header += bytes([126]) + struct.pack('!H', len(payload))
+    else:
+        header += bytes([127]) + struct.pack('!Q', len(payload))
+    return header + payload
+
+
+def text(message):
+    return frame(0x1, json.dumps(message).encode())
+
+
+def summary(**data):
+    return text({'timestamp': '12:00:00', 'event_type': {'id': 'StatisticsSummary', 'data': data}})
+
+
+def read_frames(data):
+    # Client frames are masked: [(opcode, payload)]
+    frames = []
+    while len(data) >= 6:
+        opcode, length = data[0] & 0x0F, data[1] & 0x7F
+        mask, payload = data[2:6], data[6:6 + length]
+        frames.append((opcode, bytes(b ^ mask[i % 4] for i, b in enumerate(payload))))
+        data = data[6 + length:]
+    return frames
+
+
+class StreamerStandIn:
+    # Plays the streamer's dashboard on loopback: each connection gets the next list of frames and is then closed
+    def __init__(self, connections, status='101 Switching Protocols'):
+        self.connections = list(connections)
+        self.status = status
+        self.requests = []
+        self.received = []
+        self.server = socket.create_server(('127.0.0.1', 0))
+        self.port = self.server.getsockname()[1]
+        self.thread = threading.Thread(target=self._serve, daemon=True)
+        self.thread.start()
+
+    def _serve(self):
+        for frames in self.connections:
+            conn, _ = self.server.accept()
+            with conn:
+                request = b''
+                while b'\r\n\r\n' not in request:
+                    request += conn.recv(4096)
+                self.requests.append(request.decode())
+                key = next(line.split(':', 1)[1].strip() for line in request.decode().split('\r\n')
+                           if line.lower().startswith('sec-websocket-key'))
+                accept = base64.b64encode(hashlib.sha1(key.encode() + WEBSOCKET_GUID).digest()).decode()
+                conn.sendall(f'HTTP/1.1 {self.status}\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n'
+                             f'Sec-WebSocket-Accept: {accept}\r\n\r\n'.encode())
+                for data in frames:
+                    conn.sendall(data)
+                conn.sendall(frame(0x8))
+                received = b''
+                conn.settimeout(2)
+                try:
+                    while chunk := conn.recv(4096):
+                        received += chunk
+                except OSError:
+                    pass
+                self.received.append(read_frames(received))
+
+    def close(self):
+        self.server.close()
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(alvr_stats, 'RECONNECT_INTERVAL', 0.05)
+    clients = []
+
+    def start(streamer):
+        updates = []
+        client = AlvrStatsClient(on_update=lambda session: updates.append(session.latest()),
+                                 host='127.0.0.1', port=streamer.port)
+        client.updates = updates
+        clients.append(client)
+        client.start()
+        return client
+    yield start
+    for client in clients:
+        client.stop()
+
+
+def test_summaries_are_recorded_in_order(client, wait_until):
+    streamer = StreamerStandIn([[
+        text({'event_type': {'id': 'Log', 'data': 'connected'}}),
+        frame(0x1, b'not json'),
+        summary(total_latency_ms=42.5, video_mbits_per_sec=120, client_fps=71.9),
+        summary(total_latency_ms=38.0, video_mbits_per_sec=150, client_fps=72, packets_lost_per_sec=2),
+    ]])
+    stats = client(streamer)
+
+    assert wait_until(lambda: len(stats.updates) == 2)
+    first, second = stats.updates
+    assert first['latency_ms'] == 42.5 and first['bitrate_mbps'] == 120 and math.isnan(first['packets_lost'])
+    assert second['latency_ms'] == 38.0 and second['client_fps'] == 72 and second['packets_lost'] == 2
+    assert f'GET {EVENTS_PATH} HTTP/1.1' in streamer.requests[0]
+    assert 'X-ALVR: true' in streamer.requests[0]
+    streamer.close()
+
+
+def test_fragmented_large_and_ping_frames(client, wait_until):
+    # A padded summary needs the 16-bit length, sent as two fragments with a ping in between
+    payload = json.dumps({'event_type': {'id': 'StatisticsSummary', 'data': {'server_fps': 90}},
+                          'padding': 'x' * 300}).encode()
+    streamer = StreamerStandIn([[
+        frame(0x1, payload[:200], fin=False),
+        frame(0x9, b'are you there'),
+        frame(0x0, payload[200:]),
+    ]])
+    stats = client(streamer)
+
+    assert wait_until(lambda: len(stats.updates) == 1)
+    assert stats.updates[0]['server_fps'] == 90
+    assert wait_until(lambda: streamer.received)
+    assert (0xA, b'are you there') in streamer.received[0]
+    streamer.close()
+
+
+def test_reconnect_starts_a_new_session(client, wait_until):
+    streamer = StreamerStandIn([[summary(client_fps=72)], [summary(client_fps=90)]])
+    stats = client(streamer)
+
+    assert wait_until(lambda: len(stats.updates) == 2)
+    assert [update['client_fps'] for update in stats.updates] == [72, 90]
+    assert len(streamer.requests) == 2
+    assert len(stats.session.timestamps) == 1
+    streamer.close()
+
+
+def test_failed_handshake_is_reported():
+    streamer = StreamerStandIn([[]], status='404 Not Found')
+
+    with pytest.raises(WebSocketClosed):
+        WebSocket('127.0.0.1', streamer.port, EVENTS_PATH)
+    streamer.close()
+
+
+def test_stale_session_has_no_latest():
+    session = SessionStats()
+    assert session.latest() is None
+
+    session.add_summary({'client_fps': 72})
+    assert session.latest()['client_fps'] == 72
+    session.updated -= alvr_stats.STALE_AFTER + 1
+    assert session.latest() is None
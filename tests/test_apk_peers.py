@@ -0,0 +1,137 @@
+import json
+import os
+import socket
+import urllib.request
+
+import pytest
+
+from utils.apk_peers import PeerCache, parse_peer, sha256_file
+from utils.jobs import JobCancelled
+
+APK_SIZE = 300 * 1024
+
+
+@pytest.fixture
+def apk(tmp_path):
+    path = tmp_path / 'alvr_client_android.apk'
+    path.write_bytes(os.urandom(APK_SIZE))
+    return str(path), sha256_file(str(path))
+
+
+@pytest.fixture
+def companions():
+    # Starts PeerCache instances on loopback ports, without beacons unless asked for
+    started = []
+
+    def start(peers=(), beacon_port=0):
+        cache = PeerCache(port=0, peers=peers, beacon_port=beacon_port, beacon_address='127.0.0.1')
+        cache.start()
+        started.append(cache)
+        return cache
+    yield start
+    for cache in started:
+        cache.stop()
+
+
+def free_udp_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def test_apk_is_fetched_from_a_peer(companions, apk, tmp_path):
+    path, sha256 = apk
+    seeder = companions()
+    assert seeder.share(path, sha256)
+    leecher = companions(peers=[f'127.0.0.1:{seeder.port}'])
+    dest = str(tmp_path / 'fetched.apk')
+    progress = []
+
+    url = leecher.fetch(sha256, dest, progress.append)
+
+    assert url == f'http://127.0.0.1:{seeder.port}/apk/{sha256}'
+    with open(path, 'rb') as original, open(dest, 'rb') as fetched:
+        assert fetched.read() == original.read()
+    assert progress[-1] == 1.0 and progress == sorted(progress)
+    # The fetched copy can be shared on in turn
+    assert leecher.share(dest, sha256)
+    with urllib.request.urlopen(f'http://127.0.0.1:{leecher.port}/apks') as response:
+        assert json.load(response) == {sha256: APK_SIZE}
+
+
+def test_mismatching_content_is_rejected(companions, apk, tmp_path):
+    path, sha256 = apk
+    seeder = companions()
+    seeder.share(path, sha256)
+    # The shared file changes after it was verified, e.g. overwritten by a new download
+    with open(path, 'r+b') as f:
+        f.write(b'PK\x03\x04 not the same apk')
+    leecher = companions(peers=[f'127.0.0.1:{seeder.port}'])
+    dest = str(tmp_path / 'fetched.apk')
+
+    assert leecher.fetch(sha256, dest) is None
+    assert not os.path.exists(dest)
+    assert not os.path.exists(dest + '.part')
+
+
+def test_next_peer_is_tried_when_one_lacks_the_apk(companions, apk, tmp_path):
+    path, sha256 = apk
+    empty = companions()
+    seeder = companions()
+    seeder.share(path, sha256)
+    unreachable = socket.create_server(('127.0.0.1', 0))
+    unreachable_port = unreachable.getsockname()[1]
+    unreachable.close()
+    leecher = companions(peers=[f'127.0.0.1:{unreachable_port}', f'127.0.0.1:{empty.port}',
+                                f'127.0.0.1:{seeder.port}'])
+
+    assert leecher.fetch(sha256, str(tmp_path / 'fetched.apk')) == f'http://127.0.0.1:{seeder.port}/apk/{sha256}'
+    assert leecher.fetch('0' * 64, str(tmp_path / 'missing.apk')) is None
+
+
+def test_cancelled_fetch_leaves_no_partial_file(companions, apk, tmp_path):
+    path, sha256 = apk
+    seeder = companions()
+    seeder.share(path, sha256)
+    leecher = companions(peers=[f'127.0.0.1:{seeder.port}'])
+    dest = str(tmp_path / 'fetched.apk')
+
+    def cancel(fraction):
+        raise JobCancelled('cancelled')
+
+    with pytest.raises(JobCancelled):
+        leecher.fetch(sha256, dest, cancel)
+    assert not os.path.exists(dest) and not os.path.exists(dest + '.part')
+
+
+def test_share_refuses_a_wrong_hash(companions, apk):
+    path, sha256 = apk
+    cache = companions()
+
+    assert not cache.share(path, 'f' * 64)
+    assert cache.shared() == {}
+
+
+def test_beacons_announce_peers_and_own_ones_are_ignored(companions, apk, wait_until):
+    path, sha256 = apk
+    beacon_port = free_udp_port()
+    cache = companions(peers=['192.0.2.7'], beacon_port=beacon_port)
+
+    own = {'alvr_companion': cache.instance, 'port': cache.port, 'apks': [sha256]}
+    other = {'alvr_companion': 'another-instance', 'port': 18743, 'apks': [sha256, 'not-a-hash']}
+
+    def announce():
+        # Sent again until the listener is up; our own beacons come back on loopback as well
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            for beacon in (json.dumps(own).encode(), b'{"unrelated": true}', json.dumps(other).encode()):
+                sock.sendto(beacon, ('127.0.0.1', beacon_port))
+        return cache.peers(sha256)
+
+    assert wait_until(lambda: announce() == [('127.0.0.1', 18743), ('192.0.2.7', 8743)])
+    assert cache.peers('0' * 64) == [('192.0.2.7', 8743)]
+    assert ('127.0.0.1', cache.port) not in cache.peers()
+
+
+def test_parse_peer():
+    assert parse_peer('192.168.1.20') == ('192.168.1.20', 8743)
+    assert parse_peer('192.168.1.20:9000') == ('192.168.1.20', 9000)
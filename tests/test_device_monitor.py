@@ -0,0 +1,89 @@
+import json
+import os
+
+import pytest
+
+from utils.adb_command import adb_args, run_adb, server_for, set_route
+from utils.device_monitor import DeviceMonitor
+
+
+@pytest.fixture
+def two_servers(fake_adb):
+    # Four headsets spread over two PCs, every one authorized
+    scenario = fake_adb(devices=4, servers=2)
+    monitor = DeviceMonitor(servers=scenario['servers'])
+    events = []
+    monitor.add_listener(lambda event, serial, device_info: events.append((event, serial)))
+    monitor.events = events
+    yield scenario, monitor
+    monitor.pool.shutdown()
+    for serial in monitor.devices_info:
+        set_route(serial, None)
+
+
+def update_scenario(**changes):
+    # The fake adb reads its scenario on every call, so this takes servers down or unplugs headsets
+    path = os.environ['FAKE_ADB_SCENARIO']
+    with open(path) as f:
+        scenario = json.load(f)
+    scenario.update(changes)
+    with open(path, 'w') as f:
+        json.dump(scenario, f)
+
+
+def test_devices_of_every_server_are_aggregated(two_servers):
+    scenario, monitor = two_servers
+
+    monitor.poll_devices()
+
+    expected = {device['serial']: device['server'] for device in scenario['devices']}
+    assert {serial: info['ADB Server'] for serial, info in monitor.devices_info.items()} == expected
+    assert all(info['Authorized'] and info['Model'] for info in monitor.devices_info.values())
+    assert sorted(monitor.events) == sorted(('added', serial) for serial in expected)
+    assert len(set(expected.values())) == 2
+
+
+def test_per_serial_commands_reach_their_server(two_servers):
+    scenario, monitor = two_servers
+    first, second = scenario['servers']
+    monitor.poll_devices()
+    device = next(device for device in scenario['devices'] if device['server'] == second)
+    host, port = second.rsplit(':', 1)
+
+    assert server_for(device['serial']) == second
+    assert adb_args(['shell', 'true'], device['serial'])[:5] == ['adb', '-H', host, '-P', port]
+    assert run_adb(['shell', 'true'], device['serial'], capture_output=True).returncode == 0
+    # The other PC does not see the headset at all
+    assert run_adb(['shell', 'true'], device['serial'], server=first, capture_output=True).returncode != 0
+
+
+def test_devices_are_kept_while_their_server_is_unreachable(two_servers):
+    scenario, monitor = two_servers
+    first, second = scenario['servers']
+    monitor.poll_devices()
+    monitor.events.clear()
+
+    update_scenario(servers=[first])
+    monitor.poll_devices()
+
+    assert len(monitor.devices_info) == len(scenario['devices'])
+    assert monitor.events == []
+
+    update_scenario(servers=[first, second])
+    monitor.poll_devices()
+    assert monitor.events == []
+    assert {info['ADB Server'] for info in monitor.devices_info.values()} == {first, second}
+
+
+def test_devices_leave_when_their_server_answers_without_them(two_servers):
+    scenario, monitor = two_servers
+    second = scenario['servers'][1]
+    monitor.poll_devices()
+    monitor.events.clear()
+    gone = sorted(device['serial'] for device in scenario['devices'] if device['server'] == second)
+
+    update_scenario(devices=[device for device in scenario['devices'] if device['server'] != second])
+    monitor.poll_devices()
+
+    assert sorted(monitor.events) == [('removed', serial) for serial in gone]
+    assert all(server_for(serial) is None for serial in gone)
@@ -0,0 +1,105 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from utils.encoder_tuning import (BACKUP_SUFFIX, MIN_BITRATE_MBPS, apply_encoder_settings, has_backup,
+                                  recommend_encoder_settings, revert_encoder_settings)
+
+# Trimmed from a real ALVR session.json; the companion must not touch anything it does not tune
+SESSION = {
+    'server_version': '20.11.1',
+    'client_connections': {'1WMHH8': {'display_name': 'Quest 3', 'trusted': True}},
+    'session_settings': {
+        'video': {
+            'preferred_codec': {'variant': 'Hevc', 'H264': {}, 'Hevc': {}},
+            'bitrate': {
+                'mode': {'variant': 'Adaptive', 'ConstantMbps': 30, 'Adaptive': {'saturation_multiplier': 0.95}},
+                'adapt_to_framerate': {'enabled': False},
+            },
+            'transcoding_view_resolution': {'variant': 'Absolute', 'Absolute': {'width': 2144}, 'Scale': 1.0},
+            'foveated_encoding': {'enabled': True},
+        },
+        'audio': {'game_audio': {'enabled': True}},
+    },
+}
+
+
+@pytest.fixture
+def session_file(tmp_path):
+    path = tmp_path / 'alvr' / 'session.json'
+    path.parent.mkdir()
+    path.write_text(json.dumps(SESSION, indent=2))
+    return str(path)
+
+
+def load(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def test_recommendation_leaves_headroom_per_transport():
+    capabilities = {'max_bitrate_mbps': 200, 'preferred_codec': 'hevc'}
+
+    assert recommend_encoder_settings(capabilities, 200, 'usb') == {
+        'bitrate_mbps': 160, 'codec': 'hevc', 'resolution_scale': 1.0}
+    assert recommend_encoder_settings(capabilities, 200, 'wifi')['bitrate_mbps'] == 120
+    assert recommend_encoder_settings(capabilities)['bitrate_mbps'] == 200
+
+
+def test_slow_links_lower_the_resolution():
+    assert recommend_encoder_settings(None, 70, 'wifi') == {'bitrate_mbps': 40, 'codec': 'h264',
+                                                            'resolution_scale': 0.85}
+    assert recommend_encoder_settings({'max_resolution_scale': 0.8}, 40, 'wifi')['resolution_scale'] == 0.6
+    assert recommend_encoder_settings(None, 5, 'wifi')['bitrate_mbps'] == MIN_BITRATE_MBPS
+
+
+def test_apply_and_revert_round_trip(session_file):
+    with open(session_file, 'rb') as f:
+        original = f.read()
+
+    apply_encoder_settings({'codec': 'av1', 'bitrate_mbps': 120, 'resolution_scale': 0.85}, session_file)
+
+    video = load(session_file)['session_settings']['video']
+    assert video['preferred_codec'] == {'variant': 'AV1', 'H264': {}, 'Hevc': {}}
+    assert video['bitrate']['mode']['variant'] == 'ConstantMbps'
+    assert video['bitrate']['mode']['ConstantMbps'] == 120
+    assert video['bitrate']['mode']['Adaptive'] == {'saturation_multiplier': 0.95}
+    assert video['transcoding_view_resolution']['variant'] == 'Scale'
+    assert video['transcoding_view_resolution']['Absolute'] == {'width': 2144}
+    assert video['emulated_headset_view_resolution'] == {'variant': 'Scale', 'Scale': 0.85}
+    assert video['foveated_encoding'] == {'enabled': True}
+    assert load(session_file)['client_connections'] == SESSION['client_connections']
+    assert has_backup(session_file)
+    assert not os.path.exists(session_file + '.tmp')
+
+    # Tuning again must not replace the backup of the user's own settings
+    apply_encoder_settings({'codec': 'h264', 'bitrate_mbps': 60, 'resolution_scale': 1.0}, session_file)
+    revert_encoder_settings(session_file)
+
+    with open(session_file, 'rb') as f:
+        assert f.read() == original
+    assert not has_backup(session_file)
+    assert not os.path.exists(session_file + BACKUP_SUFFIX)
+
+
+def test_apply_fills_in_a_fresh_session(tmp_path):
+    session_file = tmp_path / 'session.json'
+    session_file.write_text('{}')
+
+    apply_encoder_settings({'codec': 'hevc', 'bitrate_mbps': 80, 'resolution_scale': 1.0}, str(session_file))
+
+    video = load(session_file)['session_settings']['video']
+    assert video['preferred_codec'] == {'variant': 'Hevc'}
+    assert video['bitrate']['mode'] == {'variant': 'ConstantMbps', 'ConstantMbps': 80}
+
+
+def test_session_file_follows_xdg_config_home(tmp_path):
+    env = dict(os.environ, XDG_CONFIG_HOME=str(tmp_path))
+    output = subprocess.check_output(
+        [sys.executable, '-c', 'from utils.encoder_tuning import SESSION_FILE; print(SESSION_FILE)'],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))), env=env, text=True)
+
+    assert output.strip() == str(tmp_path / 'alvr' / 'session.json')
@@ -0,0 +1,151 @@
+import asyncio
+import os
+import socket
+import threading
+import time
+
+import pytest
+import yaml
+
+from utils import lan_scan
+from utils.lan_scan import (A_AUTH, A_CNXN, A_VERSION, HEADER, KNOWN_HOST_TTL, MAX_PAYLOAD, KnownHosts, adb_message,
+                            is_adb_reply, mdns_services, probe, probe_all, scan)
+
+TIMEOUTS = {'connect_timeout': 0.3, 'handshake_timeout': 0.3}
+
+
+def cnxn_reply():
+    return adb_message(A_CNXN, A_VERSION, MAX_PAYLOAD, b'device::ro.product.model=Quest 3;\0')
+
+
+class Listener:
+    # A TCP port on loopback that answers each connection with `reply` (None: stays silent)
+    def __init__(self, reply, host='127.0.0.1'):
+        self.reply = reply
+        self.messages = []
+        self.server = socket.create_server((host, 0))
+        self.address = self.server.getsockname()
+        threading.Thread(target=self._serve, daemon=True).start()
+
+    def _serve(self):
+        while True:
+            try:
+                conn, _ = self.server.accept()
+            except OSError:
+                return
+            with conn:
+                conn.settimeout(2)
+                try:
+                    header = conn.recv(HEADER.size, socket.MSG_WAITALL)
+                    command, arg0, arg1, length, checksum, magic = HEADER.unpack(header)
+                    payload = conn.recv(length, socket.MSG_WAITALL)
+                    self.messages.append((command, arg0, arg1, checksum, magic, payload))
+                    if self.reply is not None:
+                        conn.sendall(self.reply)
+                    conn.recv(1)
+                except (OSError, ValueError):
+                    pass
+
+    def close(self):
+        self.server.close()
+
+
+@pytest.fixture
+def listeners():
+    started = []
+
+    def start(reply, host='127.0.0.1'):
+        listener = Listener(reply, host)
+        started.append(listener)
+        return listener
+    yield start
+    for listener in started:
+        listener.close()
+
+
+def closed_port():
+    with socket.create_server(('127.0.0.1', 0)) as sock:
+        return sock.getsockname()
+
+
+def test_probe_sends_cnxn_and_accepts_adb_replies(listeners):
+    headset = listeners(cnxn_reply())
+    locked = listeners(adb_message(A_AUTH, 1, 0, b'\0' * 20))
+
+    assert asyncio.run(probe(*headset.address, **TIMEOUTS))
+    assert asyncio.run(probe(*locked.address, **TIMEOUTS))
+    command, arg0, arg1, checksum, magic, payload = headset.messages[0]
+    assert (command, arg0, arg1, payload) == (A_CNXN, A_VERSION, MAX_PAYLOAD, b'host::\0')
+    assert checksum == sum(payload) and magic == A_CNXN ^ 0xffffffff
+
+
+def test_only_adb_speakers_are_found(listeners):
+    headset = listeners(cnxn_reply())
+    web_server = listeners(b'HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\n\r\n')
+    silent = listeners(None)
+    bad_magic = listeners(HEADER.pack(A_CNXN, A_VERSION, MAX_PAYLOAD, 0, 0, 0))
+    other_headset = listeners(cnxn_reply())
+    addresses = [web_server.address, other_headset.address, closed_port(), silent.address, bad_magic.address,
+                 headset.address]
+
+    found = asyncio.run(probe_all(addresses, concurrency=2, **TIMEOUTS))
+
+    assert found == [other_headset.address, headset.address]
+
+
+def test_scan_sweeps_subnets_and_known_hosts(listeners):
+    # 127.0.0.0/30 has the hosts 127.0.0.1 and 127.0.0.2; only the second one runs adb on this port
+    headset = listeners(cnxn_reply(), host='127.0.0.2')
+    port = headset.address[1]
+    known = listeners(cnxn_reply())
+
+    found = scan(['127.0.0.0/30'], port=port, known=[f'127.0.0.1:{known.address[1]}'], use_mdns=False,
+                 **TIMEOUTS)
+
+    assert found == [f'127.0.0.1:{known.address[1]}', f'127.0.0.2:{port}']
+
+
+def test_mdns_announcements_are_probed_first(listeners, fake_bin, monkeypatch):
+    headset = listeners(cnxn_reply())
+    fake_bin('adb', f'''
+print('List of discovered mdns services')
+print('adb-1WMHH8-Yq0lYZ\\t_adb-tls-connect._tcp.\\t127.0.0.1:{headset.address[1]}')
+print('adb-2G0YC5-8zVb1q\\t_adb-tls-pairing._tcp.\\t192.0.2.7:37211')
+''')
+    monkeypatch.setattr(lan_scan, 'local_subnets', lambda: [])
+
+    assert mdns_services() == [('127.0.0.1', headset.address[1]), ('192.0.2.7', 37211)]
+    assert scan(**TIMEOUTS) == [f'127.0.0.1:{headset.address[1]}']
+
+
+def test_is_adb_reply_checks_magic():
+    assert is_adb_reply(cnxn_reply()[:HEADER.size])
+    assert not is_adb_reply(HEADER.pack(A_CNXN, 0, 0, 0, 0, A_CNXN))
+    assert not is_adb_reply(adb_message(0x45534c43, 0, 0, b'')[:HEADER.size])
+
+
+def test_known_hosts_persist_and_expire(tmp_path):
+    path = tmp_path / 'lan_hosts.yaml'
+    now = time.time()
+    path.write_text(yaml.dump({'192.168.1.50:5555': now - 60, '192.168.1.51:5555': now - KNOWN_HOST_TTL - 60}))
+    hosts = KnownHosts(str(path))
+
+    assert hosts.addresses() == ['192.168.1.50:5555']
+    hosts.remember(['192.168.1.52:5555'])
+    assert sorted(yaml.safe_load(path.read_text())) == ['192.168.1.50:5555', '192.168.1.52:5555']
+    assert sorted(KnownHosts(str(path)).addresses()) == ['192.168.1.50:5555', '192.168.1.52:5555']
+
+
+def test_failed_save_keeps_the_known_hosts(tmp_path, monkeypatch):
+    path = tmp_path / 'lan_hosts.yaml'
+    KnownHosts(str(path)).remember(['192.168.1.50:5555'])
+
+    def fail_midway(data, stream):
+        stream.write('192.168.1.5')
+        raise OSError(28, 'No space left on device')
+    monkeypatch.setattr(lan_scan.yaml, 'dump', fail_midway)
+
+    with pytest.raises(OSError):
+        KnownHosts(str(path)).remember(['192.168.1.51:5555'])
+    assert KnownHosts(str(path)).addresses() == ['192.168.1.50:5555']
+    assert os.listdir(tmp_path) == ['lan_hosts.yaml']
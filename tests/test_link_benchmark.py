@@ -0,0 +1,87 @@
+import threading
+import time
+
+import pytest
+
+from utils.adb_command import ADB_COMMANDS_PER_SECOND, INTERACTIVE_RESERVE, MONITOR_RESERVE, rate_limiter, run_adb
+from utils.link_benchmark import (MIN_STREAM_MBPS, add_to_history, benchmark_device, measure_rtt, measure_throughput,
+                                  recommend_transport)
+
+MEGABYTE = 1024 * 1024
+
+
+@pytest.fixture
+def headset(fake_adb):
+    # USB behind a congested hub, and a faster Wi-Fi link
+    scenario = fake_adb(wifi=1, bandwidth_mbps=400, hub_bandwidth_mbps=60)
+    device = scenario['devices'][0]
+    wifi_serial = f"{device['wifi_ip']}:5555"
+    run_adb(['connect', wifi_serial], capture_output=True, check=True)
+    return {'usb': device['serial'], 'wifi': wifi_serial}
+
+
+def test_throughput_follows_the_simulated_bandwidth(fake_adb):
+    scenario = fake_adb(bandwidth_mbps=40)
+
+    push_mbps, pull_mbps = measure_throughput(scenario['devices'][0]['serial'], size=MEGABYTE)
+
+    # Process start-up only ever makes the measured rate lower than the link
+    assert 20 < push_mbps <= 40
+    assert 20 < pull_mbps <= 40
+
+
+def test_rtt_includes_the_device_round_trip(fake_adb):
+    scenario = fake_adb(latency_ms=20)
+
+    samples = measure_rtt(scenario['devices'][0]['serial'], count=3)
+
+    assert len(samples) == 3
+    assert all(sample >= 20 for sample in samples)
+
+
+def test_rtt_leaves_out_the_rate_limit(fake_adb):
+    scenario = fake_adb(latency_ms=5)
+    # The app's real cap, from a job thread: 21 round trips outrun the bucket and wait for tokens
+    rate_limiter.set_rate(ADB_COMMANDS_PER_SECOND, reserve=INTERACTIVE_RESERVE, monitor_reserve=MONITOR_RESERVE)
+    samples = []
+    started = time.monotonic()
+    thread = threading.Thread(target=lambda: samples.extend(measure_rtt(scenario['devices'][0]['serial'],
+                                                                        count=20)))
+    thread.start()
+    thread.join()
+
+    assert time.monotonic() - started > 1
+    assert len(samples) == 20
+    assert max(samples) < 5 + 40
+
+
+def test_benchmark_recommends_the_faster_transport(headset):
+    results = benchmark_device(headset)
+
+    assert [result['transport'] for result in results] == ['usb', 'wifi']
+    assert all('error' not in result for result in results)
+    usb, wifi = results
+    assert usb['push_mbps'] <= 60 < wifi['push_mbps']
+    recommendation = recommend_transport(results)
+    assert recommendation['transport'] == 'wifi'
+    assert recommendation['sufficient'] == (recommendation['throughput_mbps'] >= MIN_STREAM_MBPS)
+
+
+def test_unreachable_transport_is_reported_not_raised(fake_adb):
+    scenario = fake_adb(wifi=1)
+    device = scenario['devices'][0]
+
+    results = benchmark_device({'usb': None, 'wifi': f"{device['wifi_ip']}:5555"})
+
+    assert len(results) == 1
+    assert results[0]['transport'] == 'wifi' and 'error' in results[0]
+    assert recommend_transport(results) is None
+
+
+def test_history_keeps_the_latest_results():
+    history = add_to_history(None, [{'transport': 'usb', 'push_mbps': 300, 'pull_mbps': 280, 'rtt_ms': 1}])
+    history = add_to_history(history, [{'transport': 'usb', 'push_mbps': 20, 'pull_mbps': 25, 'rtt_ms': 1},
+                                       {'transport': 'wifi', 'error': 'device offline'}], limit=2)
+
+    assert len(history) == 2
+    assert recommend_transport(history) == {'transport': 'usb', 'throughput_mbps': 20, 'sufficient': False}
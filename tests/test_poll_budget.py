@@ -0,0 +1,91 @@
+import threading
+import time
+
+from utils.adb_command import adb_lane, is_interactive, set_monitor_lane
+from utils.device_monitor import DeviceMonitor
+from utils.jobs import PRIORITY_HIGH, PRIORITY_LOW, JobScheduler
+from utils.poll_budget import LANE_BACKGROUND, LANE_INTERACTIVE, LANE_MONITOR, AdbRateLimiter
+
+
+def test_background_leaves_the_reserve_for_user_actions():
+    limiter = AdbRateLimiter(10, reserve=3)
+
+    assert sum(limiter.try_acquire() for _ in range(10)) == 7
+    assert not limiter.can_acquire()
+    assert limiter.try_acquire(lane=LANE_INTERACTIVE)
+
+
+def test_oversized_background_request_passes_on_a_full_bucket():
+    limiter = AdbRateLimiter(10, reserve=3)
+
+    assert limiter.try_acquire(20)
+    assert not limiter.try_acquire(lane=LANE_INTERACTIVE)
+
+
+def test_high_priority_jobs_and_the_ui_thread_are_interactive():
+    scheduler = JobScheduler()
+    try:
+        user = scheduler.submit('user', is_interactive, priority=PRIORITY_HIGH)
+        automation = scheduler.submit('automation', is_interactive, priority=PRIORITY_LOW)
+        assert user.wait(5) is True
+        assert automation.wait(5) is False
+    finally:
+        scheduler.stop()
+
+    lanes = []
+    thread = threading.Thread(target=lambda: lanes.append(is_interactive()))
+    thread.start()
+    thread.join()
+    assert is_interactive() and lanes == [False]
+
+
+def test_monitor_lane_sits_between_background_and_user_actions():
+    limiter = AdbRateLimiter(10, reserve=3, monitor_reserve=3)
+
+    assert sum(limiter.try_acquire() for _ in range(10)) == 4
+    assert sum(limiter.try_acquire(lane=LANE_MONITOR) for _ in range(10)) == 3
+    assert limiter.try_acquire(lane=LANE_INTERACTIVE)
+
+
+def test_monitor_is_not_starved_by_queued_background_jobs():
+    limiter = AdbRateLimiter(20, reserve=3, monitor_reserve=3)
+    stop = threading.Event()
+
+    def background():
+        while not stop.is_set():
+            limiter.acquire(timeout=0.5)
+    threads = [threading.Thread(target=background) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    try:
+        time.sleep(0.2)
+        started = time.monotonic()
+        # Twenty monitor polls at 20 tokens/s, while four threads keep taking whatever they may
+        assert all(limiter.acquire(lane=LANE_MONITOR, timeout=2) for _ in range(20))
+        assert time.monotonic() - started < 2
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+
+def test_monitor_threads_use_the_monitor_lane():
+    lanes = []
+
+    def monitor_thread():
+        lanes.append(adb_lane())
+        set_monitor_lane()
+        lanes.append(adb_lane())
+    thread = threading.Thread(target=monitor_thread)
+    thread.start()
+    thread.join()
+    assert lanes == [LANE_BACKGROUND, LANE_MONITOR]
+
+
+def test_info_polls_stretch_with_the_number_of_headsets():
+    monitor = DeviceMonitor()
+    monitor.budget = AdbRateLimiter(10)
+
+    assert monitor._spread(5, 4) == 5
+    # Fifty headsets cost 50 commands per info poll, which gets 5 of the 10 per second
+    assert monitor._spread(5, 50) == 10
@@ -0,0 +1,62 @@
+import json
+import socket
+import threading
+import time
+
+import pytest
+
+from utils.rpc_server import METHOD_NOT_FOUND, RpcError, RpcServer, rpc_call
+
+PAYLOAD = 'x' * 64 * 1024
+
+
+@pytest.fixture
+def server(tmp_path):
+    server = RpcServer({'devices.subscribe': lambda: True, 'echo': lambda text: text}, str(tmp_path / 'rpc.sock'),
+                       send_queue_size=8)
+    server.start()
+    yield server
+    server.stop()
+
+
+def subscribe(server):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(server.path)
+    sock.sendall(b'{"jsonrpc": "2.0", "id": 1, "method": "devices.subscribe"}\n')
+    lines = sock.makefile('r', encoding='utf-8')
+    assert json.loads(lines.readline())['result'] is True
+    return sock, lines
+
+
+def test_calls_and_errors(server):
+    assert rpc_call('echo', {'text': 'hello'}, server.path, timeout=5) == 'hello'
+    with pytest.raises(RpcError) as error:
+        rpc_call('devices.remove', path=server.path, timeout=5)
+    assert error.value.code == METHOD_NOT_FOUND
+
+
+def test_subscriber_that_never_reads_is_dropped(server, wait_until):
+    stuck, _ = subscribe(server)
+    reader, reader_lines = subscribe(server)
+    received = []
+
+    def read():
+        for line in reader_lines:
+            received.append(json.loads(line)['params']['index'])
+    threading.Thread(target=read, daemon=True).start()
+
+    for index in range(50):
+        started = time.monotonic()
+        server.notify('devices.changed', {'index': index, 'padding': PAYLOAD})
+        assert time.monotonic() - started < 0.5
+        assert wait_until(lambda: len(received) == index + 1)
+
+    assert received == list(range(50))
+    with server.lock:
+        assert len(server.connections) == 1
+    # The stuck client finds its connection closed once it drains what was sent before
+    stuck.settimeout(5)
+    while stuck.recv(1024 * 1024):
+        pass
+    stuck.close()
+    reader.close()
@@ -0,0 +1,132 @@
+import threading
+
+import pytest
+
+from utils.scrcpy import ScrcpyManager, ScrcpySession, build_scrcpy_command
+
+# Prints what a real scrcpy prints while mirroring, then keeps running until it is terminated
+FAKE_SCRCPY = '''
+import os, sys, time
+with open(os.environ['FAKE_SCRCPY_LOG'], 'a') as f:
+    f.write(' '.join(sys.argv[1:]) + '\\n')
+print('INFO: Renderer: opengl', flush=True)
+print('ERROR: Could not open audio device', flush=True)
+print('INFO: 59.8 fps', flush=True)
+print('INFO: 72 fps', flush=True)
+time.sleep(60)
+'''
+
+
+@pytest.fixture
+def scrcpy_log(tmp_path, fake_bin, monkeypatch):
+    log = tmp_path / 'scrcpy.log'
+    monkeypatch.setenv('FAKE_SCRCPY_LOG', str(log))
+    fake_bin('scrcpy', FAKE_SCRCPY)
+    return log
+
+
+@pytest.fixture
+def manager():
+    updates = []
+    manager = ScrcpyManager(on_update=updates.append)
+    manager.updates = updates
+    yield manager
+    manager.stop_all()
+
+
+def launches(log):
+    return log.read_text().splitlines() if log.exists() else []
+
+
+def test_build_command_applies_profile_and_crop():
+    command = build_scrcpy_command('1WMHH8', {'max_size': 1832, 'max_fps': 72, 'no_audio': True, 'unknown': 1},
+                                   '1600:900:2017:510', 'title')
+    assert command[:4] == ['scrcpy', '-s', '1WMHH8', '--print-fps']
+    assert '--max-size=1832' in command
+    assert '--max-fps=72' in command
+    assert '--no-audio' in command
+    assert command[command.index('--crop') + 1] == '1600:900:2017:510'
+    assert command[command.index('--window-title') + 1] == 'title'
+
+
+def test_session_parses_fps_and_errors(scrcpy_log, manager, wait_until):
+    session = manager.start('1WMHH8', {'max_fps': 72})
+
+    assert wait_until(lambda: session.fps == 72.0)
+    assert list(session.errors) == ['Could not open audio device']
+    assert manager.updates and all(update is session for update in manager.updates)
+    assert launches(scrcpy_log) == [' '.join(session.command[1:])]
+
+
+def test_second_start_focuses_running_session(scrcpy_log, manager, wait_until, monkeypatch):
+    focused = []
+    monkeypatch.setattr(ScrcpySession, 'focus', lambda session: focused.append(session))
+
+    first = manager.start('1WMHH8')
+    second = manager.start('1WMHH8')
+
+    assert second is first
+    assert focused == [first]
+    assert wait_until(lambda: len(launches(scrcpy_log)) == 1)
+    assert len(launches(scrcpy_log)) == 1
+
+
+def test_concurrent_starts_launch_one_session(scrcpy_log, manager, wait_until, monkeypatch):
+    # The UI thread and an RPC job asking for the same mirror at once
+    monkeypatch.setattr(ScrcpySession, 'focus', lambda session: None)
+    barrier = threading.Barrier(4)
+    sessions = []
+
+    def start():
+        barrier.wait()
+        sessions.append(manager.start('1WMHH8'))
+    threads = [threading.Thread(target=start) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert all(session is sessions[0] for session in sessions)
+    assert wait_until(lambda: len(launches(scrcpy_log)) == 1)
+    assert len(launches(scrcpy_log)) == 1
+
+
+def test_sessions_are_per_device(scrcpy_log, manager, wait_until):
+    first = manager.start('1WMHH8')
+    second = manager.start('2G0YC5')
+
+    assert first is not second
+    assert wait_until(lambda: len(launches(scrcpy_log)) == 2)
+
+
+def test_stop_terminates_and_clears_fps(scrcpy_log, manager, wait_until):
+    session = manager.start('1WMHH8')
+    assert wait_until(lambda: session.fps is not None)
+
+    manager.stop('1WMHH8')
+
+    assert not session.is_running()
+    assert manager.get('1WMHH8') is None
+    assert wait_until(lambda: session.fps is None)
+    assert manager.updates[-1] is session
+
+
+def test_start_after_exit_launches_new_session(scrcpy_log, manager, wait_until):
+    first = manager.start('1WMHH8')
+    assert wait_until(lambda: len(launches(scrcpy_log)) == 1)
+    first.stop()
+
+    second = manager.start('1WMHH8')
+
+    assert second is not first
+    assert second.is_running()
+    assert wait_until(lambda: len(launches(scrcpy_log)) == 2)
+
+
+def test_stop_all(scrcpy_log, manager):
+    sessions = [manager.start(serial) for serial in ('1WMHH8', '2G0YC5')]
+
+    manager.stop_all()
+
+    assert not any(session.is_running() for session in sessions)
+    assert manager.sessions == {}
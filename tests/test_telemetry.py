@@ -0,0 +1,26 @@
+from utils.telemetry import BUCKET_SECONDS, TelemetryHistory
+
+START = 1_700_000_000 // BUCKET_SECONDS * BUCKET_SECONDS
+
+
+def test_fast_polls_are_averaged_per_minute():
+    history = TelemetryHistory()
+    for index in range(24):
+        history.add(100 - index, 30.0, False, START + index * 5)
+    # The second minute is still open until a sample from the third one arrives
+    history.add(50, 30.0, True, START + 2 * BUCKET_SECONDS)
+
+    assert len(history.raw) == 25
+    assert history.long_term.timestamps.values() == [START, START + BUCKET_SECONDS]
+    assert history.long_term.battery.values() == [94.5, 82.5]
+    assert history.long_term.charging.values() == [False, False]
+
+
+def test_slow_polls_keep_their_wall_clock_spacing():
+    history = TelemetryHistory()
+    for index in range(5):
+        history.add(90 - index, None, False, START + index * 300)
+
+    assert history.long_term.timestamps.values() == [START + index * 300 for index in range(4)]
+    assert history.long_term.span() == history.raw.span() - 300
+    assert history.drain_rate() is None
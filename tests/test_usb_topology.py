@@ -0,0 +1,132 @@
+import subprocess
+import threading
+
+import pytest
+
+from utils.adb_command import run_adb
+from utils.jobs import JobScheduler
+from utils.usb_topology import (INITIAL_GROUP_LIMIT, TransferThrottle, UsbTopology, parse_usb_paths,
+                                upstream_port)
+
+MEGABYTE = 1024 * 1024
+
+
+@pytest.fixture
+def shared_hubs(fake_adb):
+    # Four headsets, two per hub, the first one also on Wi-Fi
+    scenario = fake_adb(devices=4, devices_per_hub=2, wifi=1, bandwidth_mbps=400, hub_bandwidth_mbps=40,
+                        hub_contention=0)
+    device = scenario['devices'][0]
+    run_adb(['connect', f"{device['wifi_ip']}:5555"], capture_output=True, check=True)
+    return [device['serial'] for device in scenario['devices']]
+
+
+def test_parse_usb_paths():
+    output = ('List of devices attached\n'
+              '1WMHH8\tdevice usb:1-1.2 product:eureka model:Quest_3 device:eureka transport_id:3\n'
+              '192.168.1.50:5555\tdevice product:eureka model:Quest_3 device:eureka transport_id:4\n'
+              '2G0YC5\tunauthorized usb:3-2 transport_id:5\n\n')
+
+    assert parse_usb_paths(output) == {'1WMHH8': '1-1.2', '2G0YC5': '3-2'}
+    assert upstream_port('1-1.2') == '1-1'
+    assert upstream_port('1-1.2.4') == '1-1.2'
+    assert upstream_port('3-2') == '3'
+
+
+def test_headsets_on_one_hub_share_a_group(shared_hubs):
+    topology = UsbTopology()
+    topology.refresh()
+
+    groups = [topology.group(serial) for serial in shared_hubs]
+    assert groups == ['usb:1-1', 'usb:1-1', 'usb:1-2', 'usb:1-2']
+    assert topology.group('192.168.50.10:5555') is None
+    assert topology.group('not-plugged-in') is None
+
+
+def test_groups_are_per_adb_server(fake_adb):
+    scenario = fake_adb(devices=4, devices_per_hub=4, servers=2)
+    serials = {device['server']: [] for device in scenario['devices']}
+    for device in scenario['devices']:
+        serials[device['server']].append(device['serial'])
+    first, second = scenario['servers']
+
+    topology = UsbTopology()
+    topology.refresh(first)
+    topology.refresh(second)
+    # Both PCs number their buses alike, but their hubs are not the same
+    assert {topology.group(serial) for serial in serials[first]} == {f'usb:{first}/1-1'}
+    assert {topology.group(serial) for serial in serials[second]} == {f'usb:{second}/1-1'}
+
+    # Refreshing one server leaves what the other one reported
+    topology.refresh(first)
+    assert topology.group(serials[second][0]) == f'usb:{second}/1-1'
+
+
+def test_measured_transfers_behind_a_shared_hub(shared_hubs, tmp_path):
+    payload = tmp_path / 'payload.bin'
+    payload.write_bytes(b'\0' * MEGABYTE)
+    topology = UsbTopology()
+    topology.refresh()
+    throttle = TransferThrottle()
+    group = topology.group(shared_hubs[0])
+
+    def push(serial):
+        with throttle.measure(group, MEGABYTE):
+            run_adb(['push', str(payload), '/data/local/tmp/payload.bin'], serial,
+                    stdout=subprocess.DEVNULL, check=True)
+    threads = [threading.Thread(target=push, args=(serial,)) for serial in shared_hubs[:2]]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # Both pushes split the 40 Mbit/s hub, so together they get about that much
+    aggregate = throttle.throughput[group][2]
+    assert 0.5 * 40e6 / 8 < aggregate <= 1.05 * 40e6 / 8
+    assert throttle.running[group] == 0
+    # With nothing to compare against yet the throttle probes one more parallel transfer
+    assert throttle.limit(group) == INITIAL_GROUP_LIMIT + 1
+    assert throttle.limit(None) is None
+
+
+def test_scheduler_limits_transfers_per_hub(shared_hubs):
+    topology = UsbTopology()
+    topology.refresh()
+    throttle = TransferThrottle(initial=1)
+    scheduler = JobScheduler(group_limit=throttle.limit)
+    running, peaks = {}, {}
+    lock = threading.Lock()
+
+    def transfer(serial):
+        group = topology.group(serial)
+        with lock:
+            running[group] = running.get(group, 0) + 1
+            peaks[group] = max(peaks.get(group, 0), running[group])
+        run_adb(['shell', 'true'], serial, check=True)
+        with lock:
+            running[group] -= 1
+
+    try:
+        jobs = [scheduler.submit(('transfer', serial), transfer, serial, group=topology.group(serial))
+                for serial in shared_hubs]
+        for job in jobs:
+            job.wait(10)
+    finally:
+        scheduler.stop()
+    assert peaks == {'usb:1-1': 1, 'usb:1-2': 1}
+
+
+def test_throttle_climbs_while_parallel_transfers_pay_off():
+    throttle = TransferThrottle(initial=2, maximum=4)
+
+    throttle.record('usb:1-1', 30, 1)
+    throttle.record('usb:1-1', 50, 2)
+    assert throttle.limit('usb:1-1') == 3
+
+    # A third transfer that barely helps keeps the limit; once it drags the group down the limit backs off
+    throttle.record('usb:1-1', 52, 3)
+    assert throttle.limit('usb:1-1') == 3
+    throttle.record('usb:1-1', 20, 3)
+    assert throttle.throughput['usb:1-1'][3] == 36
+    assert throttle.limit('usb:1-1') == 2
+    assert throttle.snapshot() == {'usb:1-1': 2}
@@ -0,0 +1,62 @@
+import os
+import threading
+
+import pytest
+import yaml
+
+from utils import user_config
+from utils.user_config import UserConfig
+
+
+@pytest.fixture
+def config_path(tmp_path):
+    return str(tmp_path / 'ALVR-Companion' / 'config.yaml')
+
+
+def test_settings_round_trip_and_wifi_serials_resolve(config_path):
+    config = UserConfig(config_path)
+    config.set('1WMHH8', 'wifi_serial', '192.168.1.50:5555')
+    config.set('192.168.1.50:5555', 'use_crop', True)
+
+    reloaded = UserConfig(config_path)
+    assert reloaded.get('1WMHH8', 'use_crop') is True
+    assert reloaded.get_device_unique_id('192.168.1.50:5555') == '1WMHH8'
+    assert not reloaded.set('192.168.1.99:5555', 'use_crop', True)
+    assert reloaded.get('2G0YC5', 'use_crop', 'default') == 'default'
+
+
+def test_concurrent_sets_are_all_saved(config_path):
+    config = UserConfig(config_path)
+
+    def write(index):
+        for step in range(20):
+            config.set(f'HEADSET{index}', f'setting{step}', step)
+            # Iterating while other threads write must not break
+            for device_config in config.devices().values():
+                len(device_config)
+    threads = [threading.Thread(target=write, args=(index,)) for index in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    with open(config_path, encoding='utf-8') as f:
+        saved = yaml.safe_load(f)
+    assert len(saved['devices']) == 8
+    assert all(len(device_config) == 20 for device_config in saved['devices'].values())
+    assert os.listdir(os.path.dirname(config_path)) == ['config.yaml']
+
+
+def test_failed_save_keeps_the_previous_file(config_path, monkeypatch):
+    config = UserConfig(config_path)
+    config.set('1WMHH8', 'use_crop', True)
+
+    def fail_midway(data, stream):
+        stream.write('devices:\n  1WMHH8:\n')
+        raise OSError(28, 'No space left on device')
+    monkeypatch.setattr(user_config.yaml, 'dump', fail_midway)
+
+    with pytest.raises(OSError):
+        config.set('1WMHH8', 'use_crop', False)
+    assert UserConfig(config_path).get('1WMHH8', 'use_crop') is True
+    assert os.listdir(os.path.dirname(config_path)) == ['config.yaml']
@@ -1,77 +1,77 @@
-import subprocess
+import re
+
+from utils.adb_command import check_output_adb
+from utils.adb_shell import get_shell, shell_output
 
 APK_PACKAGE_NAME = 'alvr.client.stable'
 
-def get_device_info(device_serial):
-    try:
-        device_info = {}
+DEVICE_INFO_QUERIES = {
+    'Model': 'getprop ro.product.model',
+    'Manufacturer': 'getprop ro.product.manufacturer',
+    'Android Version': 'getprop ro.build.version.release',
+    'Build Version': 'getprop ro.build.display.id',
+    'Serial Number': 'getprop ro.serialno',
+    'package': f'dumpsys package {APK_PACKAGE_NAME} | grep -m 1 versionName=',
+    'battery': 'dumpsys battery',
+}
+
+IP_SERIAL_PATTERN = re.compile(r'^\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}:\d+$')
+
+CHARGING_STATUS = {
+    '2': 'Charging',
+    '3': 'Discharging',
+    '4': 'Not Charging',
+    '5': 'Full',
+}
 
-        # Get model
-        model = subprocess.check_output(
-            ['adb', '-s', device_serial, 'shell', 'getprop', 'ro.product.model'], text=True).strip()
-        device_info['Model'] = model
+def is_ip_value(value):
+    return IP_SERIAL_PATTERN.match(value)
 
-        # Get manufacturer
-        manufacturer = subprocess.check_output(
-            ['adb', '-s', device_serial, 'shell', 'getprop', 'ro.product.manufacturer'], text=True).strip()
-        device_info['Manufacturer'] = manufacturer
+def list_devices(server=None):
+    # (serial, state) pairs from `adb devices`, e.g. ('1WMHH8', 'device') or ('1WMHH8', 'unauthorized')
+    output = check_output_adb(['devices'], server=server, text=True)
+    devices = []
+    for line in output.strip().split('\n')[1:]:  # Skip the "List of devices attached" header
+        if '\t' in line:
+            serial, state = line.split('\t', 1)
+            devices.append((serial, state.strip()))
+    return devices
 
-        # Get Android version
-        android_version = subprocess.check_output(
-            ['adb', '-s', device_serial, 'shell', 'getprop', 'ro.build.version.release'], text=True).strip()
-        device_info['Android Version'] = android_version
+def get_device_info(device_serial):
+    try:
+        device_info = {}
 
-        # Get build version
-        build_version = subprocess.check_output(
-            ['adb', '-s', device_serial, 'shell', 'getprop', 'ro.build.display.id'], text=True).strip()
-        device_info['Build Version'] = build_version
+        # All queries share the device's persistent shell and a single round trip
+        sections = get_shell(device_serial).run_sections(DEVICE_INFO_QUERIES)
+        for key in ('Model', 'Manufacturer', 'Android Version', 'Build Version', 'Serial Number'):
+            device_info[key] = sections.get(key, '').strip()
 
-        # Get serial number (можно также использовать переданный device_serial)
-        serial_number = subprocess.check_output(['adb', '-s', device_serial, 'shell', 'getprop', 'ro.serialno'], text=True).strip()
-        device_info['Serial Number'] = serial_number
-        
-        package_info = subprocess.run(
-            ['adb', '-s', device_serial, 'shell', 'dumpsys', 'package', APK_PACKAGE_NAME],
-            stdout=subprocess.PIPE, text=True, check=True
-        ).stdout
-        
         version_installed = None
-        for line in package_info.splitlines():
+        for line in sections.get('package', '').splitlines():
             if 'versionName=' in line:
                 version_installed = line.strip().split('versionName=')[1]
                 break
-        if version_installed:
-            device_info['ALVR Version'] = version_installed
-        else:
-            device_info['ALVR Version'] = None
-            
+        device_info['ALVR Version'] = version_installed
+
         # Get battery level
-        battery_info = subprocess.check_output(
-            ['adb', '-s', device_serial, 'shell', 'dumpsys', 'battery'], text=True).strip()
-        
         status_code = None
-        for line in battery_info.splitlines():
+        for line in sections.get('battery', '').splitlines():
             if 'level:' in line:
                 device_info['Battery Level'] = line.strip().split('level:')[1].strip()
             if 'status:' in line:
                 status_code = line.strip().split('status:')[1].strip()
-            if status_code == '2':
-                device_info['Charging Status'] = 'Charging'
-            elif status_code == '3':
-                device_info['Charging Status'] = 'Discharging'
-            elif status_code == '4':
-                device_info['Charging Status'] = 'Not Charging'
-            elif status_code == '5':
-                device_info['Charging Status'] = 'Full'
-            else:
-                device_info['Charging Status'] = 'Unknown'
-
-        # print('Device Info:\n' + '\n'.join(
-        #     [f"{key}: {value}" for key, value in device_info.items()]))
+            if 'temperature:' in line:
+                # Reported in tenths of a degree Celsius
+                device_info['Temperature'] = int(line.strip().split('temperature:')[1]) / 10
+        device_info['Charging Status'] = CHARGING_STATUS.get(status_code, 'Unknown')
 
         return device_info
 
     except Exception as e:
         print(f"Device Info: Error fetching info: {e}")
 
-        return None
\ No newline at end of file
+        return None
+
+def get_wifi_ip(device_serial):
+    output = shell_output(device_serial, 'ip addr show wlan0')
+    return next((line.split()[1].split('/')[0] for line in output.split('\n') if 'inet ' in line), None)
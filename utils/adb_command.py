@@ -0,0 +1,140 @@
+import os
+import subprocess
+import threading
+import time
+from contextlib import contextmanager
+
+from utils.jobs import PRIORITY_HIGH, current_job
+from utils.metrics import metrics
+from utils.poll_budget import LANE_BACKGROUND, LANE_INTERACTIVE, LANE_MONITOR, AdbRateLimiter
+
+# App-wide cap: every adb process and every command sent to a persistent shell takes a token
+ADB_COMMANDS_PER_SECOND = 10
+# Tokens that polling and background jobs leave for user actions
+INTERACTIVE_RESERVE = 3
+# Tokens that background jobs leave for the device monitor's polls
+MONITOR_RESERVE = 3
+rate_limiter = AdbRateLimiter(ADB_COMMANDS_PER_SECOND, reserve=INTERACTIVE_RESERVE, monitor_reserve=MONITOR_RESERVE)
+_thread_state = threading.local()
+
+# Device serial -> 'host:port' of the adb server it was seen on; serials without a route, and
+# server=None, use the default server (adb's own default, or $ADB_SERVER_SOCKET)
+_routes = {}
+_routes_lock = threading.Lock()
+
+
+def parse_server(address):
+    # 'host:port', 'tcp:host:port' (the $ADB_SERVER_SOCKET form) or a bare port -> 'host:port'
+    if address.startswith('tcp:'):
+        address = address[len('tcp:'):]
+    host, _, port = address.rpartition(':')
+    if not port.isdigit():
+        raise ValueError(f'Invalid adb server address: {address}')
+    return f"{host or 'localhost'}:{port}"
+
+
+def set_route(device_serial, server):
+    with _routes_lock:
+        if server is None:
+            _routes.pop(device_serial, None)
+        else:
+            _routes[device_serial] = server
+
+
+def server_for(device_serial):
+    with _routes_lock:
+        return _routes.get(device_serial)
+
+
+def server_env(device_serial):
+    # Environment for tools that run adb themselves, e.g. scrcpy, so they reach the same server
+    server = server_for(device_serial)
+    if server is None:
+        return None
+    return dict(os.environ, ADB_SERVER_SOCKET=f'tcp:{server}')
+
+
+def is_interactive():
+    # User actions run as high-priority jobs, or directly on the UI thread
+    job = current_job()
+    if job is not None:
+        return job.priority >= PRIORITY_HIGH
+    return threading.current_thread() is threading.main_thread()
+
+
+def set_monitor_lane():
+    # Marks the calling thread as one of the device monitor's, whose polls draw on their own reserve
+    _thread_state.monitor = True
+
+
+def adb_lane():
+    if is_interactive():
+        return LANE_INTERACTIVE
+    if getattr(_thread_state, 'monitor', False):
+        return LANE_MONITOR
+    return LANE_BACKGROUND
+
+
+def acquire_adb(cost=1):
+    # Blocks until the app-wide budget allows `cost` more adb round trips
+    prepaid = getattr(_thread_state, 'prepaid', 0)
+    if prepaid >= cost:
+        _thread_state.prepaid = prepaid - cost
+        return
+    rate_limiter.acquire(cost, lane=adb_lane())
+
+
+@contextmanager
+def prepaid_adb(cost=1):
+    # Takes the tokens for the next `cost` adb calls of this thread up front, so timing a block measures the
+    # device and not the wait for the budget
+    acquire_adb(cost)
+    _thread_state.prepaid = cost
+    try:
+        yield
+    finally:
+        _thread_state.prepaid = 0
+
+
+def adb_args(args, device_serial=None, server=None):
+    if server is None and device_serial is not None:
+        server = server_for(device_serial)
+    command = ['adb']
+    if server is not None:
+        host, port = server.rsplit(':', 1)
+        command += ['-H', host, '-P', port]
+    if device_serial is not None:
+        command += ['-s', device_serial]
+    return command + list(args)
+
+
+def run_adb(args, device_serial=None, server=None, **kwargs):
+    # Every short-lived adb call goes through here so it is rate limited, counted and timed per device
+    acquire_adb()
+    start = time.perf_counter()
+    failed = timed_out = False
+    try:
+        result = subprocess.run(adb_args(args, device_serial, server), **kwargs)
+        failed = result.returncode != 0
+        return result
+    except subprocess.TimeoutExpired:
+        failed = timed_out = True
+        raise
+    except Exception:
+        failed = True
+        raise
+    finally:
+        metrics.record(args[0], device_serial, time.perf_counter() - start, failed, timed_out)
+
+
+def check_output_adb(args, device_serial=None, server=None, **kwargs):
+    acquire_adb()
+    with metrics.timed(args[0], device_serial):
+        return subprocess.check_output(adb_args(args, device_serial, server), **kwargs)
+
+
+def popen_adb(args, device_serial=None, server=None, **kwargs):
+    # Long-lived processes (shell sessions, logcat, installs) are counted when they are spawned
+    acquire_adb()
+    with metrics.timed(f'{args[0]}:spawn', device_serial):
+        return subprocess.Popen(adb_args(args, device_serial, server), **kwargs)
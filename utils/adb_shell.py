@@ -0,0 +1,132 @@
+import queue
+import subprocess
+import threading
+import uuid
+
+from utils.adb_command import acquire_adb, popen_adb
+from utils.metrics import metrics
+
+
+class AdbShellError(Exception):
+    pass
+
+
+class AdbShellTimeout(AdbShellError, TimeoutError):
+    pass
+
+
+class AdbShell:
+    # One long-lived `adb shell`; each command's output ends with a unique sentinel line
+    def __init__(self, device_serial):
+        self.device_serial = device_serial
+        self.sentinel = f'__ALVR_COMPANION_{uuid.uuid4().hex}__'
+        self.section_marker = f'__ALVR_SECTION_{uuid.uuid4().hex}__'
+        self.process = None
+        self.lines = queue.Queue()
+        self.lock = threading.Lock()
+
+    def start(self):
+        self.process = popen_adb(['shell'], self.device_serial,
+                                 stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                 stderr=subprocess.STDOUT, text=True, bufsize=1)
+        threading.Thread(target=self._read_output, args=(self.process, self.lines), daemon=True).start()
+
+    def _read_output(self, process, lines):
+        for line in process.stdout:
+            lines.put(line)
+        lines.put(None)
+
+    def is_alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def run(self, command, timeout=10, retries=1):
+        # A dropped transport kills the shell; reconnect and replay the command once
+        for attempt in range(retries + 1):
+            acquire_adb()
+            try:
+                with metrics.timed('shell:session', self.device_serial):
+                    return self._run(command, timeout)
+            except AdbShellError:
+                if attempt == retries:
+                    raise
+
+    def run_sections(self, commands, timeout=10):
+        # Several queries in one round trip: {name: command} -> {name: output}
+        marker = self.section_marker
+        script = '\n'.join(f'echo "{marker}{name}"; {command}' for name, command in commands.items())
+        output, _ = self.run(script, timeout)
+        sections = {}
+        name = None
+        for line in output.splitlines():
+            if line.startswith(marker):
+                name = line[len(marker):]
+                sections[name] = []
+            elif name is not None:
+                sections[name].append(line)
+        return {name: '\n'.join(lines) for name, lines in sections.items()}
+
+    def _run(self, command, timeout):
+        with self.lock:
+            if not self.is_alive():
+                self.start()
+            try:
+                self.process.stdin.write(f'{command}\necho "{self.sentinel}$?"\n')
+                self.process.stdin.flush()
+            except OSError as e:
+                self._close()
+                raise AdbShellError(f'shell for {self.device_serial} closed: {e}')
+
+            output = []
+            while True:
+                try:
+                    line = self.lines.get(timeout=timeout)
+                except queue.Empty:
+                    # The stream is out of sync now; start over with a fresh shell next time
+                    self._close()
+                    raise AdbShellTimeout(f'timeout running {command!r} on {self.device_serial}')
+                if line is None:
+                    self._close()
+                    raise AdbShellError(f'shell for {self.device_serial} exited')
+                index = line.find(self.sentinel)
+                if index >= 0:
+                    # Output without a trailing newline shares its last line with the sentinel
+                    output.append(line[:index])
+                    return ''.join(output), int(line[index + len(self.sentinel):].strip() or 0)
+                output.append(line)
+
+    def close(self):
+        with self.lock:
+            self._close()
+
+    def _close(self):
+        if self.process is not None:
+            if self.process.poll() is None:
+                self.process.kill()
+            self.process.wait()
+        self.process = None
+        self.lines = queue.Queue()
+
+
+_shells = {}
+_shells_lock = threading.Lock()
+
+def get_shell(device_serial):
+    with _shells_lock:
+        shell = _shells.get(device_serial)
+        if shell is None:
+            shell = _shells[device_serial] = AdbShell(device_serial)
+        return shell
+
+def shell_output(device_serial, command, timeout=10):
+    output, _ = get_shell(device_serial).run(command, timeout)
+    return output
+
+def close_shell(device_serial):
+    with _shells_lock:
+        shell = _shells.pop(device_serial, None)
+    if shell:
+        shell.close()
+
+def close_all_shells():
+    for device_serial in list(_shells):
+        close_shell(device_serial)
@@ -0,0 +1,178 @@
+import base64
+import json
+import os
+import socket
+import struct
+import threading
+import time
+
+from utils.ring_buffer import RingBuffer
+
+DASHBOARD_HOST = 'localhost'
+DASHBOARD_PORT = 8082
+EVENTS_PATH = '/api/events'
+SERIES_CAPACITY = 600  # 5 minutes of the dashboard's twice-a-second summaries
+RECONNECT_INTERVAL = 5
+STALE_AFTER = 3
+
+# StatisticsSummary field -> series name
+SUMMARY_FIELDS = {
+    'total_latency_ms': 'latency_ms',
+    'network_latency_ms': 'network_ms',
+    'encode_latency_ms': 'encode_ms',
+    'decode_latency_ms': 'decode_ms',
+    'video_mbits_per_sec': 'bitrate_mbps',
+    'client_fps': 'client_fps',
+    'server_fps': 'server_fps',
+    'packets_lost_per_sec': 'packets_lost',
+}
+
+
+class WebSocketClosed(Exception):
+    pass
+
+
+class WebSocket:
+    # Minimal RFC 6455 client: enough to read the dashboard's JSON text events
+    def __init__(self, host, port, path, timeout=5):
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        key = base64.b64encode(os.urandom(16)).decode()
+        request = (f'GET {path} HTTP/1.1\r\nHost: {host}:{port}\r\nUpgrade: websocket\r\n'
+                   f'Connection: Upgrade\r\nSec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n'
+                   f'X-ALVR: true\r\n\r\n')
+        self.sock.sendall(request.encode())
+        self.buffer = b''
+        headers = self._read_until(b'\r\n\r\n')
+        if b' 101 ' not in headers.split(b'\r\n', 1)[0]:
+            raise WebSocketClosed(f'handshake failed: {headers.splitlines()[0]!r}')
+        self.sock.settimeout(None)
+
+    def _read_until(self, delimiter):
+        while delimiter not in self.buffer:
+            self._fill()
+        data, self.buffer = self.buffer.split(delimiter, 1)
+        return data
+
+    def _read_exact(self, size):
+        while len(self.buffer) < size:
+            self._fill()
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+    def _fill(self):
+        chunk = self.sock.recv(65536)
+        if not chunk:
+            raise WebSocketClosed('connection closed')
+        self.buffer += chunk
+
+    def _send(self, opcode, payload=b''):
+        mask = os.urandom(4)
+        header = bytes([0x80 | opcode])
+        if len(payload) < 126:
+            header += bytes([0x80 | len(payload)])
+        elif len(payload) < 65536:
+            header += bytes([0x80 | 126]) + struct.pack('!H', len(payload))
+        else:
+            header += bytes([0x80 | 127]) + struct.pack('!Q', len(payload))
+        masked = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+        self.sock.sendall(header + mask + masked)
+
+    def receive(self):
+        message = b''
+        while True:
+            first, second = self._read_exact(2)
+            opcode = first & 0x0F
+            length = second & 0x7F
+            if length == 126:
+                length = struct.unpack('!H', self._read_exact(2))[0]
+            elif length == 127:
+                length = struct.unpack('!Q', self._read_exact(8))[0]
+            mask = self._read_exact(4) if second & 0x80 else None
+            payload = self._read_exact(length)
+            if mask:
+                payload = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+            if opcode == 0x8:
+                raise WebSocketClosed('closed by server')
+            if opcode == 0x9:
+                self._send(0xA, payload)
+                continue
+            if opcode in (0x0, 0x1, 0x2):
+                message += payload
+                if first & 0x80:
+                    return message.decode('utf-8', errors='replace')
+
+    def close(self):
+        try:
+            self._send(0x8)
+        except OSError:
+            pass
+        self.sock.close()
+
+
+class SessionStats:
+    def __init__(self, capacity=SERIES_CAPACITY):
+        self.started = time.time()
+        self.updated = None
+        self.timestamps = RingBuffer(capacity)
+        self.series = {name: RingBuffer(capacity, 'f') for name in SUMMARY_FIELDS.values()}
+
+    def add_summary(self, summary):
+        self.updated = time.time()
+        self.timestamps.append(self.updated)
+        for field, name in SUMMARY_FIELDS.items():
+            value = summary.get(field)
+            self.series[name].append(float(value) if value is not None else float('nan'))
+
+    def latest(self):
+        if self.updated is None or time.time() - self.updated > STALE_AFTER:
+            return None
+        return {name: series.last() for name, series in self.series.items()}
+
+
+class AlvrStatsClient:
+    # Subscribes to the local streamer's event stream; a new session starts on every connection
+    def __init__(self, on_update=None, host=DASHBOARD_HOST, port=DASHBOARD_PORT):
+        self.host = host
+        self.port = port
+        self.on_update = on_update
+        self.session = None
+        self.connection = None
+        self.stop_event = threading.Event()
+
+    def start(self):
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.connection:
+            self.connection.close()
+
+    def latest(self):
+        return self.session.latest() if self.session else None
+
+    def _run(self):
+        while not self.stop_event.is_set():
+            try:
+                self.connection = WebSocket(self.host, self.port, EVENTS_PATH)
+                self.session = SessionStats()
+                while not self.stop_event.is_set():
+                    self.handle_message(self.connection.receive())
+            except (OSError, WebSocketClosed):
+                # The streamer is not running (or was closed); try again later
+                pass
+            finally:
+                if self.connection:
+                    self.connection.sock.close()
+                    self.connection = None
+            self.stop_event.wait(RECONNECT_INTERVAL)
+
+    def handle_message(self, message):
+        try:
+            event = json.loads(message)
+        except ValueError:
+            return
+        event_type = event.get('event_type') or {}
+        if event_type.get('id') == 'StatisticsSummary':
+            self.session.add_summary(event_type.get('data') or {})
+            if self.on_update:
+                self.on_update(self.session)
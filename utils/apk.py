@@ -0,0 +1,146 @@
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.adb_command import run_adb
+from utils.adb_shell import shell_output
+
+ALVR_LATEST = "20.11.1"
+RELEASE_API = "https://api.github.com/repos/alvr-org/ALVR/releases/tags/v{version}"
+APK_NAME = "alvr_client_android.apk"
+# `adb install-multi-package` needs the staged session support Android 10 brought
+MULTI_PACKAGE_MIN_ANDROID = 10
+REMOTE_APK_DIR = "/data/local/tmp"
+# Seconds to wait for GitHub to connect or send the next chunk
+DOWNLOAD_TIMEOUT = 30
+
+
+def apk_paths(version):
+    # (download URL, cached APK, marker written once the download completed)
+    return (f"https://github.com/alvr-org/ALVR/releases/download/v{version}/alvr_client_android.apk",
+            f"/tmp/alvr_client_{version}.apk",
+            f"/tmp/alvr_client_{version}.info")
+
+
+def is_downloaded(apk_file, info_file):
+    return os.path.exists(apk_file) and os.path.exists(info_file)
+
+
+def downloaded_sha256(info_file):
+    # The marker holds the APK's SHA-256; markers written before it did just say 'Downloaded'
+    with open(info_file, 'r') as f:
+        value = f.read().strip()
+    return value if len(value) == 64 else None
+
+
+def mark_downloaded(info_file, sha256):
+    with open(info_file, 'w') as f:
+        f.write(sha256)
+
+
+def release_sha256(version, name=APK_NAME):
+    # SHA-256 GitHub publishes for a release asset, or None for releases from before digests existed
+    import requests
+
+    response = requests.get(RELEASE_API.format(version=version), timeout=10)
+    response.raise_for_status()
+    for asset in response.json().get('assets', []):
+        if asset.get('name') == name and (asset.get('digest') or '').startswith('sha256:'):
+            return asset['digest'][len('sha256:'):]
+    return None
+
+
+def download_apk(url, apk_file, info_file, on_progress=None, sha256=None):
+    # Written to a .part file and only moved over apk_file once complete and verified, so an interrupted or
+    # mismatching download never replaces a good copy.
+    # Imported here so the headless daemon only pays for requests when it actually downloads
+    import requests
+
+    partial = apk_file + '.part'
+    try:
+        response = requests.get(url, stream=True, timeout=DOWNLOAD_TIMEOUT)
+        response.raise_for_status()
+        total_length = response.headers.get('content-length')
+        digest = hashlib.sha256()
+
+        with open(partial, 'wb') as f:
+            if total_length is None:
+                digest.update(response.content)
+                f.write(response.content)
+                if on_progress:
+                    on_progress(1.0)
+            else:
+                dl = 0
+                total_length = int(total_length)
+                for data in response.iter_content(chunk_size=4096):
+                    dl += len(data)
+                    digest.update(data)
+                    f.write(data)
+                    if on_progress:
+                        on_progress(dl / total_length)
+        if sha256 and digest.hexdigest() != sha256:
+            raise ValueError(f'Downloaded APK does not match SHA-256 {sha256}')
+        os.replace(partial, apk_file)
+    finally:
+        if os.path.exists(partial):
+            os.remove(partial)
+    mark_downloaded(info_file, digest.hexdigest())
+
+
+def install_apk(device_serial, apk_file):
+    # Returns (success, adb's error output)
+    result = run_adb(['install', '-r', apk_file], device_serial, capture_output=True, text=True)
+    return result.returncode == 0, result.stderr
+
+
+def installed_versions(device_serial):
+    # {package: versionCode} for everything installed, in one round trip
+    output = shell_output(device_serial, 'pm list packages --show-versioncode')
+    versions = {}
+    for line in output.splitlines():
+        fields = dict(field.split(':', 1) for field in line.split() if ':' in field)
+        if 'package' in fields:
+            versions[fields['package']] = int(fields['versionCode']) if fields.get('versionCode', '').isdigit() else 0
+    return versions
+
+
+def supports_multi_package(android_version):
+    try:
+        return int(str(android_version).split('.')[0]) >= MULTI_PACKAGE_MIN_ANDROID
+    except ValueError:
+        return False
+
+
+def install_apks(device_serial, apk_files, android_version=None):
+    # Several APKs in one atomic transaction where the device supports it, otherwise one by one with the next
+    # push overlapping the current install. Raises RuntimeError with adb's output on failure.
+    if len(apk_files) == 1:
+        success, error = install_apk(device_serial, apk_files[0])
+        if not success:
+            raise RuntimeError(error.strip() or 'Installation failed')
+    elif supports_multi_package(android_version):
+        result = run_adb(['install-multi-package', '-r'] + list(apk_files), device_serial, capture_output=True,
+                         text=True)
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr.strip() or result.stdout.strip() or 'Installation failed')
+    elif apk_files:
+        install_pipelined(device_serial, apk_files)
+
+
+def install_pipelined(device_serial, apk_files):
+    remote_files = [f'{REMOTE_APK_DIR}/companion-{index}.apk' for index in range(len(apk_files))]
+    errors = []
+    with ThreadPoolExecutor(max_workers=1) as pusher:
+        pushes = [pusher.submit(run_adb, ['push', local, remote], device_serial, capture_output=True, text=True)
+                  for local, remote in zip(apk_files, remote_files)]
+        for local, remote, push in zip(apk_files, remote_files, pushes):
+            result = push.result()
+            if result.returncode == 0:
+                result = run_adb(['shell', 'pm', 'install', '-r', remote], device_serial, capture_output=True,
+                                 text=True)
+            # pm install reports failures on stdout and may still exit 0
+            if result.returncode != 0 or 'Failure' in result.stdout:
+                errors.append(f'{os.path.basename(local)}: {(result.stderr or result.stdout).strip()}')
+    run_adb(['shell', 'rm', '-f'] + remote_files, device_serial, capture_output=True)
+    if errors:
+        raise RuntimeError('; '.join(errors))
@@ -0,0 +1,192 @@
+import os
+import struct
+import threading
+import zipfile
+from collections import namedtuple
+
+import yaml
+
+from utils.apk import download_apk, downloaded_sha256, is_downloaded, mark_downloaded
+from utils.apk_peers import sha256_file
+
+APK_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "ALVR-Companion", "apks")
+
+# Binary XML chunk types and the framework resource id of android:versionCode
+RES_STRING_POOL_TYPE = 0x0001
+RES_XML_RESOURCE_MAP_TYPE = 0x0180
+RES_XML_START_ELEMENT_TYPE = 0x0102
+UTF8_FLAG = 0x100
+TYPE_STRING = 0x03
+VERSION_CODE_RESOURCE = 0x0101021b
+
+CachedApk = namedtuple('CachedApk', 'source path sha256 package version_code')
+
+
+def apk_source(entry):
+    # Config entries are a URL or path, or {'url'/'path', 'sha256', 'package', 'version_code'}
+    if isinstance(entry, dict):
+        return entry.get('url') or entry.get('path')
+    return entry
+
+
+def is_url(source):
+    return source.startswith(('http://', 'https://'))
+
+
+def _string_pool(data, offset):
+    _type, header_size, _size, count, _styles, flags, strings_start, _styles_start = struct.unpack_from(
+        '<HHIIIIII', data, offset)
+    offsets = struct.unpack_from(f'<{count}I', data, offset + header_size)
+    base = offset + strings_start
+    strings = []
+    for string_offset in offsets:
+        position = base + string_offset
+        if flags & UTF8_FLAG:
+            # UTF-16 length, then UTF-8 byte length, each one or two bytes
+            for _ in range(2):
+                length = data[position]
+                position += 1
+                if length & 0x80:
+                    length = (length & 0x7f) << 8 | data[position]
+                    position += 1
+            strings.append(data[position:position + length].decode('utf-8', 'replace'))
+        else:
+            length, = struct.unpack_from('<H', data, position)
+            position += 2
+            if length & 0x8000:
+                length = (length & 0x7fff) << 16 | struct.unpack_from('<H', data, position)[0]
+                position += 2
+            strings.append(data[position:position + length * 2].decode('utf-16-le', 'replace'))
+    return strings
+
+
+def read_manifest(path):
+    # (package, versionCode) from the compiled AndroidManifest.xml, so plain URLs need no extra config
+    with zipfile.ZipFile(path) as apk:
+        data = apk.read('AndroidManifest.xml')
+    strings, resource_ids = [], []
+    offset = struct.unpack_from('<H', data, 2)[0]
+    while offset + 8 <= len(data):
+        chunk_type, header_size, size = struct.unpack_from('<HHI', data, offset)
+        if chunk_type == RES_STRING_POOL_TYPE:
+            strings = _string_pool(data, offset)
+        elif chunk_type == RES_XML_RESOURCE_MAP_TYPE:
+            resource_ids = struct.unpack_from(f'<{(size - header_size) // 4}I', data, offset + header_size)
+        elif chunk_type == RES_XML_START_ELEMENT_TYPE:
+            # The first element is <manifest>
+            attribute_start, attribute_size, attribute_count = struct.unpack_from('<HHH', data, offset + 24)
+            package = version_code = None
+            for index in range(attribute_count):
+                position = offset + header_size + attribute_start + index * attribute_size
+                _ns, name, raw_value, _value_size, _res0, data_type, value = struct.unpack_from(
+                    '<IIIHBBI', data, position)
+                attribute = strings[name] if name < len(strings) else ''
+                resource = resource_ids[name] if name < len(resource_ids) else None
+                if attribute == 'package':
+                    package = strings[raw_value] if data_type == TYPE_STRING else None
+                elif attribute == 'versionCode' or resource == VERSION_CODE_RESOURCE:
+                    version_code = value
+            return package, version_code
+        offset += size
+    return None, None
+
+
+class ApkCache:
+    # Extra APKs stored by SHA-256 as <sha256>.apk with the same marker files as the ALVR download.
+    # A URL is fetched once and then resolves to the hash it was downloaded as; pin 'sha256' in the entry to have
+    # it checked, and fetched from LAN peers first when a PeerCache is given.
+    def __init__(self, directory=APK_CACHE_DIR, peer_cache=None):
+        self.directory = directory
+        self.peer_cache = peer_cache
+        self.index_path = os.path.join(directory, 'index.yaml')
+        self.index = None
+        self.lock = threading.Lock()
+
+    def _load(self):
+        # Called with the lock held
+        if self.index is None:
+            self.index = {}
+            if os.path.exists(self.index_path):
+                with open(self.index_path, 'r', encoding='utf-8') as f:
+                    self.index = yaml.safe_load(f) or {}
+            self.index.setdefault('urls', {})
+            self.index.setdefault('apks', {})
+        return self.index
+
+    def _save(self):
+        # The index is what maps URLs to cached files; it is never left half written
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = f'{self.index_path}.{os.getpid()}.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                yaml.dump(self.index, f)
+            os.replace(tmp_path, self.index_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def paths(self, sha256):
+        return os.path.join(self.directory, f'{sha256}.apk'), os.path.join(self.directory, f'{sha256}.info')
+
+    def resolve(self, entry, on_progress=None):
+        # Returns a CachedApk, downloading the APK if needed
+        options = entry if isinstance(entry, dict) else {}
+        source = apk_source(entry)
+        if not source:
+            raise ValueError(f'APK entry without url or path: {entry}')
+        if is_url(source):
+            path, sha256 = self._fetch(source, options.get('sha256'), on_progress)
+        else:
+            path = os.path.expanduser(source)
+            sha256 = sha256_file(path)
+            if options.get('sha256') and options['sha256'] != sha256:
+                raise ValueError(f'{path} does not match SHA-256 {options["sha256"]}')
+
+        with self.lock:
+            index = self._load()
+            metadata = index['apks'].get(sha256)
+        if metadata is None:
+            try:
+                package, version_code = read_manifest(path)
+            except (zipfile.BadZipFile, KeyError, IndexError, struct.error) as e:
+                # Without a version it is simply always installed
+                print(f"APK Cache: cannot read the manifest of {source}: {e}")
+                package = version_code = None
+            metadata = {'package': package, 'version_code': version_code}
+            with self.lock:
+                self._load()['apks'][sha256] = metadata
+                self._save()
+        if self.peer_cache and sha256 not in self.peer_cache.shared():
+            self.peer_cache.share(path, sha256)
+        return CachedApk(source, path, sha256, options.get('package') or metadata['package'],
+                         options.get('version_code') or metadata['version_code'])
+
+    def _fetch(self, url, sha256, on_progress):
+        os.makedirs(self.directory, exist_ok=True)
+        with self.lock:
+            sha256 = sha256 or self._load()['urls'].get(url)
+        if sha256 and is_downloaded(*self.paths(sha256)):
+            return self.paths(sha256)[0], sha256
+
+        if sha256 and self.peer_cache:
+            apk_file, info_file = self.paths(sha256)
+            if self.peer_cache.fetch(sha256, apk_file, on_progress):
+                mark_downloaded(info_file, sha256)
+                self._remember(url, sha256)
+                return apk_file, sha256
+
+        # Downloaded under a temporary name since the hash is only known afterwards
+        partial_file = os.path.join(self.directory, f'download-{threading.get_ident()}.apk')
+        partial_info = partial_file[:-len('.apk')] + '.info'
+        download_apk(url, partial_file, partial_info, on_progress, sha256=sha256)
+        sha256 = downloaded_sha256(partial_info)
+        apk_file, info_file = self.paths(sha256)
+        os.replace(partial_file, apk_file)
+        os.replace(partial_info, info_file)
+        self._remember(url, sha256)
+        return apk_file, sha256
+
+    def _remember(self, url, sha256):
+        with self.lock:
+            self._load()['urls'][url] = sha256
+            self._save()
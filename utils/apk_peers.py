@@ -0,0 +1,204 @@
+import hashlib
+import json
+import os
+import re
+import socket
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.client import HTTPException
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PEER_PORT = 8743
+BEACON_PORT = 8744
+BEACON_ADDRESS = '255.255.255.255'
+BEACON_INTERVAL = 10
+# Peers that stopped announcing themselves are forgotten after a few missed beacons
+PEER_TTL = 3 * BEACON_INTERVAL + 5
+CONNECT_TIMEOUT = 2
+CHUNK_SIZE = 64 * 1024
+SHA256_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+
+def sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def is_sha256(value):
+    return bool(value) and SHA256_PATTERN.match(value) is not None
+
+
+def parse_peer(address):
+    host, _, port = address.rpartition(':')
+    return (host, int(port)) if host else (address, PEER_PORT)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # GET /apks lists what is shared as {sha256: size}; GET /apk/<sha256> sends the file
+    def do_GET(self):
+        cache = self.server.cache
+        if self.path == '/apks':
+            body = json.dumps({sha256: os.path.getsize(path) for sha256, path in cache.shared().items()}).encode()
+            self._reply(200, body, 'application/json')
+            return
+        sha256 = self.path[len('/apk/'):] if self.path.startswith('/apk/') else None
+        path = cache.shared().get(sha256) if sha256 else None
+        if path is None or not os.path.exists(path):
+            self._reply(404, b'Not found', 'text/plain')
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/vnd.android.package-archive')
+        self.send_header('Content-Length', str(os.path.getsize(path)))
+        self.end_headers()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                self.wfile.write(chunk)
+
+    def _reply(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class PeerCache:
+    # Shares verified APKs with other companions on the LAN and fetches from them before the internet.
+    # Files are addressed by SHA-256, so whatever a peer sends is checked against the hash that was asked for.
+    # Peers are the configured 'host:port' addresses plus whoever broadcasts a beacon on BEACON_PORT.
+    def __init__(self, port=PEER_PORT, peers=(), beacon_port=BEACON_PORT, beacon_address=BEACON_ADDRESS):
+        self.port = port
+        self.static_peers = [parse_peer(peer) for peer in peers]
+        self.beacon_port = beacon_port
+        self.beacon_address = beacon_address
+        self.files = {}
+        # Tells our own beacons apart from those of other companions on this machine
+        self.instance = os.urandom(8).hex()
+        # (host, port) -> (set of sha256, last seen)
+        self.discovered = {}
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.server = None
+
+    def share(self, path, sha256):
+        # Only served when the content still matches the hash it was verified against
+        if sha256_file(path) != sha256:
+            return False
+        with self.lock:
+            self.files[sha256] = path
+        return True
+
+    def shared(self):
+        with self.lock:
+            return dict(self.files)
+
+    def start(self):
+        self.server = ThreadingHTTPServer(('', self.port), _Handler)
+        self.server.daemon_threads = True
+        self.server.cache = self
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        if self.beacon_port:
+            threading.Thread(target=self._announce, daemon=True).start()
+            threading.Thread(target=self._listen, daemon=True).start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def _announce(self):
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+            while not self.stop_event.is_set():
+                beacon = json.dumps({'alvr_companion': self.instance, 'port': self.port, 'apks': sorted(self.shared())})
+                try:
+                    sock.sendto(beacon.encode(), (self.beacon_address, self.beacon_port))
+                except OSError as e:
+                    print(f"APK Peers: beacon failed: {e}")
+                self.stop_event.wait(BEACON_INTERVAL)
+
+    def _listen(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        # Several companions on one machine all hear the beacons
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if hasattr(socket, 'SO_REUSEPORT'):
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        sock.settimeout(1)
+        try:
+            sock.bind(('', self.beacon_port))
+        except OSError as e:
+            print(f"APK Peers: cannot listen for beacons: {e}")
+            sock.close()
+            return
+        with sock:
+            while not self.stop_event.is_set():
+                try:
+                    data, (host, _port) = sock.recvfrom(65536)
+                    beacon = json.loads(data)
+                    if beacon['alvr_companion'] == self.instance:
+                        continue
+                    peer = (host, int(beacon['port']))
+                    apks = {sha256 for sha256 in beacon.get('apks', []) if is_sha256(sha256)}
+                except socket.timeout:
+                    continue
+                except (OSError, ValueError, KeyError, TypeError, AttributeError):
+                    continue
+                with self.lock:
+                    self.discovered[peer] = (apks, time.monotonic())
+
+    def peers(self, sha256=None):
+        # Peers that announced the file first, then the configured ones
+        now = time.monotonic()
+        with self.lock:
+            self.discovered = {peer: entry for peer, entry in self.discovered.items() if now - entry[1] < PEER_TTL}
+            announced = [peer for peer, (apks, _seen) in self.discovered.items() if sha256 is None or sha256 in apks]
+        return list(dict.fromkeys(announced + self.static_peers))
+
+    def fetch(self, sha256, dest, on_progress=None):
+        # Downloads the file with this hash from the first peer that has it; returns the peer URL or None.
+        # on_progress may raise, e.g. JobCancelled, which is passed through.
+        for host, port in self.peers(sha256):
+            url = f'http://{host}:{port}/apk/{sha256}'
+            try:
+                if self._download(url, sha256, dest, on_progress):
+                    return url
+            except (OSError, HTTPException, ValueError) as e:
+                print(f"APK Peers: {url}: {e}")
+        return None
+
+    def _download(self, url, sha256, dest, on_progress):
+        partial = dest + '.part'
+        try:
+            with urllib.request.urlopen(url, timeout=CONNECT_TIMEOUT) as response, open(partial, 'wb') as f:
+                total = int(response.headers.get('Content-Length') or 0)
+                digest = hashlib.sha256()
+                received = 0
+                for chunk in iter(lambda: response.read(CHUNK_SIZE), b''):
+                    digest.update(chunk)
+                    f.write(chunk)
+                    received += len(chunk)
+                    if on_progress and total:
+                        on_progress(received / total)
+            if digest.hexdigest() != sha256:
+                print(f"APK Peers: {url} sent a file that does not match its hash")
+                return False
+            os.replace(partial, dest)
+            return True
+        except urllib.error.HTTPError as e:
+            if e.code != 404:
+                raise
+            return False
+        finally:
+            if os.path.exists(partial):
+                os.remove(partial)
@@ -0,0 +1,28 @@
+from utils.adb import is_ip_value
+
+# Decisions behind the per-device automation switches, shared by the GUI and the headless daemon
+
+
+def wants_auto_update(config, serial, device_info, version):
+    return bool(config.get(serial, 'auto_update')) and device_info.get('ALVR Version') != version
+
+
+def wants_auto_sideload(config, serial, extra_apks):
+    # Extra APKs follow the auto-update switch; packages that are already current are skipped on the headset
+    return bool(config.get(serial, 'auto_update')) and bool(extra_apks)
+
+
+def wants_auto_usb_forward(config, serial):
+    return bool(config.get(serial, 'auto_usb_forward')) and not is_ip_value(serial)
+
+
+def wifi_reconnect_targets(config, connected_serials):
+    # (USB serial, remembered IP address) of headsets with Wi-Fi enabled whose Wi-Fi transport is down
+    targets = []
+    for serial, device_config in config.devices().items():
+        if not device_config.get('wifi_enabled', False):
+            continue
+        if device_config.get('wifi_serial') in connected_serials:
+            continue
+        targets.append((serial, device_config.get('ip_address')))
+    return targets
@@ -0,0 +1,500 @@
+import os
+
+import yaml
+
+from utils.adb import get_wifi_ip, is_ip_value
+from utils.adb_command import parse_server, run_adb, server_for
+from utils.adb_shell import close_all_shells
+from utils.apk import (ALVR_LATEST, apk_paths, download_apk, downloaded_sha256, install_apk, install_apks,
+                       installed_versions, is_downloaded, mark_downloaded, release_sha256)
+from utils.apk_cache import ApkCache, apk_source
+from utils.apk_peers import PEER_PORT, PeerCache, sha256_file
+from utils.auto_hooks import wifi_reconnect_targets
+from utils.device_monitor import DeviceMonitor
+from utils.display import DisplayGeometryCache
+from utils.forward import ForwardManager
+from utils.get_alvr_version import get_alvr_version
+from utils.jobs import (CANCELLED, DONE, FAILED, PRIORITY_HIGH, PRIORITY_LOW, PRIORITY_NORMAL, JobCancelled,
+                        JobScheduler, check_cancelled, current_job)
+from utils.lan_scan import KnownHosts, scan
+from utils.rpc_server import SOCKET_PATH, RpcError, RpcServer
+from utils.scrcpy import ScrcpyManager
+from utils.usb_topology import TransferThrottle, UsbTopology
+from utils.user_config import CONFIG_DIR, UserConfig
+
+DEVICES_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'devices.yaml')
+LAN_HOSTS_FILE = os.path.join(CONFIG_DIR, 'lan_hosts.yaml')
+DISPLAY_CACHE_FILE = os.path.join(CONFIG_DIR, 'display_cache.yaml')
+DEVICE_EVENTS = ('added', 'removed', 'authorized', 'unauthorized', 'changed')
+
+
+class CompanionCore:
+    # Everything the GTK, Qt and headless frontends share: adb polling and the device cache, install,
+    # forwarding, Wi-Fi and streaming. Work happens off the UI thread; listeners are called as
+    # listener(event, serial, data) from worker threads, only when something actually changed, and
+    # frontends hand the call over to their own main loop. Besides the DeviceMonitor events there are
+    # 'forwarding', 'streaming', 'wifi_connected', 'lan_found' (data: addresses not connected yet), 'download_started', 'download_progress', 'downloaded',
+    # 'download_failed', 'install_started' and 'install_finished' (data: {'success', 'cancelled', 'error'}),
+    # 'sideload_started' and 'sideload_finished' (the same plus 'installed' and 'skipped' packages),
+    # 'display_geometry' once the panel size of a newly seen model and build is known (data: geometry or None).
+    # Downloads, installs and device commands run as jobs on self.jobs, one mutating job per headset at a time.
+    # servers: adb servers to manage as 'host:port' (default: 'adb_servers' in config.yaml, else the local one).
+    # peer_cache: share downloaded APKs with other companions on the LAN and try them before GitHub
+    # (default: 'apk_peer_cache' in config.yaml, with 'apk_peer_port' and static 'apk_peers').
+    def __init__(self, state=None, device_interval=1, info_interval=5, config=None, servers=None, peer_cache=None):
+        self.config = config or UserConfig()
+        servers = servers or self.config.data.get('adb_servers')
+        self.servers = [parse_server(server) for server in servers] if servers else [None]
+        with open(DEVICES_FILE, 'r', encoding='utf-8') as f:
+            self.devices_config = yaml.safe_load(f)
+        self.version = get_alvr_version() or ALVR_LATEST
+        self.apk_url, self.apk_file, self.info_file = apk_paths(self.version)
+
+        self.forward_manager = ForwardManager(servers=self.servers)
+        self.scrcpy_manager = ScrcpyManager(on_update=self.on_scrcpy_update)
+        self.monitor = DeviceMonitor(state, device_interval, info_interval, servers=self.servers)
+        self.monitor.add_listener(self.on_device_event)
+        self.monitor.add_poller(self.refresh_forwarding)
+        self.listeners = []
+        self.rpc_server = None
+
+        # Installs behind the same USB hub share its upstream bandwidth, so they are limited per hub
+        self.usb_topology = UsbTopology()
+        self.transfer_throttle = TransferThrottle()
+        self.jobs = JobScheduler(group_limit=self.transfer_throttle.limit)
+        self.known_hosts = KnownHosts(LAN_HOSTS_FILE)
+        self.display_cache = DisplayGeometryCache(DISPLAY_CACHE_FILE)
+
+        if peer_cache is None:
+            peer_cache = self.config.data.get('apk_peer_cache', False)
+        self.peer_cache = PeerCache(self.config.data.get('apk_peer_port', PEER_PORT),
+                                    self.config.data.get('apk_peers', [])) if peer_cache else None
+        self.apk_cache = ApkCache(peer_cache=self.peer_cache)
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def _emit(self, event, serial=None, data=None):
+        for listener in self.listeners:
+            try:
+                listener(event, serial, data)
+            except Exception as e:
+                print(f"Companion: {event} listener failed: {e}")
+
+    def start(self):
+        self.monitor.start()
+        if self.peer_cache:
+            try:
+                self.peer_cache.start()
+            except OSError as e:
+                print(f"APK Peers: cannot serve on port {self.peer_cache.port}: {e}")
+                self.peer_cache = None
+                return
+            if is_downloaded(self.apk_file, self.info_file):
+                self.jobs.submit(('share_apk', self.version), self.share_apk, priority=PRIORITY_LOW)
+
+    def stop(self):
+        if self.rpc_server:
+            self.rpc_server.stop()
+            self.rpc_server = None
+        if self.peer_cache:
+            self.peer_cache.stop()
+        self.jobs.stop()
+        self.monitor.stop()
+        self.scrcpy_manager.stop_all()
+        close_all_shells()
+
+    def get_device_config(self, model):
+        for device in self.devices_config['devices']:
+            if device['model'] == model:
+                return device
+        return {}
+
+    def device_key(self, serial):
+        # USB and Wi-Fi serials of one headset share a key, so their jobs never overlap
+        return self.config.get_device_unique_id(serial) or serial
+
+    def submit_device_job(self, name, serial, fn, *args, group=None, priority=PRIORITY_NORMAL, depends_on=(),
+                          on_done=None):
+        return self.jobs.submit((name, serial) + args, fn, serial, *args, device=self.device_key(serial), group=group,
+                                priority=priority, depends_on=depends_on, on_done=on_done)
+
+    def on_device_event(self, event, serial, device_info):
+        # The side work may fail, e.g. an adb server going away mid-poll; listeners still hear of the device
+        try:
+            if event in ('added', 'authorized'):
+                self.refresh_forwarding()
+                if not is_ip_value(serial):
+                    self.refresh_usb_topology(device_info.get('ADB Server'))
+                if device_info.get('Authorized'):
+                    self.display_geometry_job(serial, device_info)
+            elif event == 'removed':
+                self.forward_manager.forget(serial)
+        except Exception as e:
+            print(f"Companion: {event} handling failed for {serial}: {e}")
+        self._emit(event, serial, device_info)
+
+    def display_geometry_job(self, serial, device_info):
+        # Asked once per model and build, off the UI thread; frontends read display_cache.lookup()
+        model, build = device_info['Model'], device_info['Build Version']
+        if self.display_cache.is_known(model, build):
+            return None
+        return self.submit_device_job('display_geometry', serial, self._query_display_geometry, model, build,
+                                      priority=PRIORITY_LOW)
+
+    def _query_display_geometry(self, serial, model, build):
+        geometry = self.display_cache.get(serial, model, build)
+        self._emit('display_geometry', serial, geometry)
+        return geometry
+
+    def refresh_usb_topology(self, server=None):
+        try:
+            self.usb_topology.refresh(server)
+        except Exception as e:
+            print(f"USB Topology: {e}")
+
+# USB forwarding
+    def refresh_forwarding(self):
+        before = dict(self.forward_manager.forwards)
+        self.forward_manager.refresh()
+        if self.forward_manager.forwards != before:
+            self._emit('forwarding')
+
+    def get_local_ports(self, serial):
+        return self.forward_manager.get_local_ports(serial)
+
+    def is_usb_forwarding_enabled(self, serial):
+        return self.forward_manager.is_enabled(serial)
+
+    def forward_job(self, serial, enabled, reverse=None, priority=PRIORITY_HIGH):
+        if reverse is None:
+            reverse = self.config.get(serial, 'usb_reverse')
+        return self.submit_device_job('forward', serial, self._apply_forwarding, enabled, reverse, priority=priority)
+
+    def set_usb_forwarding(self, serial, enabled, reverse=None):
+        return self.forward_job(serial, enabled, reverse).wait()
+
+    def _apply_forwarding(self, serial, enabled, reverse):
+        self.forward_manager.refresh()
+        self.forward_manager.apply(serial, enabled, reverse=reverse)
+        ports = self.forward_manager.get_local_ports(serial)
+        # The ports are opened on the machine running the headset's adb server
+        self._emit('forwarding', serial, {'enabled': enabled, 'ports': ports, 'server': server_for(serial)})
+        return ports
+# End USB forwarding
+
+# Install
+    def download_job(self, priority=PRIORITY_NORMAL, force=False):
+        # Finishes right away when the APK is already cached, unless `force` asks for a fresh copy;
+        # concurrent callers share one download
+        return self.jobs.submit(('download', self.version), self._download, force, priority=priority)
+
+    def _download(self, force=False):
+        if not force and is_downloaded(self.apk_file, self.info_file):
+            return
+
+        def on_progress(fraction):
+            check_cancelled()
+            self._emit('download_progress', None, fraction)
+
+        self._emit('download_started', None, {'url': self.apk_url})
+        try:
+            source = self._fetch_apk(on_progress)
+        except JobCancelled:
+            raise
+        except Exception as e:
+            self._emit('download_failed', None, {'error': str(e)})
+            raise
+        self._emit('downloaded', None, {'source': source})
+
+    def _fetch_apk(self, on_progress):
+        # Returns where the APK came from. Peers are only asked when GitHub publishes the release's hash,
+        # since that is what their copy is checked against.
+        sha256 = None
+        if self.peer_cache:
+            try:
+                sha256 = release_sha256(self.version)
+            except Exception as e:
+                print(f"APK Peers: cannot get the release hash: {e}")
+            if sha256:
+                source = self.peer_cache.fetch(sha256, self.apk_file, on_progress)
+                if source:
+                    mark_downloaded(self.info_file, sha256)
+                    self.peer_cache.share(self.apk_file, sha256)
+                    return source
+        download_apk(self.apk_url, self.apk_file, self.info_file, on_progress, sha256=sha256)
+        if self.peer_cache:
+            self.peer_cache.share(self.apk_file, downloaded_sha256(self.info_file))
+        return self.apk_url
+
+    def share_apk(self):
+        sha256 = downloaded_sha256(self.info_file)
+        if sha256 is None:
+            sha256 = sha256_file(self.apk_file)
+            mark_downloaded(self.info_file, sha256)
+        self.peer_cache.share(self.apk_file, sha256)
+
+    def install_job(self, serial, priority=PRIORITY_NORMAL):
+        # Waits for the download, then installs; install_finished is emitted even if the download fails
+        download = self.download_job(priority)
+        return self.submit_device_job('install', serial, self._install, group=self.usb_topology.group(serial),
+                                      priority=priority, depends_on=[download], on_done=self.on_install_done)
+
+    def _install(self, serial):
+        self._emit('install_started', serial)
+        with self.transfer_throttle.measure(self.usb_topology.group(serial), os.path.getsize(self.apk_file)):
+            success, error = install_apk(serial, self.apk_file)
+        if not success:
+            raise RuntimeError(error.strip() or 'Installation failed')
+        self.monitor.refresh_device(serial)
+
+    def on_install_done(self, job):
+        serial = job.args[0]
+        self._emit('install_finished', serial, {
+            'success': job.state == DONE,
+            'cancelled': job.state == CANCELLED,
+            'error': str(job.error) if job.error else '',
+        })
+
+    def install(self, serial, priority=PRIORITY_NORMAL):
+        # Blocking install; returns (success, error)
+        try:
+            self.install_job(serial, priority).wait()
+        except Exception as e:
+            return False, str(e)
+        return True, ''
+
+    def is_installing(self, serial):
+        return self.jobs.find(('install', serial)) is not None
+
+    def cancel_install(self, serial):
+        # A running adb install cannot be interrupted; a pending one and its unshared download can
+        job = self.jobs.find(('install', serial))
+        if job is None:
+            return
+        self.jobs.cancel(job)
+        for download in job.depends_on:
+            if not self.jobs.dependents(download):
+                self.jobs.cancel(download)
+# End Install
+
+# Extra APKs
+    def extra_apks(self, serial):
+        # config.yaml: 'extra_apks' maps models to APKs for every such headset; a headset's own 'extra_apks' add to it
+        model = (self.monitor.get(serial) or {}).get('Model')
+        entries = list(self.config.data.get('extra_apks', {}).get(model, []))
+        entries += self.config.get(serial, 'extra_apks', [])
+        return list({apk_source(entry): entry for entry in entries}.values())
+
+    def resolve_apk_job(self, entry, priority=PRIORITY_NORMAL):
+        # Shared by every headset that needs the APK, like the ALVR download
+        return self.jobs.submit(('resolve_apk', apk_source(entry)), self.apk_cache.resolve, entry, priority=priority)
+
+    def sideload_job(self, serial, priority=PRIORITY_NORMAL):
+        resolves = [self.resolve_apk_job(entry, priority) for entry in self.extra_apks(serial)]
+        return self.submit_device_job('sideload', serial, self._sideload, group=self.usb_topology.group(serial),
+                                      priority=priority, depends_on=resolves, on_done=self.on_sideload_done)
+
+    def _sideload(self, serial):
+        apks = [dependency.result for dependency in current_job().depends_on]
+        if not apks:
+            return {'installed': [], 'skipped': []}
+        # One pm call tells which packages are already current
+        installed = installed_versions(serial)
+        pending = [apk for apk in apks if apk.package is None or apk.version_code is None
+                   or installed.get(apk.package, -1) < apk.version_code]
+        skipped = [apk.package for apk in apks if apk not in pending]
+        self._emit('sideload_started', serial, {'packages': [apk.package or apk.source for apk in pending]})
+        if pending:
+            android_version = (self.monitor.get(serial) or {}).get('Android Version')
+            size = sum(os.path.getsize(apk.path) for apk in pending)
+            with self.transfer_throttle.measure(self.usb_topology.group(serial), size):
+                install_apks(serial, [apk.path for apk in pending], android_version)
+        return {'installed': [apk.package or apk.source for apk in pending], 'skipped': skipped}
+
+    def on_sideload_done(self, job):
+        result = job.result or {}
+        self._emit('sideload_finished', job.args[0], {
+            'success': job.state == DONE,
+            'cancelled': job.state == CANCELLED,
+            'error': str(job.error) if job.error else '',
+            'installed': result.get('installed', []),
+            'skipped': result.get('skipped', []),
+        })
+
+    def sideload(self, serial, priority=PRIORITY_NORMAL):
+        # Blocking; returns the sideload job's result or raises what it failed with
+        return self.sideload_job(serial, priority).wait()
+# End Extra APKs
+
+# Wi-Fi
+    def connect_wifi(self, serial, ip_address=None):
+        # Without an address the headset is asked for its current one over USB
+        if not ip_address:
+            ip_address = get_wifi_ip(serial)
+        if not ip_address:
+            raise RuntimeError('Failed to obtain device IP address')
+        # The server that sees the headset over USB also takes its Wi-Fi transport
+        result = run_adb(['connect', f'{ip_address}:5555'], server=server_for(serial), capture_output=True, text=True)
+        if 'connected to' not in result.stdout:
+            raise RuntimeError(result.stdout.strip() or result.stderr.strip())
+        if self.config.get(serial, 'ip_address', None) != ip_address:
+            self.config.set(serial, 'ip_address', ip_address)
+            self.config.set(serial, 'wifi_serial', f'{ip_address}:5555')
+        self._emit('wifi_connected', serial, {'ip': ip_address})
+        self.monitor.wake()
+        return ip_address
+
+    def disconnect_wifi(self, serial):
+        wifi_serial = self.config.get(serial, 'wifi_serial', None) or serial
+        result = run_adb(['disconnect', wifi_serial], server=server_for(wifi_serial), capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr.strip() or result.stdout.strip())
+        self.monitor.wake()
+        return wifi_serial
+
+    def reconnect_wifi(self, on_error=None):
+        # Reconnects headsets with Wi-Fi enabled whose Wi-Fi transport is down, one job per headset: callers
+        # on the monitor thread do not wait for `adb connect`, and overlapping calls share the running job
+        devices_info = self.monitor.snapshot()
+        jobs = []
+        for serial, ip_address in wifi_reconnect_targets(self.config, devices_info):
+            if not ip_address and not devices_info.get(serial, {}).get('Authorized'):
+                continue  # Nothing remembered and no USB connection to ask the headset for its address
+            jobs.append(self.jobs.submit(('wifi_reconnect', serial), self.connect_wifi, serial, ip_address,
+                                         device=self.device_key(serial), priority=PRIORITY_LOW,
+                                         on_done=lambda job: self._on_reconnect_done(job, on_error)))
+        return jobs
+
+    def _on_reconnect_done(self, job, on_error):
+        if job.state == FAILED and on_error:
+            serial, ip_address = job.args
+            on_error(serial, ip_address, job.error)
+
+    def scan_network_job(self):
+        # Finds headsets with adb over TCP on the local subnets, without plugging them in first
+        return self.jobs.submit(('scan_network',), self._scan_network, priority=PRIORITY_HIGH)
+
+    def _scan_network(self):
+        found = scan(known=self.known_hosts.addresses())
+        self.known_hosts.remember(found)
+        connected = self.monitor.snapshot()
+        found = [address for address in found if address not in connected]
+        self._emit('lan_found', None, found)
+        return found
+
+    def connect_address(self, address):
+        result = run_adb(['connect', address], capture_output=True, text=True)
+        if 'connected to' not in result.stdout:
+            raise RuntimeError(result.stdout.strip() or result.stderr.strip())
+        self.known_hosts.remember([address])
+        self.monitor.wake()
+        return address
+# End Wi-Fi
+
+# Streaming
+    def on_scrcpy_update(self, session):
+        self._emit('streaming', session.device_serial)
+
+    def start_streaming(self, serial, crop_params=None, profile=None):
+        device_info = self.monitor.get(serial) or {}
+        if profile is None:
+            profile = self.get_device_config(device_info.get('Model')).get('scrcpy')
+        session = self.scrcpy_manager.start(serial, profile, crop_params)
+        self._emit('streaming', serial)
+        return session
+
+    def stop_streaming(self, serial):
+        self.scrcpy_manager.stop(serial)
+        self._emit('streaming', serial)
+# End Streaming
+
+# Socket API
+    def serve_api(self, path):
+        server = RpcServer(self.rpc_methods(), path)
+        server.start()
+        self.rpc_server = server
+        self.add_listener(self.notify_api)
+
+    def try_serve_api(self, path=SOCKET_PATH):
+        # For the windowed apps: when a daemon already serves the socket, it keeps it
+        try:
+            self.serve_api(path)
+            return True
+        except (OSError, RpcError) as e:
+            print(f"Companion API: {e}")
+            return False
+
+    def notify_api(self, event, serial, data):
+        if self.rpc_server and event in DEVICE_EVENTS:
+            self.rpc_server.notify('devices.changed', {'event': event, 'serial': serial, 'device': data})
+
+    def rpc_methods(self):
+        return {
+            'devices.list': self.monitor.snapshot,
+            'devices.subscribe': self.monitor.snapshot,
+            'devices.get': self.rpc_get_device,
+            'device.install': self.rpc_install,
+            'device.sideload': self.rpc_sideload,
+            'device.forward': self.rpc_forward,
+            'device.connect': self.rpc_connect,
+            'device.disconnect': self.rpc_disconnect,
+            'device.stream': self.rpc_stream,
+            'device.stop_stream': self.rpc_stop_stream,
+        }
+
+    def rpc_get_device(self, serial):
+        device_info = self.monitor.get(serial)
+        if device_info is None:
+            raise RpcError(f'Unknown device: {serial}')
+        return device_info
+
+    def rpc_authorized_device(self, serial):
+        device_info = self.rpc_get_device(serial)
+        if not device_info['Authorized']:
+            raise RpcError(f'Device is not authorized: {serial}')
+        return device_info
+
+    def rpc_install(self, serial):
+        self.rpc_authorized_device(serial)
+        success, error = self.install(serial, PRIORITY_HIGH)
+        if not success:
+            raise RpcError(error or 'Installation failed')
+        return {'version': self.version}
+
+    def rpc_sideload(self, serial):
+        self.rpc_authorized_device(serial)
+        try:
+            return self.sideload(serial, PRIORITY_HIGH)
+        except Exception as e:
+            raise RpcError(str(e) or 'Installation failed')
+
+    def rpc_forward(self, serial, enabled=True, reverse=None):
+        self.rpc_authorized_device(serial)
+        return {'ports': self.set_usb_forwarding(serial, enabled, reverse)}
+
+    def rpc_connect(self, serial):
+        self.rpc_authorized_device(serial)
+        ip_address = self.submit_device_job('connect', serial, self.connect_wifi,
+                                            self.config.get(serial, 'ip_address', None), priority=PRIORITY_HIGH).wait()
+        return {'serial': f'{ip_address}:5555'}
+
+    def rpc_disconnect(self, serial):
+        try:
+            wifi_serial = self.submit_device_job('disconnect', serial, self.disconnect_wifi,
+                                                 priority=PRIORITY_HIGH).wait()
+        except RuntimeError as e:
+            raise RpcError(str(e))
+        return {'serial': wifi_serial}
+
+    def rpc_stream(self, serial, crop=None):
+        self.rpc_authorized_device(serial)
+        if crop is None and self.config.get(serial, 'use_crop'):
+            crop = self.config.get(serial, 'crop_params', None)
+        session = self.submit_device_job('stream', serial, self.start_streaming, crop, priority=PRIORITY_HIGH).wait()
+        return {'pid': session.process.pid}
+
+    def rpc_stop_stream(self, serial):
+        self.submit_device_job('stop_stream', serial, self.stop_streaming, priority=PRIORITY_HIGH).wait()
+        return {}
+# End Socket API
@@ -0,0 +1,210 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.adb import get_device_info, list_devices
+from utils.adb_command import rate_limiter, server_for, set_monitor_lane, set_route
+from utils.adb_shell import close_shell
+from utils.poll_budget import AdaptiveInterval, PollState
+
+# get_device_info is a single round trip over the device's persistent shell
+DEVICE_INFO_COST = 1
+# Share of the adb rate the monitor's steady polling may use; with many headsets the intervals stretch instead
+MONITOR_SHARE = 0.5
+# Battery readings drift constantly and should not keep the poller awake
+VOLATILE_FIELDS = ('Battery Level', 'Charging Status', 'Temperature')
+
+
+def unauthorized_info(serial):
+    return {
+        'Authorized': False,
+        'Serial Number': serial,
+        'Model': 'Unauthorized Device',
+        'ALVR Version': None,
+        'Android Version': None,
+        'Build Version': None,
+        'Manufacturer': None,
+    }
+
+
+def has_info_changed(old_info, new_info):
+    if old_info is None:
+        return True
+    return any(old_info.get(key) != value for key, value in new_info.items() if key not in VOLATILE_FIELDS)
+
+
+class DeviceMonitor:
+    # Polls adb on its own thread and tells listeners only about devices that appeared, left or changed.
+    # Listeners are called as listener(event, serial, device_info) from the monitor thread, with event one of
+    # 'added', 'removed', 'authorized', 'unauthorized' or 'changed', plus 'polled' after every info poll of a
+    # device, changed or not, for sampling battery and temperature at the actual poll rate.
+    # servers: adb servers to aggregate as 'host:port', None for the default one; every device_info carries
+    # the server it was seen on as 'ADB Server', and adb calls for its serial are routed there.
+    def __init__(self, state=None, device_interval=1, info_interval=5, servers=None):
+        self.state = state or PollState()
+        self.servers = list(servers or [None])
+        self.pool = (ThreadPoolExecutor(max_workers=len(self.servers), initializer=set_monitor_lane)
+                     if len(self.servers) > 1 else None)
+        self.device_poll = AdaptiveInterval(self.state, base=device_interval, maximum=device_interval * 30)
+        self.info_poll = AdaptiveInterval(self.state, base=info_interval, maximum=info_interval * 60, needs_page=True)
+        # The app-wide adb budget; the monitor's threads queue in their own lane of it
+        self.budget = rate_limiter
+        self.devices_info = {}
+        self.listeners = []
+        self.pollers = []
+        self.lock = threading.Lock()
+        self.wake_event = threading.Event()
+        self.stop_event = threading.Event()
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def add_poller(self, poller):
+        # Extra per-tick work, e.g. refreshing the forward table, run on the monitor thread after device info
+        self.pollers.append(poller)
+
+    def start(self):
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def stop(self):
+        self.stop_event.set()
+        self.wake_event.set()
+
+    def wake(self):
+        # Poll right away instead of waiting out a long idle interval
+        self.wake_event.set()
+
+    def snapshot(self):
+        with self.lock:
+            return {serial: dict(info) for serial, info in self.devices_info.items()}
+
+    def get(self, serial):
+        with self.lock:
+            info = self.devices_info.get(serial)
+            return dict(info) if info is not None else None
+
+    def _spread(self, interval, cost):
+        # Stretches an interval so polling `cost` adb commands per tick stays within the monitor's share
+        return max(interval, cost / (self.budget.rate * MONITOR_SHARE))
+
+    def _run(self):
+        set_monitor_lane()
+        next_devices = next_info = time.monotonic()
+        while not self.stop_event.is_set():
+            now = time.monotonic()
+            if now >= next_devices:
+                self.poll_devices()
+                next_devices = time.monotonic() + self._spread(self.device_poll.next_interval(), len(self.servers))
+            if now >= next_info:
+                self.poll_info()
+                for poller in self.pollers:
+                    try:
+                        poller()
+                    except Exception as e:
+                        print(f"Device Monitor: poller failed: {e}")
+                info_cost = DEVICE_INFO_COST * len(self.devices_info) + len(self.pollers)
+                next_info = time.monotonic() + self._spread(self.info_poll.next_interval(), info_cost)
+            if self.wake_event.wait(max(0, min(next_devices, next_info) - time.monotonic())):
+                self.wake_event.clear()
+                next_devices = next_info = time.monotonic()
+
+    def _emit(self, event, serial, device_info):
+        for listener in self.listeners:
+            try:
+                listener(event, serial, dict(device_info))
+            except Exception as e:
+                print(f"Device Monitor: {event} listener failed for {serial}: {e}")
+
+    def _query(self, serial):
+        device_info = get_device_info(serial)
+        if device_info is not None:
+            device_info['Authorized'] = True
+            device_info['ADB Server'] = server_for(serial)
+        return device_info
+
+    def _list_server(self, server):
+        try:
+            return list_devices(server)
+        except Exception as e:
+            print(f"ADB Error ({server or 'default server'}): {e}")
+            return None
+
+    def list_all(self):
+        # {server: [(serial, state)]}, with None for servers that did not answer; servers are asked
+        # in parallel so one slow or unreachable PC does not hold up the rest
+        if self.pool is None:
+            return {server: self._list_server(server) for server in self.servers}
+        return dict(zip(self.servers, self.pool.map(self._list_server, self.servers)))
+
+    def poll_devices(self):
+        listed = self.list_all()
+        if all(devices is None for devices in listed.values()):
+            return
+
+        devices = {}
+        for server in self.servers:
+            for serial, state in listed[server] or []:
+                # A transport listed by two servers stays with the first one
+                devices.setdefault(serial, (state, server))
+
+        events = []
+        for serial, (state, server) in devices.items():
+            set_route(serial, server)
+            old_info = self.devices_info.get(serial)
+            authorized = state != 'unauthorized'
+            if old_info is None:
+                event = 'added'
+            elif authorized != old_info['Authorized']:
+                event = 'authorized' if authorized else 'unauthorized'
+            else:
+                continue
+            if authorized:
+                device_info = self._query(serial)
+                if device_info is None:
+                    continue  # Still booting or going away; try again on the next poll
+            else:
+                device_info = dict(old_info, Authorized=False) if old_info else unauthorized_info(serial)
+                device_info['ADB Server'] = server
+            with self.lock:
+                self.devices_info[serial] = device_info
+            events.append((event, serial, device_info))
+
+        # Devices of a server that did not answer are kept until it answers again
+        unreachable = {server for server, listed_devices in listed.items() if listed_devices is None}
+        for serial in set(self.devices_info) - set(devices):
+            if self.devices_info[serial].get('ADB Server') in unreachable:
+                continue
+            with self.lock:
+                device_info = self.devices_info.pop(serial)
+            close_shell(serial)
+            set_route(serial, None)
+            events.append(('removed', serial, device_info))
+
+        if events:
+            self.state.mark_change()
+        for event in events:
+            self._emit(*event)
+
+    def poll_info(self):
+        for serial, old_info in list(self.devices_info.items()):
+            if old_info['Authorized']:
+                self.refresh_device(serial)
+
+    def refresh_device(self, serial):
+        # Also called right after an install so the new version shows without waiting for the next poll
+        old_info = self.get(serial)
+        if old_info is None:
+            return
+        device_info = self._query(serial)
+        if device_info is None:
+            return
+        self._emit('polled', serial, device_info)
+        if device_info == old_info:
+            return
+        if has_info_changed(old_info, device_info):
+            self.state.mark_change()
+        with self.lock:
+            if serial not in self.devices_info:
+                return
+            self.devices_info[serial] = device_info
+        self._emit('changed', serial, device_info)
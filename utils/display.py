@@ -0,0 +1,118 @@
+import os
+import re
+import threading
+import yaml
+
+from utils.adb_shell import shell_output
+
+SIZE_PATTERN = re.compile(r'(Physical|Override) size:\s*(\d+)x(\d+)')
+DENSITY_PATTERN = re.compile(r'(Physical|Override) density:\s*(\d+)')
+# Headsets render both eyes side by side into one wide framebuffer
+STEREO_ASPECT = 1.5
+# Share of the eye width kept by the crop; the edges are lens-distorted anyway
+EYE_CROP_RATIO = 7 / 8
+CROP_ALIGN = 16
+
+
+def query_display_geometry(device_serial):
+    output = shell_output(device_serial, 'wm size; wm density')
+    sizes = {kind: (int(w), int(h)) for kind, w, h in SIZE_PATTERN.findall(output)}
+    densities = {kind: int(d) for kind, d in DENSITY_PATTERN.findall(output)}
+    size = sizes.get('Override') or sizes.get('Physical')
+    if size is None:
+        return None
+    width, height = size
+    return {
+        'width': width,
+        'height': height,
+        'density': densities.get('Override') or densities.get('Physical'),
+        'stereo': width >= height * STEREO_ASPECT,
+    }
+
+
+def derive_crop(geometry):
+    # A centred 16:9 window of the right eye; None for ordinary single-panel displays
+    if not geometry or not geometry['stereo']:
+        return None
+    width, height = geometry['width'], geometry['height']
+    eye_width = width // 2
+    crop_width = int(eye_width * EYE_CROP_RATIO) // CROP_ALIGN * CROP_ALIGN
+    crop_height = min(crop_width * 9 // 16, height)
+    x = eye_width + (eye_width - crop_width) // 2
+    y = (height - crop_height) // 2
+    return f'{crop_width}:{crop_height}:{x}:{y}'
+
+
+def derive_max_size(geometry, crop=None, max_size=None):
+    # Never ask scrcpy to encode more pixels than the cropped area actually has
+    longest = None
+    if crop:
+        try:
+            crop_width, crop_height = (int(value) for value in crop.split(':')[:2])
+            longest = max(crop_width, crop_height)
+        except ValueError:
+            pass
+    elif geometry:
+        longest = max(geometry['width'], geometry['height'])
+    if longest and max_size:
+        return min(longest, int(max_size))
+    return longest or max_size
+
+
+class DisplayGeometryCache:
+    # Panel geometry only changes with a firmware update, so it is cached per model and build.
+    # get() queries the headset and belongs on a worker thread; the UI only reads lookup().
+    # Failed queries are remembered for the session so a headset without `wm` is not asked again on every call.
+    def __init__(self, path):
+        self.path = path
+        self.entries = None
+        self.failed = set()
+        self.lock = threading.Lock()
+
+    def _load(self):
+        # Called with the lock held
+        if self.entries is None:
+            self.entries = {}
+            if os.path.exists(self.path):
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self.entries = yaml.safe_load(f) or {}
+        return self.entries
+
+    def _save(self):
+        # Called with the lock held; goes through a temporary file so a crash never truncates the cache
+        tmp_path = f'{self.path}.{os.getpid()}.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                yaml.dump(self.entries, f)
+            os.replace(tmp_path, self.path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def lookup(self, model, build):
+        with self.lock:
+            return self._load().get(f'{model}|{build}')
+
+    def is_known(self, model, build):
+        key = f'{model}|{build}'
+        with self.lock:
+            return key in self._load() or key in self.failed
+
+    def get(self, device_serial, model, build):
+        key = f'{model}|{build}'
+        with self.lock:
+            entries = self._load()
+            if key in entries or key in self.failed:
+                return entries.get(key)
+        try:
+            geometry = query_display_geometry(device_serial)
+        except Exception as e:
+            print(f"Display Geometry: Error querying {device_serial}: {e}")
+            geometry = None
+        with self.lock:
+            if geometry is None:
+                self.failed.add(key)
+                return None
+            entries[key] = geometry
+            self._save()
+        return geometry
@@ -0,0 +1,74 @@
+import json
+import os
+import shutil
+
+ALVR_CONFIG_DIR = os.path.join(os.environ.get('XDG_CONFIG_HOME') or os.path.join(os.path.expanduser('~'), '.config'),
+                               'alvr')
+SESSION_FILE = os.path.join(ALVR_CONFIG_DIR, 'session.json')
+BACKUP_SUFFIX = '.companion-backup'
+
+CODECS = {'h264': 'H264', 'hevc': 'Hevc', 'av1': 'AV1'}
+# Share of the measured link throughput the stream may use; Wi-Fi needs room for retransmits
+LINK_HEADROOM = {'usb': 0.8, 'wifi': 0.6}
+MIN_BITRATE_MBPS = 10
+BITRATE_STEP = 5
+# Lower the render resolution when the bitrate cannot carry full detail: (below Mbit/s, scale factor)
+SCALE_STEPS = [(30, 0.75), (50, 0.85)]
+
+
+def recommend_encoder_settings(capabilities, link_mbps=None, transport='wifi'):
+    capabilities = capabilities or {}
+    max_bitrate = capabilities.get('max_bitrate_mbps', 100)
+    bitrate = max_bitrate
+    if link_mbps:
+        bitrate = min(bitrate, link_mbps * LINK_HEADROOM.get(transport, LINK_HEADROOM['wifi']))
+    bitrate = max(MIN_BITRATE_MBPS, int(bitrate) // BITRATE_STEP * BITRATE_STEP)
+
+    scale = capabilities.get('max_resolution_scale', 1.0)
+    for threshold, factor in SCALE_STEPS:
+        if bitrate < threshold:
+            scale *= factor
+            break
+
+    return {
+        'bitrate_mbps': bitrate,
+        'codec': capabilities.get('preferred_codec', 'h264'),
+        'resolution_scale': round(scale, 2),
+    }
+
+
+def _variant(node, variant, value=None):
+    # ALVR stores choices as {"variant": name, name: value, <other choices>...}
+    node['variant'] = variant
+    if value is not None:
+        node[variant] = value
+
+
+def apply_encoder_settings(settings, session_file=SESSION_FILE):
+    with open(session_file, 'r', encoding='utf-8') as f:
+        session = json.load(f)
+    # Keep the settings from before the first tuning so revert always restores the user's own
+    if not has_backup(session_file):
+        shutil.copy2(session_file, session_file + BACKUP_SUFFIX)
+
+    video = session.setdefault('session_settings', {}).setdefault('video', {})
+    _variant(video.setdefault('preferred_codec', {}), CODECS[settings['codec']])
+    bitrate_mode = video.setdefault('bitrate', {}).setdefault('mode', {})
+    _variant(bitrate_mode, 'ConstantMbps', settings['bitrate_mbps'])
+    resolution = video.setdefault('transcoding_view_resolution', {})
+    _variant(resolution, 'Scale', settings['resolution_scale'])
+    emulated = video.setdefault('emulated_headset_view_resolution', {})
+    _variant(emulated, 'Scale', settings['resolution_scale'])
+
+    tmp_file = session_file + '.tmp'
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(session, f, indent=2)
+    os.replace(tmp_file, session_file)
+
+
+def has_backup(session_file=SESSION_FILE):
+    return os.path.exists(session_file + BACKUP_SUFFIX)
+
+
+def revert_encoder_settings(session_file=SESSION_FILE):
+    os.replace(session_file + BACKUP_SUFFIX, session_file)
@@ -0,0 +1,137 @@
+import threading
+
+from utils.adb_command import check_output_adb, run_adb, server_for
+
+ALVR_PORTS = (9943, 9944)
+# Extra headsets get the next free pair of local ports: 9945/9946, 9947/9948, ... The ALVR streamer only
+# connects to 9943/9944, so only one headset per adb server can stream over USB at a time; another one has to
+# be forwarded again after the first one's forward is removed to get the default ports.
+LOCAL_PORT_STEP = len(ALVR_PORTS)
+
+
+def parse_forward_list(output):
+    # "<serial> tcp:<local> tcp:<remote>" -> {serial: {local: remote}}
+    table = {}
+    for line in output.splitlines():
+        parts = line.split()
+        if len(parts) != 3:
+            continue
+        serial, local, remote = parts
+        table.setdefault(serial, {})[local] = remote
+    return table
+
+
+def parse_reverse_list(output):
+    # "<transport> tcp:<remote> tcp:<local>" -> {remote: local}
+    table = {}
+    for line in output.splitlines():
+        parts = line.split()
+        if len(parts) == 3:
+            table[parts[1]] = parts[2]
+    return table
+
+
+class ForwardManager:
+    # servers: the adb servers whose forward tables are merged; local ports are per server
+    def __init__(self, ports=ALVR_PORTS, servers=None):
+        self.ports = ports
+        self.servers = list(servers or [None])
+        self.forwards = {}
+        self.reverses = {}
+        # Bumped by every forward this manager adds or removes, so a listing started before it is not trusted
+        self.changes = 0
+        self.lock = threading.Lock()
+
+    def refresh(self):
+        # One `forward --list` per server covers every device; called once per monitor tick
+        with self.lock:
+            changes = self.changes
+        forwards = {}
+        failed = []
+        for server in self.servers:
+            try:
+                forwards.update(parse_forward_list(check_output_adb(['forward', '--list'], server=server, text=True)))
+            except Exception as e:
+                if len(self.servers) == 1:
+                    raise
+                print(f"Forward: {server or 'default server'}: {e}")
+                failed.append(server)
+        with self.lock:
+            if self.changes != changes:
+                return
+            # Keep what is known about devices behind a server that did not answer
+            for serial, device_forwards in self.forwards.items():
+                if serial not in forwards and server_for(serial) in failed:
+                    forwards[serial] = device_forwards
+            self.forwards = forwards
+
+    def refresh_reverse(self, device_serial):
+        output = check_output_adb(['reverse', '--list'], device_serial, text=True)
+        with self.lock:
+            self.reverses[device_serial] = parse_reverse_list(output)
+
+    def forget(self, device_serial):
+        with self.lock:
+            self.forwards.pop(device_serial, None)
+            self.reverses.pop(device_serial, None)
+
+    def get_local_ports(self, device_serial):
+        # Local ports the device is reachable on, or None when it is not (fully) forwarded
+        with self.lock:
+            device_forwards = self.forwards.get(device_serial, {})
+            remotes = {remote: local for local, remote in device_forwards.items()}
+        local_ports = [remotes.get(f'tcp:{port}') for port in self.ports]
+        if None in local_ports:
+            return None
+        return [int(local.split(':')[1]) for local in local_ports]
+
+    def is_enabled(self, device_serial):
+        return self.get_local_ports(device_serial) is not None
+
+    def is_reverse_enabled(self, device_serial):
+        with self.lock:
+            device_reverses = self.reverses.get(device_serial, {})
+        return all(f'tcp:{port}' in device_reverses for port in self.ports)
+
+    def _allocate_local_ports(self, device_serial):
+        # The default ports, the only ones the streamer uses, go to the first headset; a local port can only
+        # point at one device of a server
+        server = server_for(device_serial)
+        with self.lock:
+            taken = {int(local.split(':')[1])
+                     for serial, device_forwards in self.forwards.items()
+                     if serial != device_serial and server_for(serial) == server
+                     for local in device_forwards if local.startswith('tcp:')}
+        offset = 0
+        while any(port + offset in taken for port in self.ports):
+            offset += LOCAL_PORT_STEP
+        return [port + offset for port in self.ports]
+
+    def apply(self, device_serial, enabled, reverse=False):
+        # Idempotent: only the commands needed to reach the wanted state are issued
+        if enabled and not self.is_enabled(device_serial):
+            for local_port, port in zip(self._allocate_local_ports(device_serial), self.ports):
+                run_adb(['forward', f'tcp:{local_port}', f'tcp:{port}'], device_serial, check=True)
+                with self.lock:
+                    self.forwards.setdefault(device_serial, {})[f'tcp:{local_port}'] = f'tcp:{port}'
+                    self.changes += 1
+        elif not enabled and device_serial in self.forwards:
+            with self.lock:
+                device_forwards = dict(self.forwards.get(device_serial, {}))
+            for local, remote in device_forwards.items():
+                if remote in {f'tcp:{port}' for port in self.ports}:
+                    run_adb(['forward', '--remove', local], device_serial, check=True)
+                    with self.lock:
+                        self.forwards[device_serial].pop(local, None)
+                        self.changes += 1
+
+        if reverse:
+            self.refresh_reverse(device_serial)
+            if enabled and not self.is_reverse_enabled(device_serial):
+                for port in self.ports:
+                    run_adb(['reverse', f'tcp:{port}', f'tcp:{port}'], device_serial, check=True)
+            elif not enabled and self.reverses.get(device_serial):
+                for port in self.ports:
+                    if f'tcp:{port}' in self.reverses[device_serial]:
+                        run_adb(['reverse', '--remove', f'tcp:{port}'], device_serial, check=True)
+            self.refresh_reverse(device_serial)
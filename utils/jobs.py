@@ -0,0 +1,232 @@
+import itertools
+import threading
+
+MAX_JOBS = 8
+
+# Higher runs first; user actions jump ahead of background automation
+PRIORITY_HIGH = 10
+PRIORITY_NORMAL = 0
+PRIORITY_LOW = -10
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+_current = threading.local()
+
+
+class JobCancelled(Exception):
+    pass
+
+
+def current_job():
+    # The job running on this worker thread, for long work that wants to notice cancellation
+    return getattr(_current, 'job', None)
+
+
+def check_cancelled():
+    job = current_job()
+    if job is not None and job.cancel_requested:
+        raise JobCancelled(f'{job.key} was cancelled')
+
+
+class Job:
+    def __init__(self, scheduler, key, fn, args, device, group, priority, depends_on, sequence):
+        self.scheduler = scheduler
+        self.key = key
+        self.fn = fn
+        self.args = args
+        self.device = device
+        self.group = group
+        self.priority = priority
+        self.depends_on = list(depends_on)
+        self.sequence = sequence
+        self.state = PENDING
+        self.result = None
+        self.error = None
+        self.cancel_requested = False
+        self.callbacks = []
+        self.done_event = threading.Event()
+
+    def is_finished(self):
+        return self.state in (DONE, FAILED, CANCELLED)
+
+    def wait(self, timeout=None):
+        # Returns the job's result, or raises what it failed with
+        if not self.done_event.wait(timeout):
+            raise TimeoutError(f'{self.key} did not finish in time')
+        if self.state == CANCELLED:
+            raise JobCancelled(f'{self.key} was cancelled')
+        if self.state == FAILED:
+            raise self.error
+        return self.result
+
+    def add_done_callback(self, callback):
+        # callback(job) runs on the thread that finished the job, or right away if it already has
+        with self.scheduler.condition:
+            if not self.is_finished():
+                self.callbacks.append(callback)
+                return
+        callback(self)
+
+
+class JobScheduler:
+    # Runs downloads, installs and device commands on a small pool of worker threads.
+    # - depends_on: a job starts only after all of them are done, and fails or is cancelled with them
+    # - device: jobs for the same device never run at the same time
+    # - group: at most group_limit(group) jobs of a group run at once, e.g. installs behind one USB hub
+    # - priority: among runnable jobs the highest priority goes first, then submission order
+    # - key: submitting a key that is already pending or running returns the existing job
+    # - on_done: added as a done callback only when the job is new, so duplicates do not report twice
+    def __init__(self, max_workers=MAX_JOBS, group_limit=None):
+        self.max_workers = max_workers
+        self.group_limit = group_limit
+        self.running_groups = {}
+        self.pending = []
+        self.active = {}
+        self.busy_devices = set()
+        self.workers = 0
+        self.sequence = itertools.count()
+        self.condition = threading.Condition()
+        self.stopped = False
+
+    def submit(self, key, fn, *args, device=None, group=None, priority=PRIORITY_NORMAL, depends_on=(), on_done=None):
+        with self.condition:
+            job = self.active.get(key)
+            if job is not None and not job.cancel_requested:
+                job.priority = max(job.priority, priority)
+                return job
+            job = Job(self, key, fn, args, device, group, priority, depends_on, next(self.sequence))
+            if on_done:
+                job.callbacks.append(on_done)
+            stopped = self.stopped
+            if not stopped:
+                self.active[key] = job
+                self.pending.append(job)
+                if self.workers < self.max_workers:
+                    self.workers += 1
+                    threading.Thread(target=self._work, daemon=True).start()
+                self.condition.notify_all()
+        if stopped:
+            self._finish(job, CANCELLED)
+        return job
+
+    def find(self, key):
+        with self.condition:
+            return self.active.get(key)
+
+    def dependents(self, job):
+        with self.condition:
+            return [pending for pending in self.pending if job in pending.depends_on]
+
+    def cancel(self, job):
+        # Pending jobs are dropped; running ones are asked to stop and see it through check_cancelled()
+        if job is None:
+            return
+        with self.condition:
+            job.cancel_requested = True
+            if job in self.pending:
+                self.pending.remove(job)
+                finished = True
+            else:
+                finished = False
+            self.condition.notify_all()
+        if finished:
+            self._finish(job, CANCELLED)
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            jobs = list(self.active.values())
+        for job in jobs:
+            self.cancel(job)
+
+    def _next_job(self):
+        # Called with the condition held; returns a runnable job, or None
+        blocked = []
+        for job in sorted(self.pending, key=lambda job: (-job.priority, job.sequence)):
+            failed = next((dependency for dependency in job.depends_on
+                           if dependency.state in (FAILED, CANCELLED)), None)
+            if failed is not None:
+                blocked.append((job, failed))
+                continue
+            if any(dependency.state != DONE for dependency in job.depends_on):
+                continue
+            if job.device is not None and job.device in self.busy_devices:
+                continue
+            if job.group is not None and self.group_limit is not None:
+                limit = self.group_limit(job.group)
+                if limit is not None and self.running_groups.get(job.group, 0) >= limit:
+                    continue
+            self.pending.remove(job)
+            return job, blocked
+        return None, blocked
+
+    def _work(self):
+        while True:
+            with self.condition:
+                while True:
+                    job, blocked = self._next_job()
+                    for blocked_job, _dependency in blocked:
+                        self.pending.remove(blocked_job)
+                    if job is not None or blocked or self.stopped:
+                        break
+                    if not self.pending:
+                        # Idle workers exit; submit() starts new ones as needed
+                        self.workers -= 1
+                        return
+                    self.condition.wait()
+                if job is not None:
+                    job.state = RUNNING
+                    if job.device is not None:
+                        self.busy_devices.add(job.device)
+                    if job.group is not None:
+                        self.running_groups[job.group] = self.running_groups.get(job.group, 0) + 1
+            for blocked_job, dependency in blocked:
+                if dependency.state == CANCELLED:
+                    self._finish(blocked_job, CANCELLED)
+                else:
+                    self._finish(blocked_job, FAILED, error=dependency.error)
+            if job is None:
+                if self.stopped:
+                    with self.condition:
+                        self.workers -= 1
+                    return
+                continue
+            self._run(job)
+
+    def _run(self, job):
+        _current.job = job
+        try:
+            result = job.fn(*job.args)
+        except JobCancelled:
+            self._finish(job, CANCELLED)
+        except Exception as e:
+            self._finish(job, FAILED, error=e)
+        else:
+            self._finish(job, DONE, result=result)
+        finally:
+            _current.job = None
+
+    def _finish(self, job, state, result=None, error=None):
+        with self.condition:
+            if job.state == RUNNING:
+                self.busy_devices.discard(job.device)
+                if job.group is not None:
+                    self.running_groups[job.group] -= 1
+            job.state = state
+            job.result = result
+            job.error = error
+            if self.active.get(job.key) is job:
+                del self.active[job.key]
+            callbacks, job.callbacks = job.callbacks, []
+            self.condition.notify_all()
+        for callback in callbacks:
+            try:
+                callback(job)
+            except Exception as e:
+                print(f"Jobs: callback for {job.key} failed: {e}")
+        # Set last so wait() returns after the callbacks have reported the outcome
+        job.done_event.set()
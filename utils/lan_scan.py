@@ -0,0 +1,163 @@
+import asyncio
+import ipaddress
+import os
+import re
+import socket
+import struct
+import subprocess
+import time
+
+import yaml
+
+from utils.adb_command import check_output_adb
+
+ADB_PORT = 5555
+SCAN_CONCURRENCY = 256
+CONNECT_TIMEOUT = 0.3
+HANDSHAKE_TIMEOUT = 0.5
+# Wider subnets are narrowed to the host's own /24 so a sweep stays at 254 probes
+MIN_PREFIX = 24
+# Cached hosts not seen for this long are dropped
+KNOWN_HOST_TTL = 30 * 24 * 3600
+
+# adb wire protocol: a 24 byte little-endian header (command, arg0, arg1, length, checksum, magic)
+A_CNXN = 0x4e584e43
+A_AUTH = 0x48545541
+A_STLS = 0x534c5453
+A_VERSION = 0x01000001
+MAX_PAYLOAD = 256 * 1024
+HEADER = struct.Struct('<6I')
+ADB_REPLIES = (A_CNXN, A_AUTH, A_STLS)
+
+MDNS_ADDRESS_PATTERN = re.compile(r'(\d{1,3}(?:\.\d{1,3}){3}):(\d+)')
+
+
+def adb_message(command, arg0, arg1, payload):
+    return HEADER.pack(command, arg0, arg1, len(payload), sum(payload) & 0xffffffff,
+                       command ^ 0xffffffff) + payload
+
+
+def is_adb_reply(header):
+    command, _arg0, _arg1, _length, _checksum, magic = HEADER.unpack(header)
+    return command in ADB_REPLIES and magic == command ^ 0xffffffff
+
+
+async def probe(host, port=ADB_PORT, connect_timeout=CONNECT_TIMEOUT, handshake_timeout=HANDSHAKE_TIMEOUT):
+    # True when host:port answers an adb CNXN with CNXN, AUTH or STLS; an open port alone is not enough
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), connect_timeout)
+    except (OSError, asyncio.TimeoutError):
+        return False
+    try:
+        writer.write(adb_message(A_CNXN, A_VERSION, MAX_PAYLOAD, b'host::\0'))
+        await writer.drain()
+        header = await asyncio.wait_for(reader.readexactly(HEADER.size), handshake_timeout)
+        return is_adb_reply(header)
+    except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError):
+        return False
+    finally:
+        writer.close()
+
+
+async def probe_all(addresses, concurrency=SCAN_CONCURRENCY, **timeouts):
+    # addresses: [(host, port)]; returns the ones that speak adb, in input order
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def bounded(host, port):
+        async with semaphore:
+            return await probe(host, port, **timeouts)
+
+    results = await asyncio.gather(*(bounded(host, port) for host, port in addresses))
+    return [address for address, is_adb in zip(addresses, results) if is_adb]
+
+
+def local_subnets():
+    # IPv4 networks of the host's non-loopback interfaces
+    networks = []
+    try:
+        output = subprocess.check_output(['ip', '-o', '-4', 'addr', 'show'], text=True)
+        for line in output.splitlines():
+            fields = line.split()
+            if 'inet' in fields:
+                interface = ipaddress.ip_interface(fields[fields.index('inet') + 1])
+                if not interface.is_loopback:
+                    networks.append(narrow(interface))
+    except (OSError, subprocess.CalledProcessError, ValueError):
+        pass
+    if not networks:
+        # No iproute2: the address of the default route; connect() on UDP sends nothing
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            try:
+                sock.connect(('192.0.2.1', 9))
+                networks.append(narrow(ipaddress.ip_interface(f'{sock.getsockname()[0]}/{MIN_PREFIX}')))
+            except OSError:
+                pass
+    return list(dict.fromkeys(networks))
+
+
+def narrow(interface):
+    if interface.network.prefixlen >= MIN_PREFIX:
+        return interface.network
+    return ipaddress.ip_interface(f'{interface.ip}/{MIN_PREFIX}').network
+
+
+def mdns_services():
+    # (host, port) of adb services announced over mDNS, when the adb server has mDNS support
+    try:
+        output = check_output_adb(['mdns', 'services'], text=True)
+    except Exception:
+        return []
+    return [(match.group(1), int(match.group(2))) for match in MDNS_ADDRESS_PATTERN.finditer(output)]
+
+
+def scan(subnets=None, port=ADB_PORT, known=(), use_mdns=True, concurrency=SCAN_CONCURRENCY, **timeouts):
+    # Known hosts and mDNS announcements go first, then every address of the local subnets.
+    # Returns confirmed 'host:port' addresses.
+    candidates = [tuple(address.rsplit(':', 1)) for address in known]
+    candidates = [(host, int(port)) for host, port in candidates]
+    if use_mdns:
+        candidates += mdns_services()
+    for network in local_subnets() if subnets is None else subnets:
+        candidates += [(str(host), port) for host in ipaddress.ip_network(network).hosts()]
+    candidates = list(dict.fromkeys(candidates))
+    found = asyncio.run(probe_all(candidates, concurrency, **timeouts))
+    return [f'{host}:{port}' for host, port in found]
+
+
+class KnownHosts:
+    # Addresses that answered as adb before, probed first on the next scan
+    def __init__(self, path):
+        self.path = path
+        self.entries = None
+
+    def _load(self):
+        if self.entries is None:
+            self.entries = {}
+            if os.path.exists(self.path):
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self.entries = yaml.safe_load(f) or {}
+        return self.entries
+
+    def _save(self):
+        # Renamed over the old file, so a scan interrupted mid-write keeps the previous hosts
+        tmp_path = f'{self.path}.{os.getpid()}.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                yaml.dump(self.entries, f)
+            os.replace(tmp_path, self.path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def addresses(self):
+        now = time.time()
+        return [address for address, seen in self._load().items() if now - seen < KNOWN_HOST_TTL]
+
+    def remember(self, addresses):
+        entries = self._load()
+        now = time.time()
+        for address in addresses:
+            entries[address] = now
+        for address in [address for address, seen in entries.items() if now - seen >= KNOWN_HOST_TTL]:
+            del entries[address]
+        self._save()
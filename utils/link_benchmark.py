@@ -0,0 +1,105 @@
+import os
+import statistics
+import subprocess
+import tempfile
+import time
+
+from utils.adb_command import prepaid_adb, run_adb
+from utils.adb_shell import AdbShell
+
+PING_COUNT = 10
+PAYLOAD_SIZE = 8 * 1024 * 1024
+REMOTE_PAYLOAD = '/data/local/tmp/alvr_companion_benchmark.bin'
+HISTORY_LIMIT = 20
+# Rough floor for an ALVR stream at default settings, in Mbit/s
+MIN_STREAM_MBPS = 100
+
+
+def measure_rtt(transport_serial, count=PING_COUNT):
+    # Round trips over a warm shell measure the transport, not adb's process and connection setup; the rate
+    # limiter's token is taken before the clock starts
+    shell = AdbShell(transport_serial)
+    try:
+        shell.run('true')
+        samples = []
+        for _ in range(count):
+            with prepaid_adb():
+                start = time.perf_counter()
+                shell.run('true')
+                samples.append((time.perf_counter() - start) * 1000)
+        return samples
+    finally:
+        shell.close()
+
+
+def measure_throughput(transport_serial, size=PAYLOAD_SIZE):
+    # Push then pull a generated payload; returns (push Mbit/s, pull Mbit/s)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        local_payload = os.path.join(tmp_dir, 'payload.bin')
+        with open(local_payload, 'wb') as f:
+            f.write(os.urandom(size))
+        try:
+            with prepaid_adb():
+                start = time.perf_counter()
+                run_adb(['push', local_payload, REMOTE_PAYLOAD], transport_serial,
+                        stdout=subprocess.DEVNULL, check=True, timeout=120)
+                push_seconds = time.perf_counter() - start
+
+            with prepaid_adb():
+                start = time.perf_counter()
+                run_adb(['pull', REMOTE_PAYLOAD, os.path.join(tmp_dir, 'pulled.bin')], transport_serial,
+                        stdout=subprocess.DEVNULL, check=True, timeout=120)
+                pull_seconds = time.perf_counter() - start
+        finally:
+            run_adb(['shell', 'rm', '-f', REMOTE_PAYLOAD], transport_serial,
+                    stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False)
+    megabits = size * 8 / 1_000_000
+    return megabits / push_seconds, megabits / pull_seconds
+
+
+def benchmark_transport(transport_serial, transport):
+    rtt_samples = measure_rtt(transport_serial)
+    push_mbps, pull_mbps = measure_throughput(transport_serial)
+    return {
+        'transport': transport,
+        'serial': transport_serial,
+        'time': int(time.time()),
+        'rtt_ms': round(statistics.median(rtt_samples), 2),
+        'jitter_ms': round(statistics.pstdev(rtt_samples), 2),
+        'push_mbps': round(push_mbps, 1),
+        'pull_mbps': round(pull_mbps, 1),
+    }
+
+
+def benchmark_device(transports):
+    # transports: {'usb': serial, 'wifi': 'ip:5555'}; a failing transport is reported, not raised
+    results = []
+    for transport, transport_serial in transports.items():
+        if not transport_serial:
+            continue
+        try:
+            results.append(benchmark_transport(transport_serial, transport))
+        except Exception as e:
+            results.append({'transport': transport, 'serial': transport_serial,
+                            'time': int(time.time()), 'error': str(e)})
+    return results
+
+
+def add_to_history(history, results, limit=HISTORY_LIMIT):
+    return (list(history or []) + results)[-limit:]
+
+
+def recommend_transport(history):
+    # Latest successful result per transport; prefer the one with the better sustained throughput
+    latest = {}
+    for result in history or []:
+        if 'error' not in result:
+            latest[result['transport']] = result
+    if not latest:
+        return None
+    best = max(latest.values(), key=lambda r: (min(r['push_mbps'], r['pull_mbps']), -r['rtt_ms']))
+    return {
+        'transport': best['transport'],
+        'throughput_mbps': min(best['push_mbps'], best['pull_mbps']),
+        'sufficient': min(best['push_mbps'], best['pull_mbps']) >= MIN_STREAM_MBPS,
+    }
@@ -0,0 +1,103 @@
+import re
+import subprocess
+import threading
+import time
+from collections import deque, namedtuple
+
+from utils.adb_command import popen_adb
+from utils.adb_shell import AdbShellError, shell_output
+
+APK_PACKAGE_NAME = 'alvr.client.stable'
+ENTRY_BUFFER_SIZE = 500
+EVENT_BUFFER_SIZE = 50
+PID_CHECK_INTERVAL = 10
+
+# threadtime: "10-19 12:34:56.789  1234  1250 I Tag     : message"
+THREADTIME_PATTERN = re.compile(
+    r'^(\d\d-\d\d \d\d:\d\d:\d\d\.\d+)\s+(\d+)\s+(\d+)\s+([VDIWEF])\s+(.*?)\s*: (.*)$')
+
+EVENT_PATTERNS = [
+    ('decoder_stall', re.compile(r'(decoder|mediacodec|codec).*(stall|timed? ?out|underrun|not responding)'
+                                 r'|dequeue\w*buffer.*(timed? ?out|-11\b)', re.IGNORECASE)),
+    ('reconnect', re.compile(r'reconnect|connection (lost|closed|reset)|disconnected|'
+                             r'(stream|client) (connected|started)', re.IGNORECASE)),
+]
+
+LogEntry = namedtuple('LogEntry', ['time', 'pid', 'tid', 'level', 'tag', 'message'])
+LogEvent = namedtuple('LogEvent', ['kind', 'entry'])
+
+
+def parse_logcat_lines(lines):
+    # Streaming: consumes any line iterable lazily and yields parsed entries
+    for line in lines:
+        match = THREADTIME_PATTERN.match(line.rstrip('\n'))
+        if match:
+            time_, pid, tid, level, tag, message = match.groups()
+            yield LogEntry(time_, int(pid), int(tid), level, tag, message)
+
+
+def classify_entry(entry):
+    for kind, pattern in EVENT_PATTERNS:
+        if pattern.search(entry.message):
+            return kind
+    if entry.level in ('E', 'F'):
+        return 'error'
+    return None
+
+
+class LogcatMonitor:
+    # Follows the ALVR client's log; filtering by PID and priority happens in logcat on the headset
+    def __init__(self, device_serial, on_event=None):
+        self.device_serial = device_serial
+        self.on_event = on_event
+        self.entries = deque(maxlen=ENTRY_BUFFER_SIZE)
+        self.events = deque(maxlen=EVENT_BUFFER_SIZE)
+        self.process = None
+        self.stop_event = threading.Event()
+
+    def start(self):
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def stop(self):
+        self.stop_event.set()
+        self._stop_process()
+
+    def _client_pid(self):
+        try:
+            return shell_output(self.device_serial, f'pidof -s {APK_PACKAGE_NAME}').strip() or None
+        except AdbShellError:
+            return None
+
+    def _stop_process(self):
+        process = self.process
+        if process is not None and process.poll() is None:
+            process.terminate()
+
+    def _watch_pid(self, process, pid):
+        # The client restarting gets a new PID; drop the stream so it is reopened with the new one
+        while not self.stop_event.wait(PID_CHECK_INTERVAL) and process.poll() is None:
+            if self._client_pid() != pid:
+                process.terminate()
+                return
+
+    def _run(self):
+        while not self.stop_event.is_set():
+            pid = self._client_pid()
+            if pid is None:
+                self.stop_event.wait(PID_CHECK_INTERVAL)
+                continue
+            self.process = popen_adb(
+                ['logcat', '-v', 'threadtime', '-T', '1', f'--pid={pid}', '*:I'], self.device_serial,
+                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, errors='replace')
+            threading.Thread(target=self._watch_pid, args=(self.process, pid), daemon=True).start()
+            for entry in parse_logcat_lines(self.process.stdout):
+                self.entries.append(entry)
+                kind = classify_entry(entry)
+                if kind is not None:
+                    event = LogEvent(kind, entry)
+                    self.events.append(event)
+                    if self.on_event:
+                        self.on_event(self.device_serial, event)
+            self.process.wait()
+            if not self.stop_event.is_set():
+                time.sleep(1)
@@ -0,0 +1,125 @@
+import json
+import re
+import subprocess
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds in seconds, Prometheus style; the last bucket is +Inf
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+IP_SERIAL_PATTERN = re.compile(r'^\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}:\d+$')
+
+
+def transport_of(device_serial):
+    if device_serial is None:
+        return 'host'
+    return 'wifi' if IP_SERIAL_PATTERN.match(device_serial) else 'usb'
+
+
+class CommandStats:
+    def __init__(self):
+        self.count = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def add(self, duration, failed, timed_out):
+        self.count += 1
+        self.failures += failed
+        self.timeouts += timed_out
+        self.total_seconds += duration
+        self.max_seconds = max(self.max_seconds, duration)
+        for index, bound in enumerate(LATENCY_BUCKETS):
+            if duration <= bound:
+                self.buckets[index] += 1
+                break
+        else:
+            self.buckets[-1] += 1
+
+
+class AdbMetrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stats = {}
+        self.started = time.time()
+
+    def record(self, command, device_serial, duration, failed=False, timed_out=False):
+        key = (command, device_serial or '', transport_of(device_serial))
+        with self.lock:
+            stats = self.stats.get(key)
+            if stats is None:
+                stats = self.stats[key] = CommandStats()
+            stats.add(duration, failed, timed_out)
+
+    @contextmanager
+    def timed(self, command, device_serial=None):
+        start = time.perf_counter()
+        failed = timed_out = False
+        try:
+            yield
+        except (subprocess.TimeoutExpired, TimeoutError):
+            failed = timed_out = True
+            raise
+        except Exception:
+            failed = True
+            raise
+        finally:
+            self.record(command, device_serial, time.perf_counter() - start, failed, timed_out)
+
+    def snapshot(self):
+        with self.lock:
+            return [{
+                'command': command,
+                'device': device,
+                'transport': transport,
+                'count': stats.count,
+                'failures': stats.failures,
+                'timeouts': stats.timeouts,
+                'total_seconds': round(stats.total_seconds, 6),
+                'max_seconds': round(stats.max_seconds, 6),
+                'buckets': dict(zip([str(bound) for bound in LATENCY_BUCKETS] + ['+Inf'], stats.buckets)),
+            } for (command, device, transport), stats in sorted(self.stats.items())]
+
+    def to_json(self):
+        return json.dumps({'started': self.started, 'exported': time.time(), 'commands': self.snapshot()}, indent=2)
+
+    def to_prometheus(self):
+        lines = [
+            '# HELP alvr_companion_adb_command_seconds Latency of adb commands issued by the companion.',
+            '# TYPE alvr_companion_adb_command_seconds histogram',
+        ]
+        failures = []
+        timeouts = []
+        for entry in self.snapshot():
+            labels = f'command="{entry["command"]}",device="{entry["device"]}",transport="{entry["transport"]}"'
+            cumulative = 0
+            for bound, count in entry['buckets'].items():
+                cumulative += count
+                lines.append(f'alvr_companion_adb_command_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'alvr_companion_adb_command_seconds_sum{{{labels}}} {entry["total_seconds"]}')
+            lines.append(f'alvr_companion_adb_command_seconds_count{{{labels}}} {entry["count"]}')
+            failures.append(f'alvr_companion_adb_command_failures_total{{{labels}}} {entry["failures"]}')
+            timeouts.append(f'alvr_companion_adb_command_timeouts_total{{{labels}}} {entry["timeouts"]}')
+        lines += ['# HELP alvr_companion_adb_command_failures_total adb commands that failed.',
+                  '# TYPE alvr_companion_adb_command_failures_total counter']
+        lines += failures
+        lines += ['# HELP alvr_companion_adb_command_timeouts_total adb commands that timed out.',
+                  '# TYPE alvr_companion_adb_command_timeouts_total counter']
+        lines += timeouts
+        return '\n'.join(lines) + '\n'
+
+
+def format_metrics(metrics):
+    lines = [f"{'command':<22}{'device':<24}{'transport':<10}{'count':>7}{'fail':>6}{'t/o':>5}{'avg ms':>9}{'max ms':>9}"]
+    for entry in metrics.snapshot():
+        average = entry['total_seconds'] / entry['count'] * 1000 if entry['count'] else 0
+        lines.append(f"{entry['command']:<22}{entry['device'][:23]:<24}{entry['transport']:<10}"
+                     f"{entry['count']:>7}{entry['failures']:>6}{entry['timeouts']:>5}"
+                     f"{average:>9.1f}{entry['max_seconds'] * 1000:>9.1f}")
+    return '\n'.join(lines)
+
+
+metrics = AdbMetrics()
@@ -0,0 +1,141 @@
+import glob
+import os
+import threading
+import time
+
+POWER_SUPPLY_DIR = '/sys/class/power_supply'
+POWER_CHECK_INTERVAL = 60
+
+# Multipliers applied to a poller's base interval
+HIDDEN_FACTOR = 10
+UNFOCUSED_FACTOR = 3
+NO_PAGE_FACTOR = 2
+BATTERY_FACTOR = 2
+IDLE_STEPS = [(600, 2), (3600, 4)]  # (seconds without changes, factor)
+
+
+# Lanes of the adb rate limiter, most urgent first
+LANE_INTERACTIVE = 0
+LANE_MONITOR = 1
+LANE_BACKGROUND = 2
+
+
+class AdbRateLimiter:
+    # Token bucket limiting how many adb commands the companion may issue per second.
+    # Each lane leaves the reserves of the lanes before it in the bucket: the device monitor keeps `reserve`
+    # tokens for user actions, background jobs keep `reserve + monitor_reserve`, so a user action never queues
+    # behind polling and polling is not starved by jobs waiting in acquire().
+    def __init__(self, rate, burst=None, reserve=0, monitor_reserve=0):
+        self.lock = threading.Lock()
+        self.set_rate(rate, burst, reserve, monitor_reserve)
+
+    def set_rate(self, rate, burst=None, reserve=0, monitor_reserve=0):
+        with self.lock:
+            self.rate = rate
+            self.burst = burst or rate
+            self.reserve = min(reserve, self.burst - 1)
+            self.monitor_reserve = min(monitor_reserve, self.burst - 1 - self.reserve)
+            self.tokens = float(self.burst)
+            self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def _needed(self, cost, lane):
+        floor = 0
+        if lane >= LANE_MONITOR:
+            floor += self.reserve
+        if lane >= LANE_BACKGROUND:
+            floor += self.monitor_reserve
+        # Let oversized requests through on a full bucket so they are not starved forever
+        return floor + min(cost, self.burst - floor)
+
+    def can_acquire(self, cost=1, lane=LANE_BACKGROUND):
+        with self.lock:
+            self._refill()
+            return self.tokens >= self._needed(cost, lane)
+
+    def try_acquire(self, cost=1, lane=LANE_BACKGROUND):
+        with self.lock:
+            self._refill()
+            if self.tokens >= self._needed(cost, lane):
+                self.tokens -= cost
+                return True
+            return False
+
+    def acquire(self, cost=1, timeout=None, lane=LANE_BACKGROUND):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.try_acquire(cost, lane):
+            with self.lock:
+                wait = (self._needed(cost, lane) - self.tokens) / self.rate
+            if deadline is not None and time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+        return True
+
+
+def is_on_battery():
+    # True when a battery is present and no mains adapter reports online
+    has_battery = False
+    for supply in glob.glob(os.path.join(POWER_SUPPLY_DIR, '*')):
+        try:
+            with open(os.path.join(supply, 'type'), encoding='utf-8') as f:
+                supply_type = f.read().strip()
+            if supply_type == 'Battery':
+                has_battery = True
+            elif supply_type in ('Mains', 'USB'):
+                with open(os.path.join(supply, 'online'), encoding='utf-8') as f:
+                    if f.read().strip() == '1':
+                        return False
+        except OSError:
+            continue
+    return has_battery
+
+
+class PollState:
+    # Signals shared by every poller of one window
+    def __init__(self):
+        self.visible = True
+        self.focused = True
+        self.page_open = False
+        self.last_change = time.monotonic()
+        self._on_battery = False
+        self._power_checked = 0
+
+    def mark_change(self):
+        self.last_change = time.monotonic()
+
+    def on_battery(self):
+        now = time.monotonic()
+        if now - self._power_checked > POWER_CHECK_INTERVAL:
+            self._on_battery = is_on_battery()
+            self._power_checked = now
+        return self._on_battery
+
+
+class AdaptiveInterval:
+    def __init__(self, state, base, maximum, needs_page=False):
+        self.state = state
+        self.base = base
+        self.maximum = maximum
+        self.needs_page = needs_page
+
+    def next_interval(self):
+        state = self.state
+        interval = self.base
+        if not state.visible:
+            interval *= HIDDEN_FACTOR
+        elif not state.focused:
+            interval *= UNFOCUSED_FACTOR
+        if self.needs_page and not state.page_open:
+            interval *= NO_PAGE_FACTOR
+        idle = time.monotonic() - state.last_change
+        for threshold, factor in reversed(IDLE_STEPS):
+            if idle >= threshold:
+                interval *= factor
+                break
+        if state.on_battery():
+            interval *= BATTERY_FACTOR
+        return min(interval, self.maximum)
@@ -0,0 +1,32 @@
+from array import array
+
+
+class RingBuffer:
+    # Fixed-capacity series backed by a flat array: 8 bytes per sample for 'd', no per-item objects
+    def __init__(self, capacity, typecode='d'):
+        self.capacity = capacity
+        self.data = array(typecode, [0]) * capacity
+        self.next = 0
+        self.length = 0
+
+    def append(self, value):
+        self.data[self.next] = value
+        self.next = (self.next + 1) % self.capacity
+        self.length = min(self.length + 1, self.capacity)
+
+    def __len__(self):
+        return self.length
+
+    def values(self):
+        if self.length < self.capacity:
+            return self.data[:self.length].tolist()
+        return (self.data[self.next:] + self.data[:self.next]).tolist()
+
+    def last(self, default=None):
+        if self.length == 0:
+            return default
+        return self.data[self.next - 1]
+
+    def clear(self):
+        self.next = 0
+        self.length = 0
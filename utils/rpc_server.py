@@ -0,0 +1,206 @@
+import inspect
+import json
+import os
+import queue
+import socket
+import tempfile
+import threading
+
+SOCKET_PATH = os.path.join(os.environ.get('XDG_RUNTIME_DIR') or tempfile.gettempdir(), 'alvr-companion.sock')
+
+# JSON-RPC 2.0 error codes
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+SERVER_ERROR = -32000
+
+# Messages queued for a client before it counts as stuck and is disconnected
+SEND_QUEUE_SIZE = 256
+
+
+class RpcError(Exception):
+    def __init__(self, message, code=SERVER_ERROR):
+        super().__init__(message)
+        self.code = code
+
+
+class RpcConnection:
+    # Replies and notifications go through a bounded queue drained by a writer thread, so a client that stops
+    # reading never blocks the thread sending to it (the device monitor, for notifications)
+    def __init__(self, server, sock, queue_size=SEND_QUEUE_SIZE):
+        self.server = server
+        self.sock = sock
+        self.subscribed = False
+        self.outgoing = queue.Queue(maxsize=queue_size)
+        self.closed = False
+        threading.Thread(target=self._write, daemon=True).start()
+
+    def send(self, message):
+        # False when the client fell too far behind; it is disconnected then
+        if self.closed:
+            return False
+        try:
+            self.outgoing.put_nowait((json.dumps(message) + '\n').encode())
+        except queue.Full:
+            self.close()
+            return False
+        return True
+
+    def _write(self):
+        while True:
+            data = self.outgoing.get()
+            if data is None:
+                return
+            try:
+                self.sock.sendall(data)
+            except OSError:
+                self.close()
+                return
+
+    def close(self):
+        # Shutting the socket down also wakes the reader and writer threads blocked on it
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        try:
+            self.outgoing.put_nowait(None)
+        except queue.Full:
+            pass  # The writer is stuck in sendall(), which the shutdown ends
+
+    def serve(self):
+        try:
+            with self.sock.makefile('r', encoding='utf-8') as lines:
+                for line in lines:
+                    if line.strip():
+                        response = self.handle(line)
+                        if response is not None:
+                            self.send(response)
+        except OSError:
+            pass
+        finally:
+            self.server.drop(self)
+            self.close()
+            self.sock.close()
+
+    def handle(self, line):
+        try:
+            request = json.loads(line)
+        except ValueError:
+            return {'jsonrpc': '2.0', 'id': None, 'error': {'code': PARSE_ERROR, 'message': 'Parse error'}}
+        if not isinstance(request, dict) or not isinstance(request.get('method'), str):
+            return {'jsonrpc': '2.0', 'id': None, 'error': {'code': INVALID_REQUEST, 'message': 'Invalid request'}}
+
+        request_id = request.get('id')
+        params = request.get('params') or {}
+        try:
+            if request['method'] == 'devices.subscribe':
+                self.subscribed = True
+            method = self.server.methods.get(request['method'])
+            if method is None:
+                raise RpcError(f"Method not found: {request['method']}", METHOD_NOT_FOUND)
+            if not isinstance(params, dict):
+                raise RpcError('Params must be an object', INVALID_PARAMS)
+            try:
+                inspect.signature(method).bind(**params)
+            except TypeError as e:
+                raise RpcError(str(e), INVALID_PARAMS)
+            result = method(**params)
+        except RpcError as e:
+            response = {'jsonrpc': '2.0', 'id': request_id, 'error': {'code': e.code, 'message': str(e)}}
+        except Exception as e:
+            response = {'jsonrpc': '2.0', 'id': request_id, 'error': {'code': SERVER_ERROR, 'message': str(e)}}
+        else:
+            response = {'jsonrpc': '2.0', 'id': request_id, 'result': result}
+        # Requests without an id are notifications and get no reply
+        return response if 'id' in request else None
+
+
+class RpcServer:
+    # Newline-delimited JSON-RPC 2.0 over a Unix socket. Each client gets its own thread, so a long call
+    # (an install) only blocks the client that made it. Clients that called devices.subscribe also
+    # receive the notifications passed to notify(); one that does not read them is disconnected once
+    # `send_queue_size` messages are waiting for it.
+    def __init__(self, methods, path=SOCKET_PATH, send_queue_size=SEND_QUEUE_SIZE):
+        self.methods = methods
+        self.path = path
+        self.send_queue_size = send_queue_size
+        self.connections = set()
+        self.lock = threading.Lock()
+        self.sock = None
+
+    def start(self):
+        if os.path.exists(self.path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.path)
+                raise RpcError(f'Another companion is already serving {self.path}')
+            except (ConnectionRefusedError, FileNotFoundError):
+                os.unlink(self.path)  # Left behind by a companion that did not shut down cleanly
+            finally:
+                probe.close()
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        old_umask = os.umask(0o077)  # Only the current user may talk to the companion
+        try:
+            self.sock.bind(self.path)
+        finally:
+            os.umask(old_umask)
+        self.sock.listen()
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def stop(self):
+        if self.sock is None:
+            return
+        self.sock.close()
+        self.sock = None
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+        with self.lock:
+            connections = list(self.connections)
+        for connection in connections:
+            connection.close()
+
+    def _accept(self):
+        while self.sock is not None:
+            try:
+                client, _address = self.sock.accept()
+            except OSError:
+                return
+            connection = RpcConnection(self, client, self.send_queue_size)
+            with self.lock:
+                self.connections.add(connection)
+            threading.Thread(target=connection.serve, daemon=True).start()
+
+    def drop(self, connection):
+        with self.lock:
+            self.connections.discard(connection)
+
+    def notify(self, method, params):
+        with self.lock:
+            subscribers = [connection for connection in self.connections if connection.subscribed]
+        for connection in subscribers:
+            if not connection.send({'jsonrpc': '2.0', 'method': method, 'params': params}):
+                self.drop(connection)
+
+
+def rpc_call(method, params=None, path=SOCKET_PATH, timeout=None):
+    # One-shot client for scripts: python -c "from utils.rpc_server import rpc_call; print(rpc_call('devices.list'))"
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(path)
+        sock.sendall((json.dumps({'jsonrpc': '2.0', 'id': 1, 'method': method, 'params': params or {}}) + '\n').encode())
+        with sock.makefile('r', encoding='utf-8') as lines:
+            for line in lines:
+                response = json.loads(line)
+                if response.get('id') != 1:
+                    continue  # A subscription notification
+                if 'error' in response:
+                    raise RpcError(response['error']['message'], response['error']['code'])
+                return response['result']
+    raise RpcError('Connection closed')
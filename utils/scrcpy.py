@@ -0,0 +1,138 @@
+import re
+import shutil
+import subprocess
+import threading
+from collections import deque
+
+from utils.adb_command import server_env
+
+FPS_PATTERN = re.compile(r'(\d+(?:\.\d+)?) fps')
+MAX_ERRORS = 20
+
+# devices.yaml key -> scrcpy option
+PROFILE_OPTIONS = {
+    'max_size': '--max-size',
+    'video_bit_rate': '--video-bit-rate',
+    'max_fps': '--max-fps',
+    'video_codec': '--video-codec',
+    'video_buffer': '--video-buffer',
+    'display_buffer': '--display-buffer',
+}
+
+
+def build_scrcpy_command(device_serial, profile=None, crop_params=None, window_title=None):
+    command = ['scrcpy', '-s', device_serial, '--print-fps']
+    for key, option in PROFILE_OPTIONS.items():
+        value = (profile or {}).get(key)
+        if value is not None:
+            command.append(f'{option}={value}')
+    if (profile or {}).get('no_audio'):
+        command.append('--no-audio')
+    if crop_params:
+        command.extend(['--crop', crop_params])
+    if window_title:
+        command.extend(['--window-title', window_title])
+    return command
+
+
+class ScrcpySession:
+    def __init__(self, device_serial, command, window_title, on_update=None):
+        self.device_serial = device_serial
+        self.command = command
+        self.window_title = window_title
+        self.on_update = on_update
+        self.process = None
+        self.fps = None
+        self.errors = deque(maxlen=MAX_ERRORS)
+
+    def start(self):
+        self.process = subprocess.Popen(self.command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                        stdin=subprocess.DEVNULL, text=True, bufsize=1,
+                                        env=server_env(self.device_serial))
+        threading.Thread(target=self._read_output, daemon=True).start()
+
+    def _read_output(self):
+        for line in self.process.stdout:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith('ERROR:'):
+                self.errors.append(line[len('ERROR:'):].strip())
+            else:
+                match = FPS_PATTERN.search(line)
+                if not match:
+                    continue
+                self.fps = float(match.group(1))
+            self._notify()
+        self.process.wait()
+        self.fps = None
+        self._notify()
+
+    def _notify(self):
+        if self.on_update:
+            self.on_update(self)
+
+    def is_running(self):
+        return self.process is not None and self.process.poll() is None
+
+    def focus(self):
+        # scrcpy has no IPC, so raise its window by title when a window tool is present
+        if shutil.which('wmctrl'):
+            subprocess.run(['wmctrl', '-a', self.window_title], check=False)
+        elif shutil.which('xdotool'):
+            subprocess.run(['xdotool', 'search', '--name', self.window_title, 'windowactivate'], check=False)
+
+    def stop(self, timeout=3):
+        if not self.is_running():
+            return
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+
+
+class ScrcpyManager:
+    # One scrcpy process per device: a second start request reuses the running mirror.
+    # Started from the UI thread and from core jobs alike, so the session table is only touched under the lock.
+    def __init__(self, on_update=None):
+        self.on_update = on_update
+        self.sessions = {}
+        self.lock = threading.Lock()
+
+    def get(self, device_serial):
+        with self.lock:
+            return self._running(device_serial)
+
+    def _running(self, device_serial):
+        # Called with the lock held
+        session = self.sessions.get(device_serial)
+        if session and session.is_running():
+            return session
+        return None
+
+    def start(self, device_serial, profile=None, crop_params=None):
+        with self.lock:
+            session = self._running(device_serial)
+            if session is None:
+                window_title = f'ALVR Companion - {device_serial}'
+                command = build_scrcpy_command(device_serial, profile, crop_params, window_title)
+                session = ScrcpySession(device_serial, command, window_title, self.on_update)
+                session.start()
+                self.sessions[device_serial] = session
+                return session
+        session.focus()
+        return session
+
+    def stop(self, device_serial):
+        with self.lock:
+            session = self.sessions.pop(device_serial, None)
+        if session:
+            session.stop()
+
+    def stop_all(self):
+        with self.lock:
+            device_serials = list(self.sessions)
+        for device_serial in device_serials:
+            self.stop(device_serial)
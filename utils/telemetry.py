@@ -0,0 +1,101 @@
+import time
+
+from utils.ring_buffer import RingBuffer
+
+# One sample per info poll. Polls back off from 5 s to 5 min while idle, so the raw series holds
+# at least an hour and the long-term one at least a day, whatever the poll rate was.
+RAW_CAPACITY = 720
+BUCKET_SECONDS = 60         # raw samples in the same wall-clock minute are averaged into one long-term sample
+LONG_TERM_CAPACITY = 1440
+DRAIN_WINDOW = 15 * 60
+MIN_DRAIN_SAMPLES = 6
+
+
+class TelemetrySeries:
+    def __init__(self, capacity):
+        self.timestamps = RingBuffer(capacity)
+        self.battery = RingBuffer(capacity, 'f')
+        self.temperature = RingBuffer(capacity, 'f')
+        self.charging = RingBuffer(capacity, 'b')
+
+    def append(self, timestamp, battery, temperature, charging):
+        self.timestamps.append(timestamp)
+        self.battery.append(battery)
+        self.temperature.append(temperature)
+        self.charging.append(charging)
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def span(self):
+        timestamps = self.timestamps.values()
+        return timestamps[-1] - timestamps[0] if timestamps else 0
+
+
+class TelemetryHistory:
+    # Memory per device is fixed by the two capacities, however long the companion runs
+    def __init__(self):
+        self.raw = TelemetrySeries(RAW_CAPACITY)
+        self.long_term = TelemetrySeries(LONG_TERM_CAPACITY)
+        self._pending = []
+        self._pending_bucket = None
+
+    def add(self, battery, temperature, charging, timestamp=None):
+        timestamp = time.time() if timestamp is None else timestamp
+        temperature = float('nan') if temperature is None else temperature
+        self.raw.append(timestamp, battery, temperature, charging)
+        bucket = timestamp // BUCKET_SECONDS * BUCKET_SECONDS
+        if self._pending and bucket != self._pending_bucket:
+            self._flush()
+        self._pending_bucket = bucket
+        self._pending.append((battery, temperature, charging))
+
+    def _flush(self):
+        # The finished bucket becomes one long-term sample stamped with the start of its minute
+        count = len(self._pending)
+        self.long_term.append(
+            self._pending_bucket,
+            sum(sample[0] for sample in self._pending) / count,
+            sum(sample[1] for sample in self._pending) / count,
+            any(sample[2] for sample in self._pending))
+        self._pending = []
+
+    def add_device_info(self, device_info):
+        try:
+            battery = float(device_info['Battery Level'])
+        except (KeyError, TypeError, ValueError):
+            return
+        charging = device_info.get('Charging Status') in ('Charging', 'Full')
+        self.add(battery, device_info.get('Temperature'), charging)
+
+    def drain_rate(self, window=DRAIN_WINDOW):
+        # Least-squares slope of the battery level while discharging, in percent per hour
+        timestamps = self.raw.timestamps.values()
+        battery = self.raw.battery.values()
+        charging = self.raw.charging.values()
+        now = timestamps[-1] if timestamps else 0
+        points = []
+        for index in range(len(timestamps) - 1, -1, -1):
+            if charging[index] or now - timestamps[index] > window:
+                break
+            points.append((timestamps[index], battery[index]))
+        if len(points) < MIN_DRAIN_SAMPLES:
+            return None
+        mean_t = sum(t for t, _ in points) / len(points)
+        mean_b = sum(b for _, b in points) / len(points)
+        variance = sum((t - mean_t) ** 2 for t, _ in points)
+        if variance == 0:
+            return None
+        slope = sum((t - mean_t) * (b - mean_b) for t, b in points) / variance
+        return -slope * 3600
+
+    def time_remaining(self):
+        # Seconds until empty at the current drain rate, or None when not draining
+        rate = self.drain_rate()
+        if not rate or rate <= 0:
+            return None
+        return self.raw.battery.last() / rate * 3600
+
+    def battery_values(self, long_term=False):
+        series = self.long_term if long_term else self.raw
+        return series.battery.values()
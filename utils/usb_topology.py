@@ -0,0 +1,129 @@
+import threading
+import time
+from contextlib import contextmanager
+
+from utils.adb_command import check_output_adb
+
+# Concurrent transfers allowed behind one upstream port before measurements say otherwise
+INITIAL_GROUP_LIMIT = 2
+MAX_GROUP_LIMIT = 8
+# Aggregate throughput has to improve by this much for another parallel transfer to be worth it
+SPEEDUP_THRESHOLD = 1.15
+EWMA_WEIGHT = 0.5
+
+
+def parse_usb_paths(output):
+    # `adb devices -l` -> {serial: '1-1.2'}; Wi-Fi transports have no usb: field
+    paths = {}
+    for line in output.splitlines()[1:]:
+        fields = line.split()
+        for field in fields[2:]:
+            if field.startswith('usb:'):
+                paths[fields[0]] = field[len('usb:'):]
+    return paths
+
+
+def upstream_port(usb_path):
+    # '1-1.2' sits behind hub port '1-1'; '1-1' hangs directly off bus 1's root hub
+    if '.' in usb_path:
+        return usb_path.rsplit('.', 1)[0]
+    return usb_path.split('-', 1)[0]
+
+
+class UsbTopology:
+    # Maps headsets to the upstream USB port they share with their neighbours
+    def __init__(self):
+        # serial -> (adb server, usb path); every server is a different PC with its own bus numbering
+        self.paths = {}
+        self.lock = threading.Lock()
+
+    def refresh(self, server=None):
+        paths = {serial: (server, path) for serial, path in
+                 parse_usb_paths(check_output_adb(['devices', '-l'], server=server, text=True)).items()}
+        with self.lock:
+            self.paths = {serial: entry for serial, entry in self.paths.items() if entry[0] != server}
+            self.paths.update(paths)
+
+    def group(self, serial):
+        # 'usb:1-1' for hub-attached headsets ('usb:host:port/1-1' behind another adb server),
+        # None for Wi-Fi or not yet seen transports
+        with self.lock:
+            server, path = self.paths.get(serial, (None, None))
+        if not path:
+            return None
+        if server is None:
+            return f'usb:{upstream_port(path)}'
+        return f'usb:{server}/{upstream_port(path)}'
+
+
+class TransferThrottle:
+    # Per-group limit on concurrent transfers, tuned by hill climbing on measured aggregate throughput:
+    # one more parallel transfer is allowed while it still speeds the group up, one less once it does not.
+    def __init__(self, initial=INITIAL_GROUP_LIMIT, maximum=MAX_GROUP_LIMIT):
+        self.initial = initial
+        self.maximum = maximum
+        self.limits = {}
+        self.running = {}
+        # group -> (time, integral of running transfers over time up to it), for average concurrency
+        self.load = {}
+        # group -> {concurrency: smoothed aggregate bytes per second}
+        self.throughput = {}
+        self.lock = threading.Lock()
+
+    def limit(self, group):
+        if group is None:
+            return None
+        with self.lock:
+            return self.limits.get(group, self.initial)
+
+    @contextmanager
+    def measure(self, group, size):
+        if group is None:
+            yield
+            return
+        with self.lock:
+            start, start_load = self._advance(group, 1)
+        try:
+            yield
+        finally:
+            with self.lock:
+                end, end_load = self._advance(group, -1)
+            seconds = end - start
+            if size and seconds > 0:
+                concurrency = (end_load - start_load) / seconds
+                self.record(group, size / seconds * concurrency, max(1, round(concurrency)))
+
+    def _advance(self, group, change):
+        # Called with the lock held
+        now = time.monotonic()
+        changed, load = self.load.get(group, (now, 0.0))
+        load += self.running.get(group, 0) * (now - changed)
+        self.load[group] = (now, load)
+        self.running[group] = self.running.get(group, 0) + change
+        return now, load
+
+    def record(self, group, aggregate, concurrency):
+        with self.lock:
+            samples = self.throughput.setdefault(group, {})
+            previous = samples.get(concurrency)
+            samples[concurrency] = aggregate if previous is None else (
+                EWMA_WEIGHT * aggregate + (1 - EWMA_WEIGHT) * previous)
+            limit = self.limits.get(group, self.initial)
+            current = samples.get(limit)
+            if current is None:
+                return
+            lower = [level for level in samples if level < limit]
+            if not lower:
+                # Nothing to compare with yet: probe one step further
+                if limit < self.maximum:
+                    self.limits[group] = limit + 1
+                return
+            fewer = samples[max(lower)]
+            if current >= fewer * SPEEDUP_THRESHOLD and limit < self.maximum:
+                self.limits[group] = limit + 1
+            elif current < fewer and limit > 1:
+                self.limits[group] = limit - 1
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.limits)
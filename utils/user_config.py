@@ -0,0 +1,75 @@
+import os
+import threading
+import yaml
+
+from utils.adb import is_ip_value
+
+CONFIG_DIR = os.path.join(os.path.expanduser("~"), ".config", "ALVR-Companion")
+CONFIG_FILE = os.path.join(CONFIG_DIR, "config.yaml")
+
+
+class UserConfig:
+    # Per-headset settings, keyed by the USB serial; Wi-Fi serials resolve through 'wifi_serial'.
+    # Shared by the UI and core worker threads, so every access holds the lock.
+    def __init__(self, path=CONFIG_FILE):
+        self.path = path
+        self.lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        data = {}
+        if os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = yaml.safe_load(f) or {}
+        with self.lock:
+            self.data = data
+
+    def save(self):
+        with self.lock:
+            self._save()
+
+    def _save(self):
+        # Called with the lock held. Written next to the config and renamed over it, so a crash or a full
+        # disk never leaves a truncated file behind
+        tmp_path = f'{self.path}.{os.getpid()}.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                yaml.dump(self.data, f)
+            os.replace(tmp_path, self.path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def devices(self):
+        # A copy, so callers can iterate while other threads change settings
+        with self.lock:
+            return {serial: dict(device_config) for serial, device_config in self.data.get('devices', {}).items()}
+
+    def get_device_unique_id(self, serial):
+        with self.lock:
+            return self._unique_id(serial)
+
+    def _unique_id(self, serial):
+        # Called with the lock held
+        if not is_ip_value(serial):
+            return serial
+        for device_serial, device_config in self.data.get('devices', {}).items():
+            if device_config.get('wifi_serial') == serial:
+                return device_serial
+        return None
+
+    def get(self, device_serial, key, fallback=False):
+        with self.lock:
+            unique_id = self._unique_id(device_serial)
+            return self.data.get('devices', {}).get(unique_id, {}).get(key, fallback)
+
+    def set(self, device_serial, key, value):
+        with self.lock:
+            unique_id = self._unique_id(device_serial)
+            if unique_id is None:
+                return False
+            device_config = self.data.setdefault('devices', {}).setdefault(unique_id, {})
+            device_config[key] = value
+            self._save()
+        return True
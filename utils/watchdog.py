@@ -0,0 +1,137 @@
+import functools
+import os
+import sys
+import threading
+import time
+import traceback
+
+FRAME_BUDGET = 0.016
+STACK_DEPTH = 12
+
+
+def watchdog_from_env():
+    # ALVR_COMPANION_WATCHDOG=1 enables it with the default budget; a number sets the budget in ms
+    value = os.environ.get('ALVR_COMPANION_WATCHDOG')
+    if not value:
+        return None
+    try:
+        budget = float(value) / 1000 if float(value) > 1 else FRAME_BUDGET
+    except ValueError:
+        budget = FRAME_BUDGET
+    return StallWatchdog(budget)
+
+
+def callback_name(callback):
+    callback = getattr(callback, 'func', callback)  # functools.partial
+    owner = getattr(callback, '__self__', None)
+    name = getattr(callback, '__qualname__', None) or repr(callback)
+    if owner is not None and '.' not in name:
+        name = f'{type(owner).__name__}.{name}'
+    return name
+
+
+class CallbackStats:
+    def __init__(self):
+        self.calls = 0
+        self.stalls = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.stack = None
+
+
+class StallWatchdog:
+    # Times main-loop callbacks; a sampler thread grabs the main thread's stack while one overruns
+    def __init__(self, budget=FRAME_BUDGET):
+        self.budget = budget
+        self.stats = {}
+        self.lock = threading.Lock()
+        self.main_thread_id = threading.main_thread().ident
+        self.current = None
+        self.current_stack = None
+        threading.Thread(target=self._sample, daemon=True).start()
+
+    def _sample(self):
+        while True:
+            time.sleep(self.budget)
+            current = self.current
+            if current is None or self.current_stack is not None:
+                continue
+            name, started = current
+            if time.perf_counter() - started > self.budget:
+                frame = sys._current_frames().get(self.main_thread_id)
+                if frame is not None and self.current is current:
+                    self.current_stack = ''.join(traceback.format_stack(frame, STACK_DEPTH))
+
+    def wrap(self, callback):
+        name = callback_name(callback)
+
+        @functools.wraps(callback)
+        def watched(*args, **kwargs):
+            if threading.get_ident() != self.main_thread_id or self.current is not None:
+                # Only outermost main-thread callbacks are attributed
+                return callback(*args, **kwargs)
+            started = time.perf_counter()
+            self.current = (name, started)
+            self.current_stack = None
+            try:
+                return callback(*args, **kwargs)
+            finally:
+                duration = time.perf_counter() - started
+                self.current = None
+                self._record(name, duration, self.current_stack)
+
+        return watched
+
+    def _record(self, name, duration, stack):
+        with self.lock:
+            stats = self.stats.get(name)
+            if stats is None:
+                stats = self.stats[name] = CallbackStats()
+            stats.calls += 1
+            stats.total_seconds += duration
+            stats.max_seconds = max(stats.max_seconds, duration)
+            if duration > self.budget:
+                stats.stalls += 1
+                if stack:
+                    stats.stack = stack
+        if duration > self.budget:
+            print(f"Main loop stall: {duration * 1000:.0f} ms in {name}")
+
+    def report(self):
+        with self.lock:
+            return sorted(({
+                'callback': name,
+                'calls': stats.calls,
+                'stalls': stats.stalls,
+                'total_ms': round(stats.total_seconds * 1000, 1),
+                'max_ms': round(stats.max_seconds * 1000, 1),
+                'stack': stats.stack,
+            } for name, stats in self.stats.items()), key=lambda entry: -entry['max_ms'])
+
+    def format_report(self):
+        lines = [f"Frame budget: {self.budget * 1000:.0f} ms"]
+        for entry in self.report():
+            lines.append(f"{entry['callback']}: {entry['calls']} calls, {entry['stalls']} stalls, "
+                         f"max {entry['max_ms']} ms, total {entry['total_ms']} ms")
+            if entry['stack']:
+                lines.append('    ' + entry['stack'].rstrip().replace('\n', '\n    '))
+        return '\n'.join(lines)
+
+
+def watch_glib(glib, watchdog):
+    # Wrap every callback handed to GLib's timeout and idle sources
+    def patch(name):
+        original = getattr(glib, name)
+
+        def add_source(*args, **kwargs):
+            args = list(args)
+            for index, arg in enumerate(args):
+                if callable(arg):
+                    args[index] = watchdog.wrap(arg)
+                    break
+            return original(*args, **kwargs)
+
+        setattr(glib, name, add_source)
+
+    for name in ('timeout_add', 'timeout_add_seconds', 'idle_add'):
+        patch(name)
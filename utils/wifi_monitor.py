@@ -0,0 +1,85 @@
+import re
+import threading
+
+from utils.adb_shell import AdbShellError, get_shell
+
+SAMPLE_INTERVAL = 5
+WIFI_QUERY = 'dumpsys wifi | grep -m 1 mWifiInfo; cat /proc/net/wireless'
+
+RSSI_PATTERN = re.compile(r'RSSI: (-?\d+)')
+LINK_SPEED_PATTERN = re.compile(r'(?<!Tx )(?<!Rx )Link speed: (\d+)Mbps')
+FREQUENCY_PATTERN = re.compile(r'Frequency: (\d+)MHz')
+PROC_WIRELESS_PATTERN = re.compile(r'^\s*wlan\d+:\s+\S+\s+(-?\d+)\.?\s+(-?\d+)\.?', re.MULTILINE)
+
+# Below these an ALVR stream over Wi-Fi is likely to stutter
+MIN_RSSI = -67
+MIN_LINK_SPEED = 300
+
+
+def frequency_band(frequency):
+    if frequency is None:
+        return None
+    if frequency < 3000:
+        return '2.4 GHz'
+    if frequency < 5925:
+        return '5 GHz'
+    return '6 GHz'
+
+
+def parse_wifi_sample(output):
+    sample = {'rssi': None, 'link_speed': None, 'frequency': None}
+    match = RSSI_PATTERN.search(output)
+    if match:
+        sample['rssi'] = int(match.group(1))
+    match = LINK_SPEED_PATTERN.search(output)
+    if match:
+        sample['link_speed'] = int(match.group(1))
+    match = FREQUENCY_PATTERN.search(output)
+    if match:
+        sample['frequency'] = int(match.group(1))
+    if sample['rssi'] is None:
+        # /proc/net/wireless: "wlan0: 0000   60.  -50.  -256 ..." (link quality, signal level)
+        match = PROC_WIRELESS_PATTERN.search(output)
+        if match:
+            sample['rssi'] = int(match.group(2))
+    sample['band'] = frequency_band(sample['frequency'])
+    return sample
+
+
+def link_warnings(sample):
+    warnings = []
+    if sample['rssi'] is not None and sample['rssi'] < MIN_RSSI:
+        warnings.append('weak_signal')
+    if sample['link_speed'] is not None and sample['link_speed'] < MIN_LINK_SPEED:
+        warnings.append('slow_link')
+    if sample['band'] == '2.4 GHz':
+        warnings.append('band_2_4ghz')
+    return warnings
+
+
+class WifiMonitor:
+    # Samples the headset's Wi-Fi link through the device's persistent adb shell
+    def __init__(self, device_serial, on_sample, interval=SAMPLE_INTERVAL):
+        self.device_serial = device_serial
+        self.on_sample = on_sample
+        self.interval = interval
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while not self.stop_event.is_set():
+            try:
+                output, _ = get_shell(self.device_serial).run(WIFI_QUERY)
+                sample = parse_wifi_sample(output)
+                sample['warnings'] = link_warnings(sample)
+                self.on_sample(self.device_serial, sample)
+            except AdbShellError as e:
+                print(f"Wi-Fi Monitor: {e}")
+            self.stop_event.wait(self.interval)
+
+    def stop(self):
+        self.stop_event.set()
@@ -0,0 +1,54 @@
+import os
+
+import gi
+
+gi.require_version('Gtk', '4.0')
+
+from gi.repository import Gtk
+
+from utils.metrics import format_metrics
+
+
+def create_debug_window(parent, metrics, export_dir, on_message, watchdog=None):
+    window = Gtk.Window(title="Debug: adb metrics")
+    window.set_transient_for(parent)
+    window.set_default_size(820, 420)
+
+    text_view = Gtk.TextView(editable=False, monospace=True)
+    scrolled = Gtk.ScrolledWindow(vexpand=True)
+    scrolled.set_child(text_view)
+
+    def refresh(_button=None):
+        text = format_metrics(metrics)
+        if watchdog is not None:
+            text += '\n\n' + watchdog.format_report()
+        text_view.get_buffer().set_text(text)
+
+    def export(_button, filename, content):
+        path = os.path.join(export_dir, filename)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(content())
+        on_message(f"Metrics exported to {path}")
+
+    refresh_button = Gtk.Button(label="Refresh")
+    refresh_button.connect('clicked', refresh)
+    json_button = Gtk.Button(label="Export JSON")
+    json_button.connect('clicked', export, 'metrics.json', metrics.to_json)
+    prometheus_button = Gtk.Button(label="Export Prometheus")
+    prometheus_button.connect('clicked', export, 'metrics.prom', metrics.to_prometheus)
+
+    buttons = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=10)
+    buttons.append(refresh_button)
+    buttons.append(json_button)
+    buttons.append(prometheus_button)
+
+    box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=10)
+    box.set_margin_top(10)
+    box.set_margin_bottom(10)
+    box.set_margin_start(10)
+    box.set_margin_end(10)
+    box.append(scrolled)
+    box.append(buttons)
+    window.set_child(box)
+    refresh()
+    return window
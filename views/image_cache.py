@@ -0,0 +1,36 @@
+import gi
+
+gi.require_version('Gtk', '4.0')
+gi.require_version('GdkPixbuf', '2.0')
+
+from gi.repository import Gdk, GdkPixbuf, Gtk
+
+SIDEBAR_ICON_SIZE = 32
+PAGE_ICON_SIZE = 128
+FALLBACK_IMAGE = './assets/unknown.png'
+
+_textures = {}
+
+def get_device_texture(image_path, size):
+    # Each (image, size) pair is decoded and scaled once, then shared by every widget
+    key = (image_path, size)
+    if key not in _textures:
+        try:
+            pixbuf = GdkPixbuf.Pixbuf.new_from_file_at_scale(image_path, size, size, True)
+        except Exception as e:
+            print(f"Image Cache: Error loading {image_path}: {e}")
+            # Failures are cached under the requested path as well, so a broken image is not decoded again
+            # on every refresh
+            if image_path == FALLBACK_IMAGE:
+                texture = None
+            else:
+                texture = get_device_texture(FALLBACK_IMAGE, size)
+        else:
+            texture = Gdk.Texture.new_for_pixbuf(pixbuf)
+        _textures[key] = texture
+    return _textures[key]
+
+def create_device_image(image_path, size):
+    image = Gtk.Image.new_from_paintable(get_device_texture(image_path, size))
+    image.set_pixel_size(size)
+    return image
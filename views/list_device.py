@@ -1,27 +1,47 @@
-import re
 import gi
 
 gi.require_version('Gtk', '4.0')
 gi.require_version('Adw', '1')
 
-from gi.repository import Gtk, Adw
+from gi.repository import Adw, GObject
 
-def is_ip_value(value):
-    ip_pattern = re.compile(r'^\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}:\d+$')
-    return ip_pattern.match(value)
+from views.image_cache import SIDEBAR_ICON_SIZE, create_device_image, get_device_texture
 
-def create_list_device(name, version, image_path, is_wifi):
-    action_row = Adw.ActionRow()
-    action_row.set_title(name)
 
-    if is_wifi:
-        version = f"WiFi: {version}"
-    else:
-        version = f"USB: {version}"
-    action_row.set_subtitle(version)
+class DeviceItem(GObject.Object):
+    __gtype_name__ = 'AlvrCompanionDeviceItem'
+
+    serial = GObject.Property(type=str, default='')
+    title = GObject.Property(type=str, default='')
+    subtitle = GObject.Property(type=str, default='')
+    image_path = GObject.Property(type=str, default='')
+
+    def __init__(self, serial, name, version, image_path, is_wifi):
+        super().__init__(serial=serial)
+        self.update(name, version, image_path, is_wifi)
+
+    def update(self, name, version, image_path, is_wifi):
+        # Only touch properties that actually changed so bound rows don't redraw
+        subtitle = f"WiFi: {version}" if is_wifi else f"USB: {version}"
+        if self.title != name:
+            self.title = name
+        if self.subtitle != subtitle:
+            self.subtitle = subtitle
+        if self.image_path != image_path:
+            self.image_path = image_path
+
+
+def create_list_device(item):
+    action_row = Adw.ActionRow()
+    action_row.set_name(item.serial)
+    item.bind_property('title', action_row, 'title', GObject.BindingFlags.SYNC_CREATE)
+    item.bind_property('subtitle', action_row, 'subtitle', GObject.BindingFlags.SYNC_CREATE)
 
-    image = Gtk.Image.new_from_file(image_path)
-    image.set_pixel_size(32)
+    image = create_device_image(item.image_path, SIDEBAR_ICON_SIZE)
+    # A binding rather than a notify handler: it goes away with the row instead of piling up on the item
+    # each time bind_model recreates the row
+    item.bind_property('image-path', image, 'paintable', GObject.BindingFlags.DEFAULT,
+                       lambda _binding, image_path: get_device_texture(image_path, SIDEBAR_ICON_SIZE))
     action_row.add_prefix(image)
 
     return action_row
@@ -0,0 +1,38 @@
+import gi
+
+gi.require_version('Gtk', '4.0')
+
+from gi.repository import Gtk
+
+
+class Sparkline(Gtk.DrawingArea):
+    def __init__(self, width=160, height=28, minimum=0, maximum=100):
+        super().__init__()
+        self.values = []
+        self.minimum = minimum
+        self.maximum = maximum
+        self.set_content_width(width)
+        self.set_content_height(height)
+        self.set_draw_func(self.on_draw)
+
+    def set_values(self, values):
+        if values != self.values:
+            self.values = values
+            self.queue_draw()
+
+    def on_draw(self, area, cr, width, height):
+        if len(self.values) < 2:
+            return
+        color = self.get_color()
+        cr.set_source_rgba(color.red, color.green, color.blue, 0.8)
+        cr.set_line_width(1.5)
+        span = (self.maximum - self.minimum) or 1
+        step = width / (len(self.values) - 1)
+        for index, value in enumerate(self.values):
+            x = index * step
+            y = height - (value - self.minimum) / span * (height - 2) - 1
+            if index == 0:
+                cr.move_to(x, y)
+            else:
+                cr.line_to(x, y)
+        cr.stroke()